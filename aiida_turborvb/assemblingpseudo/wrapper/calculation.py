@@ -5,6 +5,7 @@
 from aiida.common import datastructures
 from aiida.engine import CalcJob
 from aiida.orm import SinglefileData, Dict, Str, StructureData
+from aiida_turborvb.auxiliary.submission import stage_inputs
 
 class TurboRVBAssemblingpseudoCalculationWRP(CalcJob):
     """
@@ -45,10 +46,6 @@ class TurboRVBAssemblingpseudoCalculationWRP(CalcJob):
 
         pseudo = self.inputs.parameters.get_dict()["pseudo"]
 
-        with folder.open("fort.10", "w") as fhandle_out, \
-             self.inputs.fort10.open() as fhandle_in:
-            fhandle_out.write(fhandle_in.read())
-
         with folder.open(self.options.input_filename, "w") as fhandle:
             content = []
             content.append(f'echo {pseudo} | assembling_pseudo.x')
@@ -63,6 +60,7 @@ class TurboRVBAssemblingpseudoCalculationWRP(CalcJob):
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
+        calcinfo.local_copy_list = stage_inputs(self.inputs, (("fort10", "fort.10"), ))
 
         calcinfo.retrieve_list = ["pseudo.dat",
                                   self.options.output_filename]
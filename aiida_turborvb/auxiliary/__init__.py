@@ -1,3 +1,7 @@
 from .copy_helper import copy_between_nodes
 from .copy_helper import copy_to_file
+from .copy_helper import copy_tree
+from .copy_helper import remote_copy_entries
 from .namelist_holder import NamelistHolder
+from .fort12 import Fort12Reader
+from .fort10 import read_fort10_header
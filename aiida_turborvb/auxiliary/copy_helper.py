@@ -1,49 +1,118 @@
 import os
 import re
+import time
 import shutil
+import tempfile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from aiida.orm import Node
 from aiida.repository import FileType
 
+#: Buffer used for copying single files
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+def list_tree(name: str,
+              source: str,
+              node: Node,
+              exclude=None):
+    """
+    List all files under ``name`` with a single walk through the repository
+
+    :param exclude: regular expression (string or compiled) matched against
+        the path relative to ``source``, matching directories are skipped whole
+    :returns: list of file paths relative to ``source``
+    """
+    if isinstance(exclude, str):
+        exclude = re.compile(exclude)
+
+    files = []
+    stack = [(name, node.get_object(f"{source}/{name}").file_type)]
+    while stack:
+        current, file_type = stack.pop()
+        if exclude is not None and exclude.match(current):
+            continue
+        if file_type == FileType.DIRECTORY:
+            for sub_obj in node.list_objects(f"{source}/{current}"):
+                stack.append((os.path.join(current, sub_obj.name), sub_obj.file_type))
+        else:
+            files.append(current)
+    return files
+
+def _copy_one(name: str, source: str, node: Node, dst: Path, buffer_size: int):
+    frepo_path = dst / name
+    frepo_path.parent.mkdir(exist_ok=True, parents=True)
+    with node.open(f"{source}/{name}", mode='rb') as fsource, \
+         open(frepo_path, 'wb') as fdst:
+        shutil.copyfileobj(fsource, fdst, buffer_size)
+    return frepo_path.stat().st_size
+
+def copy_tree(name: str,
+              source: str,
+              node: Node,
+              dst,
+              exclude=None,
+              max_workers: int = 8,
+              buffer_size: int = COPY_BUFFER_SIZE):
+    """
+    Copy file or directory ``name`` from repository of ``node`` to ``dst``
+
+    The tree is listed once, then files are copied concurrently by a bounded
+    thread pool. If ``dst`` is a node, files are first copied to a temporary
+    directory and put into the node at once, as the node repository itself
+    is not safe for concurrent writes.
+
+    :param dst: destination node or directory
+    :returns: dictionary with number of ``files``, ``bytes``, elapsed
+        ``seconds`` and ``throughput`` in bytes per second
+    """
+    start = time.perf_counter()
+    files = list_tree(name, source, node, exclude=exclude)
+
+    def copy_all(target: Path):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            sizes = executor.map(lambda x: _copy_one(x, source, node, target, buffer_size), files)
+            return sum(sizes)
+
+    if isinstance(dst, Node):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            nbytes = copy_all(Path(tmpdir))
+            if files:
+                dst.put_object_from_tree(tmpdir)
+    else:
+        nbytes = copy_all(Path(dst))
+
+    seconds = time.perf_counter() - start
+    return { "files"      : len(files),
+             "bytes"      : nbytes,
+             "seconds"    : seconds,
+             "throughput" : nbytes / seconds if seconds > 0 else 0.0 }
+
 def copy_between_nodes(name: str,
                        source: str,
                        node: Node,
                        dst: Node,
                        exclude=None):
-
-    # For check the regex the first thing because this function will be called recursively
-    if exclude and re.match(exclude, name):
-        return
-    obj = node.get_object(f"{source}/{name}")
-    # If it is a directory, copy the contents one by one
-    if obj.file_type == FileType.DIRECTORY:
-        for sub_obj in node.list_objects(f"{source}/{name}"):
-            copy_between_nodes(os.path.join(f"{name}", sub_obj.name), source, node, dst, exclude=exclude)
-    else:
-        # It is a file
-        with node.open(f"{source}/{name}", mode='rb') as fsource:
-            # Write the file
-            dst.put_object_from_filelike(fsource, str(name), mode = "wb")
+    """
+    Copy file or directory ``name`` between repositories of two nodes
+    """
+    return copy_tree(name, source, node, dst, exclude=exclude)
 
 def copy_to_file(name: str,
                  source: str,
                  node: Node,
                  dst: Path,
                  exclude=None):
-    # For check the regex the first thing because this function will be called recursively
-    if exclude and re.match(exclude, name):
-        return
-    obj = node.get_object(f"{source}/{name}")
-    # If it is a directory, copy the contents one by one
-    if obj.file_type == FileType.DIRECTORY:
-        for sub_obj in node.list_objects(f"{source}/{name}"):
-            copy_to_file(os.path.join(f"{name}", sub_obj.name), source, node, dst, exclude=exclude)
-    else:
-        # It is a file
-        with node.open(f"{source}/{name}", mode='rb') as fsource:
-            # Make parent directory if needed
-            frepo_path = dst / name
-            Path(frepo_path.parent).mkdir(exist_ok=True, parents=True)
-            # Write the file
-            with open(frepo_path, 'wb') as fdst:
-                shutil.copyfileobj(fsource, fdst)
+    """
+    Copy file or directory ``name`` from repository of node to a directory
+    """
+    return copy_tree(name, source, node, Path(dst), exclude=exclude)
+
+def remote_copy_entries(parent: Node, files):
+    """
+    Entries of remote_copy_list/remote_symlink_list from a RemoteData
+
+    :param parent: RemoteData of the previous calculation
+    :param files: iterable of pairs (name in parent folder, destination name)
+    """
+    remote_path = parent.get_remote_path()
+    return [ (parent.computer.uuid, os.path.join(remote_path, src), dst) for src, dst in files ]
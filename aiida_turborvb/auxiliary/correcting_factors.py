@@ -0,0 +1,81 @@
+"""
+Projection (correcting) factor analysis of LRDMC runs.
+
+With ``p`` correcting factors the energy of a LRDMC generation ``i``
+enters the average with the weight ``w_i * G_i``, where ``w_i`` is its own
+weight and ``G_i = w_{i-1} * ... * w_{i-p}`` the product of the ``p``
+previous ones (``G_i = 1`` for ``p = 0``). The products are evaluated for
+all ``p`` at once as differences of the cumulative sum of ``log(w)``.
+"""
+from typing import ( Optional, Sequence, Union )
+import numpy as np
+from .reblocking import ( reblock, find_plateau )
+
+def correcting_factor_analysis(energy: np.ndarray,
+                               weights: np.ndarray,
+                               factors: Union[int, Sequence[int]],
+                               eq: int = 0,
+                               reb: Optional[int] = None,
+                               chunk_size: int = 8):
+    """
+    Weighted energy and its reblocked error for many correcting factors
+
+    All factors use the same generations, the first ``max(factors)`` ones
+    after equilibration are skipped as they lack the full history. The
+    same generations are used by :func:`reblocking.analyse` with
+    ``eq + max(factors)`` and the same ``reb``.
+
+    :param energy: local energy of each generation
+    :param weights: weight of each generation, all positive after ``eq``
+    :param factors: maximal number of correcting factors (``0..factors``)
+        or explicit list of them
+    :param eq: number of generations discarded as equilibration
+    :param reb: bin length, if ``None`` it is determined by ``find_plateau``
+    :param chunk_size: number of factors evaluated together, limits memory
+    :returns: dictionary of arrays ``factors``, ``energy`` and ``energy_err``
+    """
+    if isinstance(factors, (int, np.integer)):
+        factors = np.arange(int(factors) + 1)
+    factors = np.unique(np.asarray(factors, dtype=int))
+    energy = np.asarray(energy, dtype=float)[eq:]
+    weights = np.asarray(weights, dtype=float)[eq:]
+    pmax = int(factors[-1])
+    # log(w) of zero weights would turn the products into NaN
+    if np.any(weights <= 0.0):
+        raise ValueError("Correcting factors need positive weights of all generations after eq")
+
+    cum = np.concatenate(([0.0], np.cumsum(np.log(weights))))
+    index = np.arange(pmax, energy.shape[0])
+    if reb is None:
+        stats = reblock(energy[index], weights[index])
+        reb = int(stats["block_size"][find_plateau(stats, index.shape[0])])
+    nbins = index.shape[0] // reb
+    if nbins < 2:
+        raise ValueError(f"Bin length {reb} leaves less than two bins")
+    index = index[index.shape[0] - nbins * reb:]
+    ene = energy[index].reshape(nbins, reb)
+
+    ret_energy = np.zeros(factors.shape[0])
+    ret_error = np.zeros(factors.shape[0])
+    for start in range(0, factors.shape[0], chunk_size):
+        p = factors[start:start + chunk_size]
+        # log(G_i) = log(w_{i-1}) + ... + log(w_{i-p})
+        log_g = cum[index][None, :] - cum[index[None, :] - p[:, None]]
+        log_g -= log_g.max(axis=1, keepdims=True)
+        g = (np.exp(log_g) * weights[index]).reshape(p.shape[0], nbins, reb)
+
+        bin_w = g.sum(axis=2)
+        bin_we = (g * ene).sum(axis=2)
+        total_w = bin_w.sum(axis=1, keepdims=True)
+        total_we = bin_we.sum(axis=1, keepdims=True)
+        jk = (total_we - bin_we) / (total_w - bin_w)
+
+        ret_energy[start:start + chunk_size] = total_we[:, 0] / total_w[:, 0]
+        ret_error[start:start + chunk_size] = np.sqrt((nbins - 1) / nbins \
+                * np.sum((jk - jk.mean(axis=1, keepdims=True))**2, axis=1))
+
+    return { "factors"    : factors,
+             "energy"     : ret_energy,
+             "energy_err" : ret_error,
+             "eq"         : eq,
+             "reb"        : reb }
@@ -0,0 +1,36 @@
+"""
+Header of ``fort.10``, the wavefunction file of TurboRVB.
+
+The file starts with pairs of a comment line and a line of integers::
+
+     # Nelup  #Nel  # Ion
+              16          32           8
+     # Shell Det.   # Shell Jas.
+              64          32
+
+Only the size of the system is read, the rest of the file is not touched.
+"""
+from collections import namedtuple
+
+Fort10Header = namedtuple("Fort10Header", ("nelup", "nel", "nion", "nshell_det", "nshell_jas"))
+
+def read_fort10_header(handle):
+    """
+    Number of electrons, ions and basis shells from the first lines of ``fort.10``
+
+    :param handle: text or binary file handle
+    :returns: :class:`Fort10Header`
+    """
+    values = []
+    for line in handle:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.strip().startswith("#") or not line.strip():
+            continue
+        values.append([ int(x) for x in line.split()[:3] ])
+        if len(values) == 2:
+            break
+    if len(values) < 2 or len(values[0]) < 3 or len(values[1]) < 2:
+        raise ValueError("fort.10 header is incomplete")
+    (nelup, nel, nion), (nshell_det, nshell_jas) = values[0][:3], values[1][:2]
+    return Fort10Header(nelup, nel, nion, nshell_det, nshell_jas)
@@ -0,0 +1,258 @@
+"""
+Access to ``fort.12``, the per-block statistics written by TurboRVB.
+
+``fort.12`` is a Fortran unformatted sequential file, every record
+holds one block of the simulation as a row of double precision numbers.
+The file can grow to many gigabytes, therefore it is memory-mapped and
+never read as a whole.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from .reblocking import analyse
+from .correcting_factors import correcting_factor_analysis
+
+#: Meaning of the leading columns of ``fort.12`` for the different run types
+COLUMNS = { "vmc"   : ("weight", "energy", "energy_square"),
+            "lrdmc" : ("weight", "energy", "energy_square") }
+
+class Fort12Reader:
+    """
+    Memory-mapped reader of Fortran unformatted sequential records
+
+    If all records have the same length, which is the case of ``fort.12``,
+    the whole file is viewed as a structured array and columns are returned
+    as zero-copy views of the mapping. Otherwise the record markers are
+    walked lazily by :meth:`iter_records`.
+    """
+
+    def __init__(self, source, marker_size: int = 4, kind: str = "vmc", columns=None):
+        """
+        :param source: path or binary file handle, handles without
+            a file descriptor are spooled to a temporary file first
+        :param marker_size: size of Fortran record markers in bytes
+        :param kind: run type used to name the columns, see ``COLUMNS``
+        :param columns: explicit names of the leading columns
+        """
+        self.marker = np.dtype(f"<i{marker_size}")
+        self.columns = tuple(columns) if columns is not None else COLUMNS[kind]
+        self._tmpfile = None
+
+        if not isinstance(source, (str, os.PathLike)):
+            try:
+                source.fileno()
+                source = source.name
+            except (AttributeError, OSError, ValueError):
+                self._tmpfile = tempfile.NamedTemporaryFile(suffix=".fort12")
+                shutil.copyfileobj(source, self._tmpfile, 16 * 1024 * 1024)
+                self._tmpfile.flush()
+                source = self._tmpfile.name
+
+        self.path = source
+        self.size = os.path.getsize(source)
+        if self.size == 0:
+            self._raw = np.zeros(0, dtype=np.uint8)
+        else:
+            self._raw = np.memmap(source, dtype=np.uint8, mode="r")
+        self._records = self._map_records()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Release the mapping and the temporary copy if there is any
+        """
+        self._records = None
+        self._raw = None
+        if self._tmpfile is not None:
+            self._tmpfile.close()
+            self._tmpfile = None
+
+    def _reclen(self, offset: int):
+        return int(self._raw[offset:offset + self.marker.itemsize].view(self.marker)[0])
+
+    def _map_records(self):
+        """
+        Structured view of the file if all records are equally long
+
+        All head and tail markers are compared with the length of the first
+        record, so records of different lengths that happen to add up to
+        the same size are walked by :meth:`iter_records` instead.
+        """
+        if self.size == 0:
+            return None
+        reclen = self._reclen(0)
+        record = np.dtype([("head", self.marker),
+                           ("data", "<f8", (reclen // 8,)),
+                           ("tail", self.marker)])
+        # A truncated last record, e.g. of a killed run, is ignored
+        nrecords = self.size // record.itemsize
+        if nrecords == 0:
+            return None
+        if self._reclen(nrecords * record.itemsize - self.marker.itemsize) != reclen:
+            return None
+        end = nrecords * record.itemsize
+        if self.size - end >= self.marker.itemsize and self._reclen(end) != reclen:
+            return None
+        records = np.memmap(self.path, dtype=record, mode="r", shape=(nrecords,))
+        if not (np.all(records["head"] == reclen) and np.all(records["tail"] == reclen)):
+            return None
+        return records
+
+    @property
+    def uniform(self):
+        """
+        True if the file is mapped as a structured array
+        """
+        return self._records is not None
+
+    @property
+    def ncolumns(self):
+        if self.size == 0:
+            return 0
+        if self.uniform:
+            return self._records.dtype["data"].shape[0]
+        return self._reclen(0) // 8
+
+    def __len__(self):
+        if self.uniform:
+            return self._records.shape[0]
+        return sum(1 for _ in self._offsets())
+
+    @property
+    def complete(self):
+        """
+        True if the file has records and ends with a complete one
+
+        A file written by a run killed while writing ends with a truncated
+        record or a record whose trailing marker is missing.
+        """
+        if self.size == 0:
+            return False
+        if self.uniform:
+            return self._records.shape[0] * self._records.dtype.itemsize == self.size
+        end = 0
+        for offset, reclen in self._offsets():
+            if self._reclen(offset + reclen) != reclen:
+                return False
+            end = offset + reclen + self.marker.itemsize
+        return end == self.size
+
+    def _offsets(self):
+        offset = 0
+        msize = self.marker.itemsize
+        while offset + msize <= self.size:
+            reclen = self._reclen(offset)
+            # Truncated last record, e.g. of a killed run
+            if offset + reclen + 2 * msize > self.size:
+                return
+            yield offset + msize, reclen
+            offset += reclen + 2 * msize
+
+    def iter_records(self):
+        """
+        Lazily walk the records, yields one 1D array per record
+        """
+        for offset, reclen in self._offsets():
+            yield self._raw[offset:offset + reclen].view("<f8")
+
+    def iter_chunks(self, chunk_size: int = 65536):
+        """
+        Yield consecutive blocks of at most ``chunk_size`` records as 2D arrays
+        """
+        if self.uniform:
+            for start in range(0, self._records.shape[0], chunk_size):
+                yield self._records["data"][start:start + chunk_size]
+            return
+        chunk = []
+        for record in self.iter_records():
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield np.stack(chunk)
+                chunk = []
+        if chunk:
+            yield np.stack(chunk)
+
+    @property
+    def data(self):
+        """
+        2D array of all records, a view of the mapping if possible
+        """
+        if self.uniform:
+            return self._records["data"]
+        chunks = list(self.iter_chunks())
+        if not chunks:
+            return np.zeros((0, self.ncolumns))
+        return np.concatenate(chunks)
+
+    def column(self, key):
+        """
+        One column selected by its name or index
+        """
+        if isinstance(key, str):
+            key = self.columns.index(key)
+        if self.uniform:
+            return self._records["data"][:, key]
+        return np.fromiter((rec[key] for rec in self.iter_records()), dtype=float)
+
+    def get_columns(self):
+        """
+        Dictionary of all named columns present in the file
+        """
+        return { name : self.column(ii) for ii, name in enumerate(self.columns) if ii < self.ncolumns }
+
+def read_fort12(handle, marker_size: int = 4):
+    """
+    Read all records of ``fort.12`` into a 2D array
+
+    :param handle: path or binary file handle
+    :param marker_size: size of Fortran record markers in bytes
+    :returns: array of shape (number of records, number of columns)
+    """
+    with Fort12Reader(handle, marker_size) as reader:
+        return np.array(reader.data)
+
+def get_columns(data: np.ndarray, kind: str = "vmc", columns=None):
+    """
+    Split the array returned by :func:`read_fort12` into named columns
+    """
+    if columns is None:
+        columns = COLUMNS[kind]
+    return { name : data[:, ii] for ii, name in enumerate(columns) if ii < data.shape[1] }
+
+def analyse_fort12(handle,
+                   kind: str = "vmc",
+                   eq: int = 0,
+                   reb=None,
+                   columns=None):
+    """
+    Native post-processing of ``fort.12``, see :func:`reblocking.analyse`
+    """
+    with Fort12Reader(handle, kind=kind, columns=columns) as reader:
+        data = reader.get_columns()
+        return analyse(data["energy"],
+                       weights=data.get("weight"),
+                       energy_square=data.get("energy_square"),
+                       eq=eq,
+                       reb=reb)
+
+def correcting_factors_fort12(handle,
+                              factors,
+                              eq: int = 0,
+                              reb=None,
+                              columns=None):
+    """
+    Correcting factor analysis of LRDMC ``fort.12``,
+    see :func:`correcting_factors.correcting_factor_analysis`
+    """
+    with Fort12Reader(handle, kind="lrdmc", columns=columns) as reader:
+        return correcting_factor_analysis(reader.column("energy"),
+                                          reader.column("weight"),
+                                          factors,
+                                          eq=eq,
+                                          reb=reb)
@@ -0,0 +1,149 @@
+"""
+MPI launcher of the executables in the wrapper job scripts.
+
+The launcher is set by the ``launcher`` dictionary of the ``parameters``
+input, on top of the defaults stored in the ``launcher`` extra of the code::
+
+    code.set_extra("launcher", {"command": "srun", "bind": "cores"})
+
+Keys of the dictionary:
+
+``command``
+    ``mpirun`` (default), ``srun`` or any other launcher taking ``-np``
+``threads``
+    OpenMP threads per MPI process, by default ``num_cores_per_mpiproc``
+    of the resources or 1
+``bind``
+    binding of the processes, ``--bind-to`` of mpirun or ``--cpu-bind``
+    of srun
+``map_by``
+    ``--map-by`` of mpirun, ``slot:PE=<threads>`` for hybrid runs
+``flags``
+    further flags of the launcher
+``environment``
+    further environment variables exported before the runs
+
+Hybrid runs (more than one thread) export ``OMP_NUM_THREADS`` with
+``OMP_PLACES=cores`` and ``OMP_PROC_BIND=close``, unless they are set
+in ``environment``.
+"""
+
+#: Flags of the known launchers: number of processes, threads per process, binding, mapping, hosts
+LAUNCHER_FLAGS = { "mpirun" : ("-np {}", None, "--bind-to {}", "--map-by {}", "--hostfile {}"),
+                   "srun"   : ("-n {}", "--cpus-per-task={}", "--cpu-bind={}", None,
+                               "--nodelist=$(sort -u {} | paste -sd, -)") }
+
+def launcher_settings(calc):
+    """
+    Launcher of a wrapper CalcJob, defaults of the code updated by ``parameters``
+
+    :param calc: the CalcJob
+    :returns: dictionary with all keys of the launcher set
+    """
+    settings = { "command" : "mpirun" }
+    settings.update(calc.inputs.code.get_extra("launcher", {}))
+    settings.update(calc.inputs.parameters.get_dict().get("launcher", {}))
+
+    resources = calc.inputs.metadata['options']['resources']
+    settings.setdefault("threads", resources.get("num_cores_per_mpiproc", None) or 1)
+    if settings["threads"] > 1 and settings["command"] == "mpirun":
+        settings.setdefault("map_by", f"slot:PE={settings['threads']}")
+    for key in ("bind", "map_by", "flags"):
+        settings.setdefault(key, None)
+    settings.setdefault("environment", {})
+    return settings
+
+def concurrent_settings(settings):
+    """
+    Launcher settings of runs sharing the allocation at the same time
+
+    mpirun must not bind runs on the same node to the same cores, so it
+    runs with ``--bind-to none`` unless ``bind`` is set. Since Slurm 21.08
+    a job step gets all CPUs of its nodes, srun runs with ``--exact``
+    unless ``--exact`` or ``--exclusive`` (older Slurm) is in ``flags``.
+
+    :param settings: result of :func:`launcher_settings`, updated in place
+    :returns: ``settings``
+    """
+    if settings["command"] == "mpirun" and settings["bind"] is None:
+        settings["bind"] = "none"
+    if settings["command"] == "srun":
+        flags = settings["flags"] or ""
+        if "--exact" not in flags.split() and "--exclusive" not in flags.split():
+            settings["flags"] = " ".join(["--exact", flags]).strip()
+    return settings
+
+def environment_commands(settings):
+    """
+    Exports of the job script preceding the runs
+    """
+    environment = {}
+    if settings["threads"] > 1:
+        environment = { "OMP_NUM_THREADS" : settings["threads"],
+                        "OMP_PLACES"      : "cores",
+                        "OMP_PROC_BIND"   : "close" }
+    environment.update(settings["environment"])
+    return [ f"export {key}={value}" for key, value in environment.items() ]
+
+def launch_command(settings, nprocs, executable, hostfile=None):
+    """
+    Command running ``executable`` on ``nprocs`` MPI processes
+
+    :param settings: result of :func:`launcher_settings`
+    :param nprocs: number of MPI processes
+    :param executable: executable with its arguments and redirections
+    :param hostfile: file with the host of every process, by default the launcher places the processes
+    """
+    command = settings["command"]
+    np_flag, threads_flag, bind_flag, map_flag, hosts_flag = LAUNCHER_FLAGS.get(command, LAUNCHER_FLAGS["mpirun"])
+
+    parts = [command, np_flag.format(nprocs)]
+    if threads_flag is not None and settings["threads"] > 1:
+        parts.append(threads_flag.format(settings["threads"]))
+    if settings["bind"] is not None:
+        parts.append(bind_flag.format(settings["bind"]))
+    if map_flag is not None and settings["map_by"] is not None:
+        parts.append(map_flag.format(settings["map_by"]))
+    if hostfile is not None:
+        parts.append(hosts_flag.format(hostfile))
+    if settings["flags"]:
+        parts.append(settings["flags"])
+    parts.append(executable)
+    return " ".join(parts)
+
+def hosts_commands(num_machines, procs_per_machine, filename="hosts"):
+    """
+    Commands writing the host of every MPI process of the allocation to ``filename``
+
+    The hosts are read from ``$PBS_NODEFILE`` or ``$SLURM_NODELIST``, each
+    node of the latter ``procs_per_machine`` times. Without them all
+    processes run on the local host.
+    """
+    return [ 'if [ -n "$PBS_NODEFILE" ] && [ -f "$PBS_NODEFILE" ]; then',
+             f'    cat "$PBS_NODEFILE" > {filename}',
+             'elif [ -n "$SLURM_NODELIST" ]; then',
+             f'    for host in $(scontrol show hostnames "$SLURM_NODELIST"); do for ii in $(seq {procs_per_machine}); do echo $host; done; done > {filename}',
+             'else',
+             f'    for ii in $(seq {num_machines * procs_per_machine}); do hostname; done > {filename}',
+             'fi' ]
+
+def work_queue_commands(script, slots, procs_per_task, hosts="hosts"):
+    """
+    Commands running ``script`` in every ``task_*`` directory, at most ``slots`` at a time
+
+    Every slot owns ``procs_per_task`` consecutive lines of ``hosts``,
+    written to ``hostfile_<slot>`` and exported as ``HOSTFILE`` to its tasks,
+    so that tasks running at the same time do not share processors. A slot
+    takes the next task as soon as its previous task finished. Tasks are
+    claimed by creating ``.claimed`` in their directory, ``mkdir`` is atomic.
+    """
+    return [ "run_slot() {",
+             f"    head -n $(( ($1 + 1) * {procs_per_task} )) {hosts} | tail -n {procs_per_task} > hostfile_$1",
+             "    export HOSTFILE=$PWD/hostfile_$1",
+             "    for task in task_*/; do",
+             '        mkdir "${task}.claimed" 2> /dev/null || continue',
+             f'        (cd "$task" && bash {script} > run.log 2>&1)',
+             "    done",
+             "}",
+             f"for slot in $(seq 0 {slots - 1}); do run_slot $slot & done",
+             "wait" ]
@@ -1,10 +1,31 @@
+import copy
 from typing import ( Optional, Any )
 
+def fortran_value(value: Any):
+    """
+    Format value as it is written to the namelist
+    """
+    if isinstance(value, bool):
+        return '.TRUE.' if value else '.FALSE.'
+    return str(value)
+
 class NamelistHolder:
+    """
+    Values of one Fortran namelist, indexed by name
+
+    A holder defined on module level should be frozen by :meth:`freeze`
+    and used only as a template, every calculation works on its own
+    copy obtained by :meth:`clone`.
+    """
 
     def __init__(self, name):
         self.name = name
-        self.values = []
+        self.values = {}
+        self.frozen = False
+
+    def _check_frozen(self):
+        if self.frozen:
+            raise TypeError(f"Namelist {self.name} is a frozen template, use clone()")
 
     def add_value(self,
                   name: str,
@@ -14,41 +35,65 @@ class NamelistHolder:
         """
         Add one value into the namelist
         """
+        self._check_frozen()
 
         if not isinstance(value, type_):
-            # TODO
-            raise Exception()
+            raise TypeError(f"Value of {name} has to be {type_.__name__}")
 
-        val = { "name"   : name,
-                "type"   : type_,
-                "value"  : value,
-                "hidden" : hidden }
+        self.values[name] = { "name"   : name,
+                              "type"   : type_,
+                              "value"  : value,
+                              "hidden" : hidden }
 
-        self.values.append(val)
+    def freeze(self):
+        """
+        Make the namelist immutable, returns itself
+        """
+        self.frozen = True
+        return self
+
+    def clone(self):
+        """
+        Mutable copy of the namelist
+        """
+        ret = NamelistHolder(self.name)
+        ret.values = copy.deepcopy(self.values)
+        return ret
 
     def dump(self, handle):
         handle.write(f"&{self.name}\n")
-        for entry in self.values:
-            if entry['type'] == bool:
-                val = f"{'.TRUE.' if entry['value'] else '.FALSE.'}"
+        for entry in self.values.values():
             if entry['type'] == str:
                 val = f"'{entry['value']}'"
             else:
-                val = str(entry['type'](entry['value']))
+                val = fortran_value(entry['type'](entry['value']))
             handle.write(f" {'!' if entry['hidden'] else ' '}{entry['name']} = {val}\n")
         handle.write(f"/\n")
 
     def update(self, key : str, value : Any):
-        for ii, entry in enumerate(self.values):
-            if entry["name"] == key:
-                if not isinstance(value, entry["type"]):
-                    # TODO
-                    raise Exception()
-                if entry["hidden"]:
-                    self.value[ii]["hidden"] = False
-                self.values[ii]["value"] = value
-                return
-        raise Exception()
+        self._check_frozen()
+        try:
+            entry = self.values[key]
+        except KeyError:
+            raise KeyError(f"Namelist {self.name} has no key {key}")
+        if not isinstance(value, entry["type"]):
+            raise TypeError(f"Value of {key} has to be {entry['type'].__name__}")
+        entry["hidden"] = False
+        entry["value"] = value
+
+    def update_many(self, values : dict, ignore_missing : bool = False):
+        """
+        Update several values at once
+
+        :param ignore_missing: skip keys that are not in this namelist
+        """
+        for key, value in values.items():
+            if ignore_missing and key not in self.values:
+                continue
+            self.update(key, value)
 
     def get_keys(self):
-        return [ x["name"] for x in self.values ]
+        return list(self.values.keys())
+
+    def __contains__(self, key):
+        return key in self.values
@@ -0,0 +1,71 @@
+"""
+In-process rendering of TurboRVB namelist input files.
+
+A template is an input file generated once by ``turbo-genius.sh -g``
+(e.g. ``datasvmc.input``). Keys are indexed when the template is parsed,
+all updates are then applied in a single pass over the lines, with the
+same semantics as the ``sed`` substitutions used in the job scripts.
+"""
+import re
+from typing import ( Optional, Sequence )
+from .namelist_holder import fortran_value
+
+_KEY = re.compile(r"^\s*!?\s*([A-Za-z_][\w(),]*)\s*=")
+_OCCUPATIONS = re.compile(r"^[012][012 ]*")
+
+class NamelistTemplate:
+    """
+    Input file generated by Turbo-Genius with the lines of its keys indexed
+
+    Keys are matched case-insensitively, commented keys (``!key = ...``)
+    are indexed too. The parsed lines are never modified, every
+    :meth:`render` starts from the template.
+    """
+
+    def __init__(self, text: str):
+        self.lines = text.splitlines()
+        self.index = {}
+        for ii, line in enumerate(self.lines):
+            match = _KEY.match(line)
+            if match:
+                self.index.setdefault(match.group(1).lower(), []).append(ii)
+
+    def get_keys(self):
+        return list(self.index.keys())
+
+    def render(self,
+               updates: Optional[dict] = None,
+               occupations: Optional[Sequence[int]] = None):
+        """
+        Return text of the input with updated values
+
+        Commented keys (``!key = ...``) are uncommented, keys not present
+        in the template are ignored as they are by ``sed``.
+
+        :param updates: dictionary of namelist keys and new values
+        :param occupations: replaces the occupation lines of ``prep.input``
+        """
+        lines = list(self.lines)
+        for key, value in (updates or {}).items():
+            for ii in self.index.get(key.lower(), []):
+                lines[ii] = f"{key}={fortran_value(value)}"
+        if occupations is not None:
+            occs = " ".join([str(x) for x in occupations])
+            lines = [ _OCCUPATIONS.sub(occs, line) for line in lines ]
+        return "\n".join(lines) + "\n"
+
+def sed_command(filename: str,
+                updates: Optional[dict] = None,
+                occupations: Optional[Sequence[int]] = None):
+    """
+    Single in-place ``sed`` call applying all updates on the compute node
+    """
+    expressions = []
+    if occupations is not None:
+        occs = " ".join([str(x) for x in occupations])
+        expressions.append("-e 's/^[012][012 ]*/"+occs+"/g'")
+    for key, value in (updates or {}).items():
+        expressions.append("-e 's/\\s*!\\?"+key+"\\s*=.*$/"+key+"="+f"{fortran_value(value)}"+"/g'")
+    if not expressions:
+        return None
+    return f"sed -i {' '.join(expressions)} {filename}"
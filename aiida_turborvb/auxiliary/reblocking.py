@@ -0,0 +1,190 @@
+"""
+Binning analysis of correlated Monte Carlo time series.
+
+The functions in this module replace the ``turbo-genius.sh -post`` step
+of the wrapper CalcJobs. All of them work on plain NumPy arrays holding
+one entry per block (record) of ``fort.12``, so the same code can be used
+in the parsers as well as for re-analysing already finished calculations.
+"""
+from typing import ( Optional, Sequence )
+import numpy as np
+
+def block_sizes_for(ndata: int):
+    """
+    Default set of block sizes, powers of two up to half of the data
+    """
+    sizes = []
+    size = 1
+    while ndata // size >= 2:
+        sizes.append(size)
+        size *= 2
+    return np.array(sizes, dtype=int)
+
+def bin_data(data: np.ndarray,
+             bin_length: int,
+             weights: Optional[np.ndarray] = None):
+    """
+    Average consecutive blocks into bins of ``bin_length``
+
+    The remainder of the data, that does not fill the whole bin, is
+    discarded from the beginning of the series, i.e. the most
+    equilibrated part of the run is kept.
+
+    :returns: tuple of bin averages and bin weights
+    """
+    data = np.asarray(data, dtype=float)
+    nbins = data.shape[0] // bin_length
+    start = data.shape[0] - nbins * bin_length
+    data = data[start:]
+    if weights is None:
+        weights = np.ones(data.shape[0])
+    else:
+        weights = np.asarray(weights, dtype=float)[start:]
+
+    shape = (nbins, bin_length) + data.shape[1:]
+    wshape = (nbins, bin_length) + (1,) * (data.ndim - 1)
+    bin_weights = weights.reshape(wshape).sum(axis=1)
+    bin_means = (data.reshape(shape) * weights.reshape(wshape)).sum(axis=1) / bin_weights
+
+    return bin_means, bin_weights.reshape(nbins)
+
+def reblock(data: np.ndarray,
+            weights: Optional[np.ndarray] = None,
+            block_sizes: Optional[Sequence[int]] = None):
+    """
+    Flyvbjerg-Petersen blocking analysis for every block size at once
+
+    The cumulative sums of the (weighted) series are computed only once,
+    bin averages for all block sizes are then obtained by differences of
+    the cumulative sums.
+
+    :param data: 1D array with one value per block
+    :param weights: optional 1D array of block weights
+    :param block_sizes: block sizes to analyse, defaults to powers of two
+    :returns: dictionary of arrays ``block_size``, ``nbins``, ``mean``,
+        ``error`` and ``error_err``, one entry per block size
+    """
+    data = np.asarray(data, dtype=float)
+    ndata = data.shape[0]
+    if weights is None:
+        weights = np.ones(ndata)
+    weights = np.asarray(weights, dtype=float)
+    if block_sizes is None:
+        block_sizes = block_sizes_for(ndata)
+    block_sizes = np.asarray(block_sizes, dtype=int)
+
+    cum_w = np.concatenate(([0.0], np.cumsum(weights[::-1])))
+    cum_we = np.concatenate(([0.0], np.cumsum((weights * data)[::-1])))
+    mean = cum_we[-1] / cum_w[-1]
+
+    nbins = ndata // block_sizes
+    error = np.zeros(block_sizes.shape[0])
+    for ii, (size, nb) in enumerate(zip(block_sizes, nbins)):
+        # Bins are counted from the end of the series (see bin_data)
+        edges = np.arange(nb + 1) * size
+        bin_w = np.diff(cum_w[edges])
+        bin_e = np.diff(cum_we[edges]) / bin_w
+        if nb > 1:
+            error[ii] = np.sqrt(np.sum(bin_w * (bin_e - mean)**2) / np.sum(bin_w) / (nb - 1))
+    error_err = error / np.sqrt(2.0 * np.maximum(nbins - 1, 1))
+
+    return { "block_size" : block_sizes,
+             "nbins"      : nbins,
+             "mean"       : np.full(block_sizes.shape[0], mean),
+             "error"      : error,
+             "error_err"  : error_err }
+
+def find_plateau(stats: dict, ndata: Optional[int] = None):
+    """
+    Pick the block size at which the error estimate reached its plateau
+
+    Uses the criterion of Lee et al., PRE 83, 066706 (2011), the optimal
+    block size ``B`` is the smallest one satisfying
+    ``B**3 > 2 * N * (err_B / err_1)**4``. If no block size satisfies it,
+    the largest one with at least 16 bins is returned.
+
+    :param stats: output of :func:`reblock`
+    :param ndata: number of blocks, defaults to the size of the first bin set
+    :returns: index into the arrays of ``stats``
+    """
+    sizes = np.asarray(stats["block_size"], dtype=float)
+    error = np.asarray(stats["error"], dtype=float)
+    if ndata is None:
+        ndata = int(stats["nbins"][0] * stats["block_size"][0])
+    if error[0] == 0.0:
+        return 0
+
+    criterion = sizes**3 > 2.0 * ndata * (error / error[0])**4
+    candidates = np.flatnonzero(criterion)
+    if candidates.size > 0:
+        return int(candidates[0])
+    candidates = np.flatnonzero(np.asarray(stats["nbins"]) >= 16)
+    return int(candidates[-1]) if candidates.size > 0 else len(sizes) - 1
+
+def jackknife(bin_values: np.ndarray, bin_weights: np.ndarray):
+    """
+    Leave-one-bin-out averages of (possibly multi-column) bin values
+
+    :returns: array of jackknife averages, one per bin
+    """
+    bin_values = np.asarray(bin_values, dtype=float)
+    bin_weights = np.asarray(bin_weights, dtype=float)
+    wshape = (-1,) + (1,) * (bin_values.ndim - 1)
+    total_w = bin_weights.sum()
+    total = (bin_values * bin_weights.reshape(wshape)).sum(axis=0)
+    return (total - bin_values * bin_weights.reshape(wshape)) / (total_w - bin_weights).reshape(wshape)
+
+def jackknife_error(estimates: np.ndarray):
+    """
+    Mean and error of an estimator evaluated on jackknife samples
+    """
+    nbins = estimates.shape[0]
+    mean = estimates.mean(axis=0)
+    error = np.sqrt((nbins - 1) / nbins * np.sum((estimates - mean)**2, axis=0))
+    return mean, error
+
+def analyse(energy: np.ndarray,
+            weights: Optional[np.ndarray] = None,
+            energy_square: Optional[np.ndarray] = None,
+            eq: int = 0,
+            reb: Optional[int] = None):
+    """
+    Energy, variance and their error bars of a QMC run
+
+    This is the native equivalent of ``turbo-genius.sh -post -am manual``.
+
+    :param energy: local energy of each block
+    :param weights: weights of each block
+    :param energy_square: average of the squared local energy of each block,
+        variance is calculated only if provided
+    :param eq: number of blocks discarded as equilibration
+    :param reb: bin length, if ``None`` it is determined by :func:`find_plateau`
+    :returns: dictionary with the results and the whole blocking analysis
+    """
+    energy = np.asarray(energy, dtype=float)[eq:]
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)[eq:]
+    if energy.shape[0] < 2:
+        raise ValueError(f"Not enough blocks ({energy.shape[0]}) after equilibration")
+
+    stats = reblock(energy, weights)
+    if reb is None:
+        reb = int(stats["block_size"][find_plateau(stats, energy.shape[0])])
+
+    columns = [energy]
+    if energy_square is not None:
+        columns.append(np.asarray(energy_square, dtype=float)[eq:])
+    bins, bin_weights = bin_data(np.stack(columns, axis=1), reb, weights)
+    if bins.shape[0] < 2:
+        raise ValueError(f"Bin length {reb} leaves less than two bins")
+
+    jk = jackknife(bins, bin_weights)
+    ret = { "eq"    : eq,
+            "reb"   : reb,
+            "nbins" : int(bins.shape[0]),
+            "reblocking" : stats }
+    ret["energy"], ret["energy_err"] = (float(x) for x in jackknife_error(jk[:, 0]))
+    if energy_square is not None:
+        ret["variance"], ret["variance_err"] = (float(x) for x in jackknife_error(jk[:, 1] - jk[:, 0]**2))
+
+    return ret
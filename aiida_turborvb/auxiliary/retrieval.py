@@ -0,0 +1,293 @@
+"""
+Retrieval of large binary outputs of the QMC wrapper CalcJobs.
+
+With ``discard_raw`` in parameters the raw files are retrieved only
+temporarily, the parsers extract compact summaries from them and AiiDA
+deletes them afterwards instead of storing them in the repository.
+"""
+import os
+import hashlib
+import numpy as np
+from aiida.orm import ArrayData, Float, SinglefileData
+from .fort12 import Fort12Reader
+from .reblocking import analyse
+
+#: Compressed scratch directory, see ``archive_scratch`` in parameters
+SCRATCH_ARCHIVE = "turborvb.scratch.tar.gz"
+
+#: Last line printed by the job script, missing if the job was interrupted
+FINISHED_MARKER = "TurboRVB wrapper job finished"
+
+#: Wall times in seconds of the timed runs of a job, one per line
+WALLTIME_FILE = "walltime.dat"
+
+#: Checksum of fort.11 at the start of the job, see :func:`checkpoint_updated`
+CHECKPOINT_FILE = "fort.11.start"
+
+#: Written to the working directory to stop the running QMC executable, see :func:`stoppable_command`
+STOP_FILE = "turborvb.stop"
+
+#: Files retrieved only temporarily in the ``discard_raw`` mode
+RAW_FILES = ("fort.12",
+             "fort.12_fn",
+             "turborvb.scratch",
+             SCRATCH_ARCHIVE)
+
+def split_retrieve_list(retrieve_list, parameters):
+    """
+    Move raw files from retrieve list to the temporary one if requested
+
+    :returns: tuple of retrieve list and temporary retrieve list
+    """
+    if not parameters.get("discard_raw", False):
+        return retrieve_list, []
+    return ([ x for x in retrieve_list if x not in RAW_FILES ],
+            [ x for x in retrieve_list if x in RAW_FILES ])
+
+def scratch_commands(parameters):
+    """
+    Shell commands packing the scratch directory at the end of the job
+    """
+    if not parameters.get("archive_scratch", False):
+        return []
+    return [f"tar -czf {SCRATCH_ARCHIVE} turborvb.scratch"]
+
+def finished_command():
+    """
+    Last command of the job script marking that the job was not interrupted
+    """
+    return f'echo "{FINISHED_MARKER}"'
+
+def records_complete(retrieved, temporary_folder, name):
+    """
+    Check that the Fortran unformatted file ``name`` was retrieved and ends with a complete record
+    """
+    try:
+        with open_output(retrieved, temporary_folder, name) as handle:
+            with Fort12Reader(handle) as reader:
+                return reader.complete
+    except (FileNotFoundError, OSError, ValueError):
+        return False
+
+def stopped_cleanly(retrieved, temporary_folder=None):
+    """
+    Check that a job stopped through ``STOP_FILE`` left complete restart files
+
+    The executable is stopped by a signal, which may hit it while it writes
+    fort.11 or the last record of fort.12.
+    """
+    return all([ records_complete(retrieved, temporary_folder, x) for x in ("fort.11", "fort.12") ])
+
+def job_finished(retrieved, output_filename, temporary_folder=None):
+    """
+    Check the marker written by :func:`finished_command` in the job output
+
+    A job stopped through ``STOP_FILE`` (e.g. by the ``target_error``
+    monitor) is a finished job too, even if it was killed afterwards, if
+    its fort.11 and fort.12 are complete (see :func:`stopped_cleanly`).
+    Otherwise it is an interrupted job.
+    """
+    if STOP_FILE in retrieved.list_object_names():
+        return stopped_cleanly(retrieved, temporary_folder)
+    try:
+        with retrieved.open(output_filename, 'r') as handle:
+            return any([ FINISHED_MARKER in line for line in handle ])
+    except (FileNotFoundError, OSError):
+        return False
+
+def stoppable_command(command, interval=2, blockfile="fort.12"):
+    """
+    Shell command running ``command`` until it finishes or ``STOP_FILE`` appears
+
+    The executable is stopped by a signal right after it appended the next
+    block to ``blockfile``, so that it is not writing its restart files.
+    The rest of the job script (post-processing, finished marker) runs as
+    after a finished run, the parser checks that the restart files are
+    complete, see :func:`job_finished`.
+    """
+    size = f"$(stat -c %s {blockfile} 2> /dev/null || echo 0)"
+    return "\n".join([f"{command} &",
+                      "PID=$!",
+                      "while kill -0 $PID 2> /dev/null; do",
+                      f"    if [ -f {STOP_FILE} ]; then",
+                      f"        SIZE={size}",
+                      f'        while [ -f {blockfile} ] && [ "{size}" = "$SIZE" ] && kill -0 $PID 2> /dev/null; do sleep 0.2; done',
+                      "        kill $PID 2> /dev/null",
+                      "        break",
+                      "    fi",
+                      f"    sleep {interval}",
+                      "done",
+                      "wait $PID"])
+
+def read_stop_file(retrieved):
+    """
+    Reason written to ``STOP_FILE``, ``None`` if the run was not stopped
+    """
+    if STOP_FILE not in retrieved.list_object_names():
+        return None
+    with retrieved.open(STOP_FILE, 'r') as handle:
+        return handle.read().strip()
+
+def timed_commands(command):
+    """
+    Shell commands running ``command`` and appending its wall time to ``WALLTIME_FILE``
+    """
+    return ["START=$(date +%s.%N)",
+            command,
+            f"awk -v s=$START -v e=$(date +%s.%N) 'BEGIN {{print e - s}}' >> {WALLTIME_FILE}"]
+
+def checkpoint_commands():
+    """
+    Shell commands recording the checksum of fort.11 before the run
+
+    The file is empty if the job started without fort.11.
+    """
+    return [f"md5sum fort.11 > {CHECKPOINT_FILE} 2> /dev/null || : > {CHECKPOINT_FILE}"]
+
+def checkpoint_updated(retrieved):
+    """
+    Check that the retrieved fort.11 differs from the one the job started from
+
+    A job killed before writing its first checkpoint leaves the fort.11
+    it started from, resuming from it would repeat the same run.
+    """
+    names = retrieved.list_object_names()
+    if "fort.11" not in names or CHECKPOINT_FILE not in names:
+        return False
+    with retrieved.open(CHECKPOINT_FILE, 'r') as handle:
+        start = handle.read().split()
+    md5 = hashlib.md5()
+    with retrieved.open("fort.11", 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            md5.update(chunk)
+    return not start or start[0] != md5.hexdigest()
+
+def read_walltime(retrieved):
+    """
+    Total wall time of the runs timed by :func:`timed_commands`, ``None`` if it was not retrieved
+    """
+    try:
+        with retrieved.open(WALLTIME_FILE, 'r') as handle:
+            return sum([ float(line) for line in handle if line.strip() ])
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+
+def scratch_retrieve_name(parameters):
+    """
+    Name of the scratch directory or of its archive in the retrieve list
+    """
+    if parameters.get("archive_scratch", False):
+        return SCRATCH_ARCHIVE
+    return "turborvb.scratch"
+
+def read_pip0(handle):
+    """
+    Energy and variance with errors from ``pip0.d`` or ``pip0_fn.d``
+
+    :returns: tuple of energy, energy error, variance and variance error
+    """
+    for ii, line in enumerate(handle):
+        if ii == 1:
+            line_split = line.split()
+            energy = float(line_split[-2])
+            energy_err = float(line_split[-1])
+        if ii == 2:
+            line_split = line.split()
+            variance = float(line_split[-2])
+            variance_err = float(line_split[-1])
+    return energy, energy_err, variance, variance_err
+
+def output_exists(retrieved, temporary_folder, name):
+    """
+    Check that ``name`` was retrieved, permanently or temporarily
+    """
+    if temporary_folder is not None and os.path.exists(os.path.join(temporary_folder, name)):
+        return True
+    return name in retrieved.list_object_names()
+
+def open_output(retrieved, temporary_folder, name, mode='rb'):
+    """
+    Open file either from temporary retrieved folder or from retrieved node
+
+    Raises FileNotFoundError if it is in neither, see :func:`output_exists`.
+    """
+    if temporary_folder is not None:
+        path = os.path.join(temporary_folder, name)
+        if os.path.exists(path):
+            return open(path, mode)
+    return retrieved.open(name, mode)
+
+def blockdata_to_array(handle, kind="vmc"):
+    """
+    Named columns of ``fort.12`` stored as ArrayData
+
+    Only the leading columns listed in ``fort12.COLUMNS`` are kept, which
+    is enough to reblock the run again later.
+    """
+    with Fort12Reader(handle, kind=kind) as reader:
+        return columns_to_array(reader.get_columns())
+
+def columns_to_array(columns):
+    """
+    Columns of ``fort.12`` (e.g. from ``Fort12Reader.get_columns``) stored as ArrayData
+    """
+    ret = ArrayData()
+    for key, value in columns.items():
+        ret.set_array(key, np.array(value))
+    return ret
+
+def completed_iterations(retrieved, temporary_folder=None, fort12=True):
+    """
+    Optimization steps completed by a VMC optimization job, ``None`` if unknown
+
+    ``story.d`` has one line per step, if it was not retrieved the records
+    of ``fort.12`` are counted, unless ``fort12`` is false because the job
+    appended to the fort.12 of a previous job. Every step runs ``nweight``
+    generations.
+    """
+    if "story.d" in retrieved.list_object_names():
+        with retrieved.open("story.d", 'r') as handle:
+            return len([ line for line in handle if line.strip() and not line.strip().startswith("#") ])
+    if not fort12:
+        return None
+    try:
+        with open_output(retrieved, temporary_folder, "fort.12") as handle:
+            with Fort12Reader(handle) as reader:
+                return len(reader)
+    except (FileNotFoundError, OSError):
+        return None
+
+def parse_interrupted(parser, temporary_folder, kind=None):
+    """
+    Attach outputs of an interrupted (e.g. out of walltime) job
+
+    ``fort.11`` and ``fort.12`` are attached if they were retrieved, so the
+    run can be continued, a truncated ``fort.11`` is not. If ``kind`` is given, the completed blocks of
+    ``fort.12`` are stored as ``blockdata`` and reblocked to get the energy
+    of the interrupted run. A truncated last record is skipped.
+    """
+    parameters = parser.node.inputs.parameters.get_dict()
+    names = parser.retrieved.list_object_names()
+    if records_complete(parser.retrieved, temporary_folder, "fort.11"):
+        with parser.retrieved.open("fort.11", 'rb') as handle:
+            parser.out('fort11', SinglefileData(file=handle))
+    if "fort.12" in names and not parameters.get("discard_raw", False):
+        with parser.retrieved.open("fort.12", 'rb') as handle:
+            parser.out('fort12', SinglefileData(file=handle))
+    if kind is None:
+        return
+    try:
+        with open_output(parser.retrieved, temporary_folder, "fort.12") as handle:
+            blockdata = blockdata_to_array(handle, kind=kind)
+    except (FileNotFoundError, OSError):
+        return
+    parser.out('blockdata', blockdata)
+    try:
+        result = analyse(blockdata.get_array("energy"),
+                         weights=blockdata.get_array("weight"),
+                         eq=parameters.get("eq", 0),
+                         reb=parameters.get("reb", None))
+    except ValueError:
+        return
+    parser.out('energy', Float(result["energy"]))
+    parser.out('energy_err', Float(result["energy_err"]))
@@ -0,0 +1,78 @@
+"""
+Staging of input files shared by the wrapper CalcJobs.
+"""
+from aiida.common import exceptions
+from .namelist_template import ( NamelistTemplate, sed_command )
+
+#: Default mapping of input ports to file names in the working directory
+WAVEFUNCTION_FILES = (("fort10", "fort.10"),
+                      ("pseudo", "pseudo.dat"))
+
+def stage_inputs(inputs, files=WAVEFUNCTION_FILES):
+    """
+    Entries of local_copy_list for SinglefileData inputs
+
+    The files are copied by the engine directly from the repository,
+    they are never read into memory by ``prepare_for_submission``.
+
+    :param inputs: inputs of the CalcJob
+    :param files: pairs of (input port, destination file name),
+        missing optional inputs are skipped
+    """
+    return [ (inputs[port].uuid, inputs[port].filename, dst) for port, dst in files if port in inputs ]
+
+def box_argument(box):
+    """
+    Turbo-Genius ``-box`` argument from a single length or three lengths
+    """
+    if isinstance(box, (list, tuple)):
+        if len(box) == 1:
+            A = B = C = box[0]
+        elif len(box) == 3:
+            A, B, C = box
+        else:
+            raise Exception("Bad box")
+    elif isinstance(box, (int, float)):
+        A = B = C = float(box)
+    else:
+        raise Exception("Bad box")
+    return f" -box {A} {B} {C}"
+
+def input_commands(calc, folder, generate, generated, target, updates=None, occupations=None, options=()):
+    """
+    Prepare the namelist input of a wrapper job
+
+    If the CalcJob has ``input_template``, the input is rendered here in one
+    pass and no Turbo-Genius call is needed on the compute node. Otherwise
+    Turbo-Genius generates it on the node and a single ``sed`` applies
+    the updates.
+
+    :param calc: the CalcJob
+    :param folder: sandbox folder of ``prepare_for_submission``
+    :param generate: Turbo-Genius command generating the input
+    :param generated: name of the file generated by Turbo-Genius
+    :param target: name of the input file read by the executable
+    :param updates: namelist values to be changed
+    :param occupations: new occupation lines (``prep.input`` only)
+    :param options: parameters turned into options of ``generate``, they
+        cannot be applied to a template
+    :returns: list of shell commands for the job script
+    """
+    if "input_template" in calc.inputs:
+        ignored = [ x for x in options if x in calc.inputs.parameters.get_dict() ]
+        if ignored:
+            raise exceptions.InputValidationError(f"Parameters {ignored} are Turbo-Genius options, they are not "
+                                                  "applied to input_template, set the namelist values instead")
+        with calc.inputs.input_template.open() as fhandle:
+            template = NamelistTemplate(fhandle.read())
+        with folder.open(target, "w") as fhandle:
+            fhandle.write(template.render(updates, occupations))
+        return []
+
+    content = [generate]
+    if generated != target:
+        content.append(f'cp {generated} {target}')
+    command = sed_command(target, updates, occupations)
+    if command is not None:
+        content.append(command)
+    return content
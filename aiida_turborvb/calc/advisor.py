@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Resources of VMC and LRDMC wrapper calculations from previous runs
+
+Finished runs of the same kind are collected from the database with the
+size of their system (electrons and basis shells from the ``fort.10``
+header), their layout, number of samples, wall time and energy error.
+Two log-linear models in the number of electrons and basis shells are
+fitted to the runs of similar systems:
+
+ - core seconds per sample (``ngen * nw``)
+ - variance per sample, ``energy_err**2 * ngen * nw``
+
+A run of the same ``fort.10`` is used directly for the variance, as it
+depends on the quality of the wavefunction more than on its size. The
+number of samples needed for the target error then gives ``ngen``, the
+number of machines and ``max_wallclock_seconds``::
+
+    builder = VmcCalculation.get_builder()
+    ...
+    advice = advise_builder(builder, target_error=1e-3, max_wallclock_seconds=86400)
+"""
+import math
+import numpy as np
+
+from aiida.orm import CalcJobNode, Code, Dict, Float, SinglefileData, QueryBuilder
+from aiida_turborvb.auxiliary.fort10 import read_fort10_header
+
+#: Process types of the calculations used as history
+PROCESS_TYPES = { "vmc"   : "aiida.calculations:turborvb.vmcwrp",
+                  "lrdmc" : "aiida.calculations:turborvb.lrdmcwrp" }
+
+#: Extra of fort.10 nodes caching the size of the system
+SYSTEM_EXTRA = "turborvb_system"
+
+def wall_time(node):
+    """
+    Wall time of the QMC runs of a CalcJob, the scheduler's one if it was not timed
+    """
+    if "wall_time" in node.outputs:
+        return node.outputs.wall_time.value
+    job_info = node.get_last_job_info()
+    if job_info is None:
+        return None
+    return getattr(job_info, "wallclock_time_seconds", None)
+
+def system_size(fort10):
+    """
+    Number of electrons and basis shells of the wavefunction
+
+    The result is cached in an extra of stored nodes.
+    """
+    if fort10.is_stored:
+        cached = fort10.get_extra(SYSTEM_EXTRA, None)
+        if cached is not None:
+            return cached
+    with fort10.open(mode="rb") as handle:
+        header = read_fort10_header(handle)
+    ret = { "nel"   : header.nel,
+            "basis" : header.nshell_det + header.nshell_jas }
+    if fort10.is_stored:
+        fort10.set_extra(SYSTEM_EXTRA, ret)
+    return ret
+
+def run_layout(parameters, resources):
+    """
+    Cores and walkers of a run, TurboRVB uses one walker per process by default
+    """
+    procs = resources.get("num_machines", 1) * resources.get("num_mpiprocs_per_machine", 1)
+    threads = ( parameters.get("launcher", {}).get("threads", None) or
+                resources.get("num_cores_per_mpiproc", None) or 1 )
+    return procs * threads, parameters.get("namelist_update", {}).get("nw", procs)
+
+def history(kind="vmc", code=None, limit=500):
+    """
+    Previous successful runs of the given kind, newest first
+
+    :param code: only runs of this code, e.g. to stay on one machine
+    :returns: list of dictionaries with ``uuid`` of fort.10, ``nel``,
+        ``basis``, ``cores``, ``samples``, ``wall_time`` and ``energy_err``
+    """
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, tag="calc", project=["*"],
+              filters={ "process_type"           : PROCESS_TYPES[kind],
+                        "attributes.exit_status" : 0 })
+    if code is not None:
+        qb.append(Code, with_outgoing="calc", filters={ "id" : code.pk })
+    qb.append(SinglefileData, with_outgoing="calc", edge_filters={ "label" : "fort10" }, project=["*"])
+    qb.append(Float, with_incoming="calc", edge_filters={ "label" : "energy_err" }, project=["attributes.value"])
+    qb.order_by({ CalcJobNode : { "ctime" : "desc" } })
+    qb.limit(limit)
+
+    ret = []
+    for node, fort10, energy_err in qb.all():
+        parameters = node.inputs.parameters.get_dict()
+        ngen = parameters.get("namelist_update", {}).get("ngen", None)
+        seconds = wall_time(node)
+        if ngen is None or not seconds or not energy_err:
+            continue
+        try:
+            system = system_size(fort10)
+        except (ValueError, OSError):
+            continue
+        cores, walkers = run_layout(parameters, node.get_option("resources"))
+        ret.append({ "uuid"       : fort10.uuid,
+                     "nel"        : system["nel"],
+                     "basis"      : system["basis"],
+                     "cores"      : cores,
+                     "samples"    : ngen * walkers,
+                     "wall_time"  : seconds,
+                     "energy_err" : energy_err })
+    return ret
+
+def similar(records, system, factor=2.0):
+    """
+    Runs of systems with at most ``factor`` times more or less electrons,
+    all runs if there are none
+    """
+    ret = [ x for x in records if system["nel"] / factor <= x["nel"] <= system["nel"] * factor ]
+    return ret if ret else records
+
+def fit_log_model(records, values, system):
+    """
+    Least squares fit of ``log(value) = c0 + c1 log(nel) + c2 log(basis)``
+    evaluated for ``system``
+
+    Terms are dropped if there are not enough distinct systems.
+    """
+    features = [ np.ones(len(records)) ]
+    point = [ 1.0 ]
+    for key in ("nel", "basis"):
+        column = np.log([ x[key] for x in records ])
+        if len(set([ (x["nel"], x["basis"]) for x in records ])) > len(features):
+            features.append(column)
+            point.append(math.log(system[key]))
+    coefs = np.linalg.lstsq(np.stack(features, axis=1), np.log(values), rcond=None)[0]
+    return float(math.exp(np.dot(coefs, point)))
+
+def ceil(value):
+    """
+    Ceiling ignoring the float error of an exact value, e.g. 1000.0000000001
+    """
+    return int(math.ceil(round(value, 6)))
+
+def advise(fort10,
+           target_error: float,
+           kind: str = "vmc",
+           parameters=None,
+           cores_per_machine: int = 1,
+           threads: int = 1,
+           max_wallclock_seconds: float = 86400.0,
+           safety: float = 1.3,
+           code=None,
+           records=None):
+    """
+    Steps and resources of a run reaching ``target_error``
+
+    :param fort10: wavefunction of the new run
+    :param parameters: parameters of the new run, ``nw``, ``nweight`` and ``eq``
+        are taken into account
+    :param cores_per_machine: MPI processes per machine
+    :param threads: OpenMP threads per process
+    :param max_wallclock_seconds: the number of machines is increased until the run fits
+    :param safety: factor applied to the predicted wall time and number of steps
+    :param code: only use history of this code
+    :param records: history, queried by :func:`history` if not given
+    :returns: dictionary with ``ngen``, ``num_machines``, ``max_wallclock_seconds``,
+        the predicted ``wall_time`` and the number of runs used, or ``None`` without history
+    """
+    if records is None:
+        records = history(kind, code=code)
+    if not records:
+        return None
+    parameters = parameters or {}
+    namelist = parameters.get("namelist_update", {})
+    system = system_size(fort10)
+
+    same = [ x for x in records if x["uuid"] == fort10.uuid ]
+    near = similar(records, system)
+    variance = same if same else near
+    kappa = fit_log_model(variance, [ x["energy_err"]**2 * x["samples"] for x in variance ], system)
+    cost = fit_log_model(near, [ x["wall_time"] * x["cores"] / x["samples"] for x in near ], system)
+
+    samples = kappa / target_error**2 * safety
+    core_seconds = samples * cost * safety
+    per_machine = cores_per_machine * threads
+    num_machines = max(1, ceil(core_seconds / (max_wallclock_seconds * per_machine)))
+
+    nw = namelist.get("nw", num_machines * cores_per_machine)
+    nweight = namelist.get("nweight", 1)
+    ngen = ceil(samples / nw / nweight) * nweight + parameters.get("eq", 0) * nweight
+
+    predicted = ngen * nw * cost / (num_machines * per_machine)
+    return { "ngen"                  : ngen,
+             "num_machines"          : num_machines,
+             "max_wallclock_seconds" : ceil(min(predicted * safety, max_wallclock_seconds)),
+             "wall_time"             : predicted,
+             "runs"                  : len(variance) }
+
+def advise_builder(builder, target_error: float, kind: str = "vmc", **kwargs):
+    """
+    Fill ``ngen``, ``num_machines`` and ``max_wallclock_seconds`` of a
+    VMC or LRDMC wrapper builder, see :func:`advise` for the arguments
+
+    ``num_mpiprocs_per_machine`` of the builder is kept. The builder is
+    not changed if there is no history.
+
+    :returns: the advice
+    """
+    resources = dict(builder.metadata.options.get("resources", None) or {})
+    parameters = builder.parameters.get_dict()
+    kwargs.setdefault("cores_per_machine", resources.get("num_mpiprocs_per_machine", 1))
+    kwargs.setdefault("threads", parameters.get("launcher", {}).get("threads", None) or
+                                 resources.get("num_cores_per_mpiproc", None) or 1)
+    advice = advise(builder.fort10, target_error, kind=kind, parameters=parameters, **kwargs)
+    if advice is None:
+        return None
+
+    parameters["namelist_update"] = dict(parameters.get("namelist_update", {}))
+    parameters["namelist_update"]["ngen"] = advice["ngen"]
+    builder.parameters = Dict(dict=parameters)
+    resources["num_machines"] = advice["num_machines"]
+    resources["num_mpiprocs_per_machine"] = kwargs["cores_per_machine"]
+    builder.metadata.options.resources = resources
+    builder.metadata.options.max_wallclock_seconds = advice["max_wallclock_seconds"]
+    return advice
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Monitors of running VMC and LRDMC wrapper calculations
+
+:func:`target_error` copies the blocks appended to ``fort.12`` in the
+remote working directory since its previous check, reblocks the file and stops the job once the requested error
+is reached or the energy drifts. It does not kill the job, it writes
+``turborvb.stop`` to the working directory. The job script stops the
+executable when the file appears and continues as after a finished run,
+so the job is retrieved and parsed as usual, including Turbo-Genius
+post-processing. A job stopped on target keeps the exit status of the
+parser, a drifting one exits with ``ERROR_ENERGY_DRIFT``.
+
+With aiida-core 2.3 or newer, :func:`target_error` is a CalcJob monitor
+(``monitors`` input). aiida-core 1.x has no monitors and nothing checks
+the runs by itself, :func:`poll_target_error` has to be called
+periodically by the user, e.g. from a cron job.
+"""
+import math
+import os
+import shlex
+import shutil
+import tempfile
+from typing import Optional
+
+from aiida_turborvb.auxiliary.fort12 import Fort12Reader
+from aiida_turborvb.auxiliary.retrieval import STOP_FILE
+from aiida_turborvb.auxiliary.reblocking import analyse
+
+#: Local copies of ``fort.12`` of the monitored calculations, keyed by UUID
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "aiida-turborvb-monitors")
+
+#: Remote file receiving the new bytes of ``fort.12`` before they are copied
+PART_FILE = "fort.12.monitor"
+
+def cache_path(node):
+    return os.path.join(CACHE_DIR, f"{node.uuid}.fort.12")
+
+def forget(node):
+    """
+    Remove the local copy of ``fort.12`` of a calculation
+    """
+    if os.path.exists(cache_path(node)):
+        os.remove(cache_path(node))
+
+def fetch_fort12(node, transport):
+    """
+    Local copy of ``fort.12`` of a running calculation, ``None`` if there is no fort.12 yet
+
+    Only the bytes appended since the previous call are copied, so every
+    check transfers the new blocks instead of the whole file. The local
+    copy is a prefix of the remote file, a truncated last record is
+    completed by the next call.
+    """
+    workdir = node.get_remote_workdir()
+    remote = os.path.join(workdir, "fort.12")
+    if not transport.isfile(remote):
+        return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    local = cache_path(node)
+    offset = os.path.getsize(local) if os.path.exists(local) else 0
+    size = transport.get_attribute(remote).st_size
+    if size < offset:
+        # Written again from the start
+        forget(node)
+        offset = 0
+    if size > offset:
+        part = os.path.join(workdir, PART_FILE)
+        retval, _, stderr = transport.exec_command_wait(
+            f"tail -c +{offset + 1} {shlex.quote(remote)} > {shlex.quote(part)}")
+        if retval != 0:
+            raise OSError(f"Copying the new blocks of {remote} failed: {stderr}")
+        with tempfile.TemporaryDirectory() as dirpath:
+            transport.getfile(part, os.path.join(dirpath, PART_FILE))
+            with open(os.path.join(dirpath, PART_FILE), "rb") as source, open(local, "ab") as target:
+                shutil.copyfileobj(source, target)
+        transport.remove(part)
+    return local
+
+def running_analysis(node, transport, eq: int = 0, reb: Optional[int] = None):
+    """
+    Reblock ``fort.12`` of a running calculation
+
+    :returns: result of :func:`reblocking.analyse` and the named columns,
+        or ``None`` if there are not enough blocks yet
+    """
+    kind = "lrdmc" if "lrdmc" in (node.process_type or "") else "vmc"
+    local = fetch_fort12(node, transport)
+    if local is None or os.path.getsize(local) == 0:
+        return None
+
+    # The last record may be incomplete, it is skipped by the reader
+    with Fort12Reader(local, kind=kind) as reader:
+        data = { key : value.copy() for key, value in reader.get_columns().items() }
+
+    try:
+        result = analyse(data["energy"],
+                         weights=data.get("weight"),
+                         eq=eq,
+                         reb=reb)
+    except ValueError:
+        return None
+    return result, data
+
+def drift(energy, weights=None, eq: int = 0, reb: int = 1):
+    """
+    Difference of the mean energies of the two halves of the run in units
+    of its combined error
+    """
+    energy = energy[eq:]
+    weights = weights[eq:] if weights is not None else None
+    half = energy.shape[0] // 2
+    estimates = []
+    for part in (slice(0, half), slice(half, None)):
+        result = analyse(energy[part],
+                         weights=weights[part] if weights is not None else None,
+                         reb=reb)
+        estimates.append((result["energy"], result["energy_err"]))
+    (e1, s1), (e2, s2) = estimates
+    return abs(e1 - e2) / math.sqrt(s1**2 + s2**2)
+
+def request_stop(node, transport, reason: str):
+    """
+    Write ``STOP_FILE`` with ``reason`` to the working directory of the running job
+    """
+    with tempfile.TemporaryDirectory() as dirpath:
+        local = os.path.join(dirpath, STOP_FILE)
+        with open(local, "w") as handle:
+            handle.write(reason + "\n")
+        transport.putfile(local, os.path.join(node.get_remote_workdir(), STOP_FILE))
+
+def stop_reason(node,
+                transport,
+                target_error: float,
+                eq: int = 0,
+                reb: Optional[int] = None,
+                min_blocks: int = 20,
+                max_drift: Optional[float] = None) -> Optional[str]:
+    """
+    Reason to stop the calculation, ``None`` if it should continue
+
+    The reason starts with ``target`` or ``drift``, see :func:`target_error`
+    for the parameters.
+    """
+    analysis = running_analysis(node, transport, eq=eq, reb=reb)
+    if analysis is None:
+        return None
+    result, data = analysis
+    nblocks = data["energy"].shape[0] - eq
+    if nblocks < min_blocks:
+        return None
+
+    if max_drift is not None:
+        try:
+            sigma = drift(data["energy"], data.get("weight"), eq=eq, reb=result["reb"])
+        except ValueError:
+            sigma = 0.0
+        if sigma > max_drift:
+            return f"drift: energy drifts by {sigma:.1f} error bars between the halves of the run"
+
+    if result["energy_err"] <= target_error:
+        return f"target: {result['energy']} +- {result['energy_err']} after {nblocks} blocks"
+    return None
+
+def check_target_error(node, transport, **kwargs) -> Optional[str]:
+    """
+    Write ``STOP_FILE`` if the calculation should stop, see :func:`target_error`
+
+    :returns: the reason written to ``STOP_FILE``, ``None`` if the job
+        continues or is stopping already
+    """
+    if transport.isfile(os.path.join(node.get_remote_workdir(), STOP_FILE)):
+        forget(node)
+        return None
+    reason = stop_reason(node, transport, **kwargs)
+    if reason is not None:
+        request_stop(node, transport, reason)
+        forget(node)
+    return reason
+
+def target_error(node,
+                 transport,
+                 target_error: float,
+                 eq: int = 0,
+                 reb: Optional[int] = None,
+                 min_blocks: int = 20,
+                 max_drift: Optional[float] = None) -> None:
+    """
+    Stop the calculation once the energy error is below ``target_error``
+
+    The job is not killed, it stops by itself after ``STOP_FILE`` was
+    written, so the monitor never returns a result. The new blocks of
+    ``fort.12`` are kept in ``CACHE_DIR`` between the checks.
+
+    :param target_error: requested error of the energy
+    :param eq: number of blocks discarded as equilibration
+    :param reb: bin length, determined automatically if not given
+    :param min_blocks: number of blocks after equilibration before the run can be stopped
+    :param max_drift: stop the run if the means of the two halves of the run
+        differ by more than this number of combined error bars
+    """
+    check_target_error(node, transport, target_error=target_error, eq=eq, reb=reb,
+                       min_blocks=min_blocks, max_drift=max_drift)
+    return None
+
+def poll_target_error(node, **kwargs):
+    """
+    :func:`target_error` for a job running without the monitors of the engine
+
+    Nothing calls it on aiida-core 1.x, it has to be called periodically,
+    e.g. by a cron job running ``verdi run``.
+
+    :param node: the running VMC or LRDMC CalcJobNode
+    :param kwargs: parameters of :func:`target_error`
+    :returns: reason written to ``STOP_FILE``, ``None`` if the job continues or is stopping already
+    """
+    with node.get_transport() as transport:
+        return check_target_error(node, transport, **kwargs)
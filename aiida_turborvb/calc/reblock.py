@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Native re-analysis of finished VMC and LRDMC calculations
+"""
+
+import numpy as np
+from aiida.orm import Float, ArrayData, SinglefileData, FolderData
+from aiida.engine import calcfunction
+from aiida_turborvb.auxiliary.fort12 import ( analyse_fort12, Fort12Reader )
+from aiida_turborvb.auxiliary.reblocking import analyse
+
+def reblocking_to_array(result):
+    """
+    Store the blocking analysis returned by ``analyse`` in ArrayData
+    """
+    ret = ArrayData()
+    for key, value in result["reblocking"].items():
+        ret.set_array(key, value)
+    ret.set_attribute("eq", result["eq"])
+    ret.set_attribute("reb", result["reb"])
+    return ret
+
+def correcting_factors_to_array(result):
+    """
+    Store the result of ``correcting_factor_analysis`` in ArrayData
+    """
+    ret = ArrayData()
+    for key in ("factors", "energy", "energy_err"):
+        ret.set_array(key, result[key])
+    ret.set_attribute("eq", result["eq"])
+    ret.set_attribute("reb", result["reb"])
+    return ret
+
+def result_to_outputs(result):
+    """
+    Convert result of ``analyse`` to the outputs of the wrapper CalcJobs
+    """
+    ret = { "energy"     : Float(result["energy"]),
+            "energy_err" : Float(result["energy_err"]),
+            "reblocking" : reblocking_to_array(result) }
+    if "variance" in result:
+        ret["variance_square"] = Float(result["variance"])
+        ret["variance_square_err"] = Float(result["variance_err"])
+    return ret
+
+@calcfunction
+def reblock_fort12(fort12, parameters):
+    """
+    Reblock ``fort.12`` of a finished calculation with new ``eq``/``reb``
+
+    Parameters are ``kind`` (``vmc`` or ``lrdmc``), ``eq`` and ``reb``,
+    if ``reb`` is missing it is determined automatically.
+    """
+    p = parameters.get_dict()
+    with fort12.open(mode='rb') as handle:
+        result = analyse_fort12(handle,
+                                kind=p.get("kind", "vmc"),
+                                eq=p.get("eq", 0),
+                                reb=p.get("reb", None))
+    return result_to_outputs(result)
+
+def segment_columns(node, kind="vmc"):
+    """
+    Named columns of one run, from ``fort12`` (SinglefileData), ``blockdata``
+    (ArrayData) or fort.12 in the ``retrieved`` folder of an interrupted run
+    """
+    if isinstance(node, (SinglefileData, FolderData)):
+        args = ("fort.12", ) if isinstance(node, FolderData) else ()
+        with node.open(*args, mode='rb') as handle:
+            with Fort12Reader(handle, kind=kind) as reader:
+                return { key : value.copy() for key, value in reader.get_columns().items() }
+    return { key : node.get_array(key) for key in node.get_arraynames() }
+
+def merge_segments(segments, kind="vmc"):
+    """
+    Concatenated columns of consecutive runs
+
+    :param segments: ``fort12``, ``blockdata`` or ``retrieved`` nodes in the order of the runs
+    :returns: merged columns and the number of blocks of every segment
+    """
+    columns = [ segment_columns(node, kind) for node in segments ]
+    merged = {}
+    for key in columns[0]:
+        merged[key] = np.concatenate([ x[key] for x in columns ])
+    return merged, [ len(x["energy"]) for x in columns ]
+
+def analyse_segments(segments, kind="vmc", eq=0, reb=None):
+    """
+    Reblock consecutive runs together without storing anything
+
+    ``eq`` is applied at the start of the first segment only.
+
+    :returns: result of ``analyse``
+    """
+    merged, _ = merge_segments(segments, kind)
+    return analyse(merged["energy"],
+                   weights=merged.get("weight"),
+                   energy_square=merged.get("energy_square"),
+                   eq=eq,
+                   reb=reb)
+
+@calcfunction
+def merge_blockdata(parameters, **segments):
+    """
+    Merge block data of consecutive runs and reblock them together
+
+    Segments are ``fort12``, ``blockdata`` or ``retrieved`` outputs labeled ``segment_<i>``
+    in the order of the runs. ``eq`` is applied at the start of the first
+    segment only. Parameters are ``kind``, ``eq`` and ``reb`` as for
+    :func:`reblock_fort12`.
+
+    :returns: outputs of :func:`result_to_outputs` and the merged ``blockdata``
+    """
+    p = parameters.get_dict()
+    labels = sorted(segments.keys(), key=lambda x: int(x.split("_")[-1]))
+    merged, lengths = merge_segments([ segments[label] for label in labels ], p.get("kind", "vmc"))
+
+    result = analyse(merged["energy"],
+                     weights=merged.get("weight"),
+                     energy_square=merged.get("energy_square"),
+                     eq=p.get("eq", 0),
+                     reb=p.get("reb", None))
+    ret = result_to_outputs(result)
+    blockdata = ArrayData()
+    for key, value in merged.items():
+        blockdata.set_array(key, value)
+    blockdata.set_attribute("segments", lengths)
+    ret["blockdata"] = blockdata
+    return ret
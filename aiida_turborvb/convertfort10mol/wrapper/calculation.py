@@ -5,6 +5,7 @@
 from aiida.common import datastructures
 from aiida.engine import CalcJob
 from aiida.orm import SinglefileData, Dict, Str, StructureData
+from aiida_turborvb.auxiliary.submission import ( stage_inputs, input_commands )
 
 class TurboRVBConvertfort10molCalculationWRP(CalcJob):
     """
@@ -28,6 +29,7 @@ class TurboRVBConvertfort10molCalculationWRP(CalcJob):
         spec.input('fort10', valid_type=SinglefileData, help='')
         spec.input('pseudo', valid_type=SinglefileData, required=False, help='')
         spec.input('parameters', valid_type=Dict, help='')
+        spec.input('input_template', valid_type=SinglefileData, required=False, help='Input file previously generated by Turbo-Genius, rendered without calling Turbo-Genius on the compute node')
 
         spec.output('fort10', valid_type=SinglefileData, help='')
 
@@ -48,24 +50,11 @@ class TurboRVBConvertfort10molCalculationWRP(CalcJob):
 
         parameters = self.inputs.parameters.get_dict()
 
-        with folder.open("fort.10_in", "w") as fhandle_out, \
-             self.inputs.fort10.open() as fhandle_in:
-            fhandle_out.write(fhandle_in.read())
-
-        if "pseudo" in self.inputs:
-            with folder.open("pseudo.dat", "w") as fhandle_out, \
-                 self.inputs.pseudo.open() as fhandle_in:
-                fhandle_out.write(fhandle_in.read())
-
         with folder.open(self.options.input_filename, "w") as fhandle:
             content = []
-            content.append('turbo-genius.sh -j convertfort10mol -g')
-            if "namelist_update" in parameters:
-                content.append("cp convertfort10mol.input source")
-                for key, value in parameters["namelist_update"].items():
-                    content.append("sed 's/\s*!\?"+key+"\s*=.*$/"+key+"="+f"{value}"+"/g' source > dest")
-                    content.append("cp dest source")
-                content.append("cp dest convertfort10mol.input")
+            content += input_commands(self, folder, 'turbo-genius.sh -j convertfort10mol -g',
+                                      "convertfort10mol.input", "convertfort10mol.input",
+                                      parameters.get("namelist_update", None))
             content.append('convertfort10mol.x < convertfort10mol.input > convertfort10mol.output')
 
             fhandle.write("\n".join(content))
@@ -78,6 +67,8 @@ class TurboRVBConvertfort10molCalculationWRP(CalcJob):
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
+        calcinfo.local_copy_list = stage_inputs(self.inputs, (("fort10", "fort.10_in"),
+                                                              ("pseudo", "pseudo.dat")))
 
         calcinfo.retrieve_list = ["fort.10_new",
                                   self.options.output_filename]
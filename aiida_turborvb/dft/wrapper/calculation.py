@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_turborvb turborvb main executable.
+"""
+from aiida.common import datastructures
+from aiida.engine import CalcJob
+from aiida.orm import SinglefileData, Dict, Float, List, StructureData
+from aiida_turborvb.auxiliary.submission import ( input_commands, box_argument )
+from aiida_turborvb.auxiliary.launcher import ( launcher_settings, environment_commands, launch_command )
+
+parameters_help = """
+Input parameters: basis, basisjas and pseudo for makefort10, grid, box, doublegrid,
+occupation_update and prep_namelist_update for prep and cf10m_namelist_update for convertfort10mol
+"""
+
+class TurboRVBDFTCalculationWRP(CalcJob):
+    """
+    AiiDA calculation plugin for TurboRVB.
+
+    Runs makefort10, assembling pseudo, convertfort10mol and prep in one
+    job. The intermediate fort.10 files stay on the compute node, only
+    the results of prep and the pseudo potential are retrieved.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        # set default values for AiiDA options
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('structure', valid_type=StructureData, help='Input structure')
+        spec.input('parameters', valid_type=Dict, help=parameters_help)
+        spec.input('pseudo', valid_type=SinglefileData, required=False, help='Assembled pseudo potential, assembling pseudo is skipped if given')
+
+        spec.output('fort10', valid_type=SinglefileData, help='Output fort.10 file with optimized molecular orbitals')
+        spec.output('pseudo', valid_type=SinglefileData, required=False, help='Assembled pseudo potential, only if it was not given as input')
+        spec.output('occfile', valid_type=SinglefileData, help='File containing occupations of molecular orbitals')
+        spec.output('energy', valid_type=Float, help='Final SCF energy')
+        spec.output('convergance', valid_type=List, help='Energy convergance')
+
+        spec.inputs['metadata']['options']['parser_name'].default = 'turborvb.dftwrp'
+        spec.inputs['metadata']['options']['input_filename'].default = 'execute.sh'
+        spec.inputs['metadata']['options']['output_filename'].default = 'execute.out'
+
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+        spec.exit_code(501, 'ERROR_SCF_NOT_CONVERGED', message='Calculation did not converged.')
+
+    def default_box(self):
+        """
+        Box of the structure with 15 angstrom of vacuum, in bohr
+        """
+        import numpy as np
+        positions = self.inputs.structure.get_ase().get_positions()
+        difference = np.max(positions, axis = 0) - np.min(positions, axis = 0)
+        return [ float(x) for x in (difference + 15) * 1.8897259886 ]
+
+    def prepare_for_submission(self, folder):
+        """
+        Create input files.
+
+        :param folder: an `aiida.common.folders.Folder` where the plugin should temporarily place all files
+            needed by the calculation.
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
+
+        resources = self.inputs.metadata['options']['resources']
+        parameters = self.inputs.parameters.get_dict()
+
+        structure_filename = "structure.xyz"
+        with folder.open(structure_filename, "w") as fhandle:
+            self.inputs.structure.get_ase().write(fhandle)
+
+        with folder.open(self.options.input_filename, "w") as fhandle:
+            content = []
+            launcher = launcher_settings(self)
+            content += environment_commands(launcher)
+            mpiproc = resources['num_machines'] * resources['num_mpiprocs_per_machine']
+
+            # makefort10
+            tg_command = f'turbo-genius.sh -j makefort10 -g '
+            tg_command += f' -str {structure_filename}'
+            if "basis" in parameters:
+                tg_command += f' -basis {parameters["basis"]}'
+            if "basisjas" in parameters:
+                tg_command += f' -basisjas {parameters["basisjas"]}'
+            if "pseudo" in parameters:
+                tg_command += f' -pp {parameters["pseudo"]}'
+            content.append(tg_command)
+            content.append('makefort10.x < makefort10.input > makefort10.output')
+            content.append('mv fort.10_new fort.10_makefort10')
+
+            # assembling pseudo
+            if "pseudo" in parameters and "pseudo" not in self.inputs:
+                content.append('cp fort.10_makefort10 fort.10')
+                content.append(f'echo {parameters["pseudo"]} | assembling_pseudo.x > assembling_pseudo.output')
+
+            # convertfort10mol
+            content.append('cp fort.10_makefort10 fort.10_in')
+            content += input_commands(self, folder, 'turbo-genius.sh -j convertfort10mol -g',
+                                      "convertfort10mol.input", "convertfort10mol.input",
+                                      parameters.get("cf10m_namelist_update", None))
+            content.append('convertfort10mol.x < convertfort10mol.input > convertfort10mol.output')
+            content.append('mv fort.10_new fort.10')
+
+            # prep
+            tg_command = 'turbo-genius.sh -j prep -g'
+            if parameters.get("doublegrid", False):
+                tg_command += " --doublegrid"
+            if "grid" in parameters:
+                tg_command += f" -grid {parameters['grid']}"
+            tg_command += box_argument(parameters.get("box", self.default_box()))
+
+            updates = dict(parameters.get("prep_namelist_update", {}))
+            occupations = None
+            if isinstance(parameters.get("occupation_update", None), list):
+                occupations = parameters["occupation_update"]
+                updates["nelocc"] = len(occupations)
+
+            content += input_commands(self, folder, tg_command, "prep.input", "prep.input",
+                                      updates if updates else None, occupations)
+            content.append(launch_command(launcher, mpiproc, 'prep-mpi.x < prep.input > prep.output'))
+
+            fhandle.write("\n".join(content))
+
+        codeinfo = datastructures.CodeInfo()
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.cmdline_params = []
+        codeinfo.stdin_name = f"{self.inputs.metadata.options.input_filename}"
+        codeinfo.stdout_name = f"{self.inputs.metadata.options.output_filename}"
+
+        calcinfo = datastructures.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        calcinfo.local_copy_list = []
+        if "pseudo" in self.inputs:
+            calcinfo.local_copy_list.append((self.inputs.pseudo.uuid,
+                                             self.inputs.pseudo.filename,
+                                             "pseudo.dat"))
+        calcinfo.retrieve_list = ["fort.10_new",
+                                  "occupationlevels.dat",
+                                  "prep.output",
+                                  self.options.output_filename]
+        if "pseudo" in parameters and "pseudo" not in self.inputs:
+            calcinfo.retrieve_list.append("pseudo.dat")
+
+
+        return calcinfo
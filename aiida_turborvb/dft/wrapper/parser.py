@@ -0,0 +1,49 @@
+from aiida.engine import ExitCode
+from aiida.parsers.parser import Parser
+from aiida.orm import Float, SinglefileData, List
+from aiida_turborvb.prep.wrapper.parser import read_prep_output
+
+class TurboRVBDFTParserWRP(Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        output_filename = "prep.output"
+
+        files_retrieved = self.retrieved.list_object_names()
+        try:
+            with self.retrieved.open("fort.10_new", 'rb') as handle:
+                output_10 = SinglefileData(file=handle)
+            with self.retrieved.open("occupationlevels.dat", 'rb') as handle:
+                occfile = SinglefileData(file=handle)
+            with self.retrieved.open(output_filename, 'r') as handle:
+                energy, convergance, not_converged = read_prep_output(handle)
+            if "pseudo.dat" in files_retrieved:
+                with self.retrieved.open("pseudo.dat", 'rb') as handle:
+                    self.out('pseudo', SinglefileData(file=handle))
+        except FileNotFoundError:
+            return ExitCode(300)
+
+        self.out('fort10', output_10)
+        self.out('occfile', occfile)
+        self.out('energy', Float(energy))
+        self.out('convergance', List(list=convergance))
+
+        if not_converged:
+            return ExitCode(501)
+
+        return ExitCode(0)
@@ -11,6 +11,7 @@ from aiida_turborvb.auxiliary import NamelistHolder
 BasisSet = DataFactory("gaussian.basisset")
 BasisSetFree = DataFactory("gaussian.basissetfree")
 
+# Templates of the namelists, cloned for every calculation
 nh_system = NamelistHolder("system")
 nh_system.add_value("posunits", str, "bohr")
 nh_system.add_value("natoms", int, 1)
@@ -39,6 +40,11 @@ nh_symmetries.add_value("rot_det", bool, True)
 nh_symmetries.add_value("symmagp", bool, True, True)
 nh_symmetries.add_value("nosym_contr", bool, True, True)
 
+nh_system_template = nh_system.freeze()
+nh_electrons_template = nh_electrons.freeze()
+nh_symmetries_template = nh_symmetries.freeze()
+del nh_system, nh_electrons, nh_symmetries
+
 class TurboRVBMakefort10CalculationSA(CalcJob):
     """
     AiiDA calculation plugin for TurboRVB.
@@ -126,20 +132,18 @@ class TurboRVBMakefort10CalculationSA(CalcJob):
         except:
             pass
 
-        nh_electrons.update("twobody", -15)
+        nh_system = nh_system_template.clone()
+        nh_electrons = nh_electrons_template.clone()
+        nh_symmetries = nh_symmetries_template.clone()
+
         if pseudo:
             nh_electrons.update("twobody", -6)
-        nh_system.update("natoms", len(ase_structure))
-        nh_system.update("ntyp", len(atom_types))
+        nh_system.update_many({ "natoms" : len(ase_structure),
+                                "ntyp"   : len(atom_types) })
 
         if "namelist_update" in parameters:
-            for key, value in parameters["namelist_update"].items():
-                if key in nh_system.get_keys():
-                    nh_system.update(key, value)
-                if key in nh_electrons.get_keys():
-                    nh_electrons.update(key, value)
-                if key in nh_symmetries.get_keys():
-                    nh_symmetries.update(key, value)
+            for nh in (nh_system, nh_electrons, nh_symmetries):
+                nh.update_many(parameters["namelist_update"], ignore_missing=True)
 
         with folder.open(self.options.input_filename, "w") as fhandle:
             nh_system.dump(fhandle)
@@ -0,0 +1,30 @@
+"""
+Mock TurboRVB for testing workflows on a laptop, see :mod:`.executables`.
+"""
+import os
+import stat
+import sys
+
+#: Names of the installed scripts, see :func:`.executables.main`
+TOOLS = ( "turbo-genius.sh", "turborvb-mpi.x", "prep-mpi.x", "mock-mpirun" )
+
+def install_mock(directory, python=None):
+    """
+    Write the mock executables as scripts into ``directory``
+
+    Put the directory first in ``PATH`` (e.g. in ``prepend_text`` of the
+    code) and use ``{"command": "mock-mpirun"}`` as the launcher.
+
+    :param python: interpreter with aiida_turborvb installed, the current one by default
+    :returns: list of the written paths
+    """
+    python = python or sys.executable
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for tool in TOOLS:
+        path = os.path.join(directory, tool)
+        with open(path, "w") as fhandle:
+            fhandle.write(f'#!/bin/sh\nexec {python} -m aiida_turborvb.mock.executables {tool} "$@"\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        paths.append(path)
+    return paths
@@ -0,0 +1,247 @@
+"""
+Mock TurboRVB executables for running the wrapper CalcJobs without TurboRVB.
+
+The mock ``turborvb-mpi.x`` reads the ``ngen``, ``nw``, ``nweight`` and
+``iopt`` of its namelist input, writes Gaussian block energies to
+``fort.12`` together with ``fort.11`` and ``turborvb.scratch``, and spends
+a modelled amount of time::
+
+    overhead + ngen * nw * step_time / (nprocs * threads * thread_efficiency)
+
+The model is set by environment variables:
+
+``MOCK_TURBORVB_STEP_TIME``
+    seconds of one walker step on one core (default 1e-5)
+``MOCK_TURBORVB_OVERHEAD``
+    serial seconds of every run (default 0.05)
+``MOCK_TURBORVB_THREAD_EFFICIENCY``
+    efficiency of every OpenMP thread beyond the first (default 0.8)
+``MOCK_TURBORVB_ENERGY`` and ``MOCK_TURBORVB_SIGMA``
+    exact energy and spread of the local energy (default -1.0 and 0.5)
+``MOCK_TURBORVB_SEED``
+    seed of the random numbers (default 0)
+``MOCK_TURBORVB_SCRATCH_BYTES``
+    size of every file of ``turborvb.scratch`` (default 64)
+
+Optimization inputs (``itestr4 = -9``) also write ``story.d`` with one
+line per optimization step. The mock ``prep-mpi.x`` writes
+``fort.10_new``, ``occupationlevels.dat`` and a converging SCF with
+``maxit`` iterations to its output.
+
+The number of MPI processes is passed by ``mock-mpirun`` and the number of
+threads is taken from ``OMP_NUM_THREADS``. The mock ``turbo-genius.sh``
+generates the VMC optimization, VMC, LRDMC and prep inputs and
+post-processes ``fort.12`` into ``pip0.d`` or ``pip0_fn.d`` with the
+native reblocking.
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+from aiida_turborvb.auxiliary.fort12 import Fort12Reader
+from aiida_turborvb.auxiliary.reblocking import analyse
+from .synthetic import ( write_records, write_scratch, write_story, write_fort10, write_text,
+                         prep_output_text )
+
+#: Environment variable with the number of MPI processes set by mock-mpirun
+NPROCS_VARIABLE = "MOCK_TURBORVB_NPROCS"
+
+_KEY = re.compile(r"^\s*([A-Za-z_]\w*)\s*=\s*([^,!\s/]+)")
+
+VMC_INPUT = """&simulation
+    itestr4=-4
+    iopt=1
+    ngen=1000
+    !nw=1
+    nweight=10
+/
+&pseudo
+/
+&vmc
+/
+&readio
+/
+&parameters
+/
+"""
+
+LRDMC_INPUT = """&simulation
+    itestr4=-6
+    iopt=1
+    ngen=1000
+    !nw=1
+    nweight=10
+/
+&pseudo
+/
+&dmclrdmc
+    tbra=0.1
+    etry=-1.0
+/
+&readio
+/
+&parameters
+/
+"""
+
+VMCOPT_INPUT = """&simulation
+    itestr4=-9
+    iopt=1
+    ngen=1000
+    !nw=1
+    nweight=10
+/
+&pseudo
+/
+&vmc
+/
+&optimization
+    tpar=0.35
+/
+&readio
+/
+&parameters
+/
+"""
+
+PREP_INPUT = """&simulation
+    itestr4=-4
+/
+&pseudo
+/
+&dft
+    maxit=50
+/
+&molecul
+/
+"""
+
+#: Input generated by ``turbo-genius.sh -j <job> -g`` and results of ``-post``
+JOBS = { "vmc"    : ("datasvmc.input", VMC_INPUT, "pip0.d"),
+         "lrdmc"  : ("datasfn.input", LRDMC_INPUT, "pip0_fn.d"),
+         "vmcopt" : ("datasmin.input", VMCOPT_INPUT, None),
+         "prep"   : ("prep.input", PREP_INPUT, None) }
+
+def model(name, default):
+    return float(os.environ.get(f"MOCK_TURBORVB_{name}", default))
+
+def read_namelist(text):
+    """
+    Values of the uncommented ``key=value`` lines of a namelist input
+    """
+    ret = {}
+    for line in text.splitlines():
+        match = _KEY.match(line)
+        if match:
+            ret[match.group(1).lower()] = match.group(2)
+    return ret
+
+def run_qmc(stdin, stdout):
+    """
+    Mock ``turborvb-mpi.x``
+    """
+    namelist = read_namelist(stdin.read())
+    nprocs = int(os.environ.get(NPROCS_VARIABLE, 1))
+    threads = int(os.environ.get("OMP_NUM_THREADS", 1))
+    ngen = int(namelist.get("ngen", 1000))
+    nw = int(namelist.get("nw", nprocs))
+    nweight = max(int(namelist.get("nweight", 10)), 1)
+    iopt = int(namelist.get("iopt", 1))
+    lrdmc = "etry" in namelist
+
+    speed = nprocs * (1.0 + (threads - 1) * model("THREAD_EFFICIENCY", 0.8))
+    time.sleep(model("OVERHEAD", 0.05) + ngen * nw * model("STEP_TIME", 1e-5) / speed)
+
+    rng = np.random.default_rng(int(model("SEED", 0)) + (0 if iopt else os.getpid()))
+    nblocks = ngen // nweight
+    sigma = model("SIGMA", 0.5) / np.sqrt(nweight * nw)
+    energy = model("ENERGY", -1.0) + sigma * rng.standard_normal(nblocks)
+    weight = rng.uniform(0.9, 1.1, nblocks) if lrdmc else np.ones(nblocks)
+    energy_square = energy**2 + model("SIGMA", 0.5)**2
+    write_records("fort.12", np.stack([weight, energy, energy_square], axis=1),
+                  append=(iopt == 0 and os.path.exists("fort.12")))
+
+    write_text("fort.11", f"{ngen} {nw}\n")
+    write_scratch("turborvb.scratch", nprocs, int(model("SCRATCH_BYTES", 64)), rng=rng)
+    if namelist.get("itestr4", None) == "-9":
+        write_story("story.d", nblocks, rng=rng)
+
+    stdout.write(f" Number of processors = {nprocs}\n")
+    stdout.write(f" Number of walkers = {nw}\n")
+    stdout.write(f" Number of generations = {ngen}\n")
+    stdout.write(f" Energy = {energy.mean()}\n")
+
+def run_prep(stdin, stdout):
+    """
+    Mock ``prep-mpi.x``
+    """
+    namelist = read_namelist(stdin.read())
+    iterations = int(namelist.get("maxit", 50))
+    time.sleep(model("OVERHEAD", 0.05))
+    if os.path.exists("fort.10"):
+        shutil.copy("fort.10", "fort.10_new")
+    else:
+        write_fort10("fort.10_new")
+    write_text("occupationlevels.dat", "1 2\n")
+    stdout.write(prep_output_text(iterations))
+
+def turbo_genius(argv):
+    """
+    Mock ``turbo-genius.sh``, ``-j vmcopt|vmc|lrdmc|prep`` with ``-g`` or ``-post``
+    """
+    job = argv[argv.index("-j") + 1]
+    generated, template, post = JOBS[job]
+    if "-g" in argv:
+        with open(generated, "w") as fhandle:
+            fhandle.write(template)
+    if "-post" in argv and job == "vmcopt":
+        for name in ("fort.10_org", "fort.10_averaged"):
+            shutil.copy("fort.10", name)
+        write_text("forces.dat", "")
+    elif "-post" in argv and post is not None:
+        eq = int(argv[argv.index("-eq") + 1]) if "-eq" in argv else 0
+        reb = int(argv[argv.index("-reb") + 1]) if "-reb" in argv else None
+        with Fort12Reader("fort.12", kind=job) as reader:
+            data = reader.get_columns()
+            result = analyse(data["energy"],
+                             weights=data["weight"],
+                             energy_square=data["energy_square"],
+                             eq=eq,
+                             reb=reb)
+        with open(post, "w") as fhandle:
+            fhandle.write(f" number of bins = {result['nbins']}\n")
+            fhandle.write(f" Energy = {result['energy']} {result['energy_err']}\n")
+            fhandle.write(f" Variance square = {result['variance']} {result['variance_err']}\n")
+
+def mpirun(argv):
+    """
+    Mock ``mpirun``, the executable is the last argument, ``-np``/``-n``
+    is passed in the environment and other flags are ignored
+    """
+    nprocs = 1
+    for flag in ("-np", "-n"):
+        if flag in argv:
+            nprocs = int(argv[argv.index(flag) + 1])
+    env = dict(os.environ, **{ NPROCS_VARIABLE : str(nprocs) })
+    return subprocess.call([argv[-1]], env=env)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    tool, args = argv[0], argv[1:]
+    if tool == "turbo-genius.sh":
+        turbo_genius(args)
+    elif tool == "turborvb-mpi.x":
+        run_qmc(sys.stdin, sys.stdout)
+    elif tool == "prep-mpi.x":
+        run_prep(sys.stdin, sys.stdout)
+    elif tool == "mock-mpirun":
+        return mpirun(args)
+    else:
+        raise ValueError(f"Unknown mock executable {tool}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Synthetic TurboRVB output files of configurable size.
+
+The files have the layout read by the parsers, their content is random:
+``fort.12`` holds Gaussian block energies, ``prep.output`` a converging
+SCF and ``turborvb.scratch`` one file of ``scratch_bytes`` per process.
+They are written by the mock executables and by the benchmarks, see
+:data:`DEFAULT_SIZE` for the parameters.
+"""
+import os
+import numpy as np
+
+#: Default size of the synthetic outputs
+DEFAULT_SIZE = { "nblocks"       : 1000,   # records of fort.12
+                 "nel"           : 16,     # electrons of fort.10
+                 "nshell"        : 40,     # basis shells of fort.10
+                 "iterations"    : 50,     # SCF iterations of prep, steps of story.d
+                 "nprocs"        : 4,      # files of turborvb.scratch
+                 "scratch_bytes" : 65536,  # size of every scratch file
+                 "tasks"         : 4 }     # tasks of packed calculations
+
+def get_size(size=None):
+    ret = dict(DEFAULT_SIZE)
+    ret.update(size or {})
+    return ret
+
+def task_labels(ntasks):
+    """
+    Labels of the tasks of packed calculations, task ``label`` runs in ``task_<label>``
+    """
+    return [ f"t{ii}" for ii in range(ntasks) ]
+
+def write_records(filename, data, append=False):
+    """
+    Write rows of ``data`` as Fortran unformatted sequential records
+    """
+    data = np.ascontiguousarray(data, dtype="<f8")
+    marker = np.int32(data.shape[1] * 8).tobytes()
+    with open(filename, "ab" if append else "wb") as fhandle:
+        for row in data:
+            fhandle.write(marker + row.tobytes() + marker)
+
+def block_energies(nblocks, energy=-1.0, sigma=0.01, weighted=False, rng=None):
+    """
+    Columns weight, energy and energy square of ``nblocks`` blocks
+    """
+    rng = rng or np.random.default_rng(0)
+    values = energy + sigma * rng.standard_normal(nblocks)
+    weight = rng.uniform(0.9, 1.1, nblocks) if weighted else np.ones(nblocks)
+    return np.stack([weight, values, values**2 + 0.25], axis=1)
+
+def write_fort12(filename, nblocks, weighted=False, rng=None, append=False):
+    write_records(filename, block_energies(nblocks, weighted=weighted, rng=rng), append=append)
+
+def write_fort10(filename, nel=16, nshell=40):
+    """
+    ``fort.10`` with a valid header and ``nshell`` lines of basis exponents
+    """
+    nion = max(nel // 4, 1)
+    lines = [" # Nelup  #Nel  # Ion",
+             f"{(nel + 1) // 2:12d}{nel:12d}{nion:12d}",
+             " # Shell Det.   # Shell Jas.",
+             f"{nshell:12d}{nshell // 2:12d}",
+             " # Jas 2body  # Det   #  3 body atomic par.",
+             f"{-6:12d}{nshell:12d}{nshell * 2:12d}",
+             " # Parameters det. Exponents"]
+    lines += [ f"{ii % nion + 1:12d}{1:12d}{0.1 * (ii + 1):24.12f}" for ii in range(nshell) ]
+    with open(filename, "w") as fhandle:
+        fhandle.write("\n".join(lines) + "\n")
+
+def write_pip0(filename, energy=-1.0, energy_err=0.001, variance=0.25, variance_err=0.001, nbins=50):
+    with open(filename, "w") as fhandle:
+        fhandle.write(f" number of bins = {nbins}\n")
+        fhandle.write(f" Energy = {energy} {energy_err}\n")
+        fhandle.write(f" Variance square = {variance} {variance_err}\n")
+
+def prep_output_text(iterations=50, energy=-1.1, converged=True):
+    """
+    ``prep.output`` with ``iterations`` SCF iterations read by ``read_prep_output``
+    """
+    lines = [" Turbo-DFT prep mock output"]
+    for ii in range(iterations):
+        delta = 0.1 * 0.7**ii
+        lines.append(f" Iter,E,xc,corr {ii + 1:8d} {-0.5:18.10f} {-0.03:18.10f} {delta:18.10f} {energy + delta:18.10f}")
+    if converged:
+        lines.append(f" Final self consistent energy (Ha) = {energy:18.10f}")
+    else:
+        lines.append(" Warning Turbo-DFT  terminates without convergence")
+    return "\n".join(lines) + "\n"
+
+def write_prep_output(filename, iterations=50, energy=-1.1, converged=True):
+    write_text(filename, prep_output_text(iterations, energy, converged))
+
+def write_story(filename, iterations=50, nparams=20, rng=None):
+    """
+    ``story.d`` of a VMC optimization, one line per optimization step
+    """
+    rng = rng or np.random.default_rng(0)
+    with open(filename, "w") as fhandle:
+        for ii in range(iterations):
+            values = " ".join([ f"{x:14.8f}" for x in rng.standard_normal(nparams) * 0.01 ])
+            fhandle.write(f"{ii + 1:8d} {-1.0 + 0.1 * 0.9**ii:16.10f} {0.001:12.8f} {values}\n")
+
+def write_scratch(directory, nprocs=4, scratch_bytes=65536, rng=None):
+    """
+    ``turborvb.scratch`` with one random file per process
+    """
+    rng = rng or np.random.default_rng(0)
+    os.makedirs(directory, exist_ok=True)
+    for rank in range(nprocs):
+        with open(os.path.join(directory, f"randseed.{rank:06d}"), "wb") as fhandle:
+            fhandle.write(rng.bytes(scratch_bytes))
+
+def write_text(filename, text):
+    with open(filename, "w") as fhandle:
+        fhandle.write(text)
+
+def write_outputs(kind, directory, size=None, marker=None):
+    """
+    Write the retrieved files of a wrapper calculation
+
+    :param kind: ``vmc``, ``lrdmc``, ``vmclrdmc``, ``vmcopt``, ``prep``,
+        ``dft``, ``makefort10``, ``convertfort10mol``, ``assemblingpseudo``,
+        ``packed_vmc`` or ``packed_prep``
+    :param directory: existing directory
+    :param size: see :data:`DEFAULT_SIZE`
+    :param marker: last line of ``execute.out`` of finished jobs
+    """
+    size = get_size(size)
+    path = lambda name: os.path.join(directory, name)
+    rng = np.random.default_rng(0)
+    output = "done\n" if marker is None else f"{marker}\n"
+
+    if kind in ("vmc", "lrdmc", "vmclrdmc", "vmcopt"):
+        write_fort12(path("fort.12"), size["nblocks"], weighted=(kind != "vmc"), rng=rng)
+        write_text(path("fort.11"), f"{size['nblocks']}\n")
+        write_scratch(path("turborvb.scratch"), size["nprocs"], size["scratch_bytes"], rng=rng)
+        write_text(path("execute.out"), output)
+        write_text(path("walltime.dat"), "12.5\n")
+    if kind in ("vmc", "vmclrdmc"):
+        write_pip0(path("pip0.d"))
+    if kind in ("lrdmc", "vmclrdmc"):
+        write_pip0(path("pip0_fn.d"))
+    if kind == "vmcopt":
+        for name in ("fort.10_org", "fort.10_averaged"):
+            write_fort10(path(name), size["nel"], size["nshell"])
+        write_story(path("story.d"), size["iterations"], rng=rng)
+        write_text(path("forces.dat"), "".join([ f"{ii} 0.0 0.0 0.0\n" for ii in range(size["nel"]) ]))
+    if kind in ("prep", "dft"):
+        write_fort10(path("fort.10_new"), size["nel"], size["nshell"])
+        write_text(path("occupationlevels.dat"), "".join([ f"{ii + 1} 2\n" for ii in range(size["nel"] // 2) ]))
+        write_prep_output(path("prep.output"), size["iterations"])
+        write_text(path("execute.out"), output)
+    if kind in ("makefort10", "convertfort10mol"):
+        write_fort10(path("fort.10_new"), size["nel"], size["nshell"])
+        write_text(path("execute.out"), output)
+    if kind in ("assemblingpseudo", "dft"):
+        write_text(path("pseudo.dat"), "ECP\n" + "1.0 2.0 3.0\n" * size["nshell"])
+        write_text(path("execute.out"), output)
+    if kind in ("packed_vmc", "packed_prep"):
+        for label in task_labels(size["tasks"]):
+            task_dir = path(f"task_{label}")
+            os.makedirs(task_dir, exist_ok=True)
+            if kind == "packed_vmc":
+                write_fort12(os.path.join(task_dir, "fort.12"), size["nblocks"], rng=rng)
+                write_text(os.path.join(task_dir, "vmc.output"), "done\n")
+            else:
+                write_fort10(os.path.join(task_dir, "fort.10_new"), size["nel"], size["nshell"])
+                write_prep_output(os.path.join(task_dir, "prep.output"), size["iterations"])
+            write_text(os.path.join(task_dir, "run.log"), "")
+        write_text(path("execute.out"), output)
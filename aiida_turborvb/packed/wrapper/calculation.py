@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_turborvb turborvb main executable.
+"""
+from aiida.common import datastructures, exceptions
+from aiida.engine import CalcJob
+from aiida.orm import SinglefileData, Dict, Float, List
+from aiida_turborvb.auxiliary.submission import input_commands
+from aiida_turborvb.auxiliary.launcher import ( launcher_settings, concurrent_settings, environment_commands,
+                                              launch_command, hosts_commands, work_queue_commands )
+
+class TurboRVBPackedCalculationWRP(CalcJob):
+    """
+    AiiDA calculation plugin for TurboRVB.
+
+    Runs many small independent VMC or prep calculations inside one
+    scheduler allocation. Every task has its own ``task_<label>``
+    directory, the tasks are executed by a local work queue, each of them
+    with ``procs_per_task`` MPI processes on the hosts of its own slot.
+    """
+
+    # Commands of one task: Turbo-Genius job, generated input, input, executable, output
+    _kinds = { "vmc"  : ("vmc", "datasvmc.input", "vmc.input", "turborvb-mpi.x", "vmc.output"),
+               "prep" : ("prep", "prep.input", "prep.input", "prep-mpi.x", "prep.output") }
+
+    # Files retrieved from every task directory
+    _retrieve_files = { "vmc"  : ("fort.12", "vmc.output"),
+                        "prep" : ("fort.10_new", "prep.output") }
+
+    _task_script = "run.sh"
+
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        # set default values for AiiDA options
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('parameters', valid_type=Dict, help='Common input parameters, "kind" (vmc or prep), "procs_per_task" and per-task "tasks"')
+        spec.input_namespace('fort10', valid_type=SinglefileData, dynamic=True, help='Input fort.10 of every task, keyed by task label')
+        spec.input_namespace('pseudo', valid_type=SinglefileData, dynamic=True, required=False, help='Pseudo potential of every task, keyed by task label')
+        spec.input('input_template', valid_type=SinglefileData, required=False, help='Input file previously generated by Turbo-Genius, rendered without calling Turbo-Genius on the compute node')
+
+        spec.output_namespace('energy', valid_type=Float, dynamic=True, help='Energy of every finished task')
+        spec.output_namespace('energy_err', valid_type=Float, dynamic=True, help='Energy error of every finished VMC task')
+        spec.output_namespace('variance_square', valid_type=Float, dynamic=True, help='Variance of every finished VMC task')
+        spec.output_namespace('fort10', valid_type=SinglefileData, dynamic=True, help='Output fort.10 of every finished prep task')
+        spec.output_namespace('convergance', valid_type=List, dynamic=True, help='Energy convergance of every finished prep task')
+
+        spec.inputs['metadata']['options']['parser_name'].default = 'turborvb.packedwrp'
+        spec.inputs['metadata']['options']['input_filename'].default = 'execute.sh'
+        spec.inputs['metadata']['options']['output_filename'].default = 'execute.out'
+
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+        spec.exit_code(310, 'ERROR_TASKS_FAILED', message='Some of the packed tasks did not finish.')
+
+    def prepare_for_submission(self, folder):
+        """
+        Create input files.
+
+        :param folder: an `aiida.common.folders.Folder` where the plugin should temporarily place all files
+            needed by the calculation.
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
+
+        resources = self.inputs.metadata['options']['resources']
+        parameters = self.inputs.parameters.get_dict()
+
+        kind = parameters.get("kind", "vmc")
+        if kind not in self._kinds:
+            raise exceptions.InputValidationError(f"Unknown kind {kind}, use one of {list(self._kinds)}")
+        job, generated, target, executable, output = self._kinds[kind]
+
+        mpiproc = resources['num_machines'] * resources['num_mpiprocs_per_machine']
+        procs_per_task = parameters.get("procs_per_task", 1)
+        if procs_per_task > mpiproc:
+            raise exceptions.InputValidationError(f"procs_per_task {procs_per_task} is larger than {mpiproc} allocated processes")
+        slots = mpiproc // procs_per_task
+
+        launcher = launcher_settings(self)
+        # Every slot has its own hosts, tasks running at the same time must not share cores
+        if slots > 1:
+            launcher = concurrent_settings(launcher)
+        labels = sorted(self.inputs.fort10.keys())
+        tasks = parameters.get("tasks", {})
+        local_copy_list = []
+        for label in labels:
+            task_dir = f"task_{label}"
+            subfolder = folder.get_subfolder(task_dir, create=True)
+
+            updates = dict(parameters.get("namelist_update", {}))
+            updates.update(tasks.get(label, {}).get("namelist_update", {}))
+
+            content = input_commands(self, subfolder, f'turbo-genius.sh -j {job} -g', generated, target,
+                                     updates if updates else None)
+            content.append(launch_command(launcher, procs_per_task, f'{executable} < {target} > {output}', hostfile='$HOSTFILE'))
+            with subfolder.open(self._task_script, "w") as fhandle:
+                fhandle.write("\n".join(content))
+
+            fort10 = self.inputs.fort10[label]
+            local_copy_list.append((fort10.uuid, fort10.filename, f"{task_dir}/fort.10"))
+            if "pseudo" in self.inputs and label in self.inputs.pseudo:
+                pseudo = self.inputs.pseudo[label]
+                local_copy_list.append((pseudo.uuid, pseudo.filename, f"{task_dir}/pseudo.dat"))
+
+        with folder.open(self.options.input_filename, "w") as fhandle:
+            # Local work queue, at most `slots` tasks run at the same time
+            # Exports are inherited by the tasks
+            content = environment_commands(launcher)
+            content += hosts_commands(resources['num_machines'], resources['num_mpiprocs_per_machine'])
+            content += work_queue_commands(self._task_script, slots, procs_per_task)
+            fhandle.write("\n".join(content))
+
+        codeinfo = datastructures.CodeInfo()
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.cmdline_params = []
+        codeinfo.stdin_name = f"{self.inputs.metadata.options.input_filename}"
+        codeinfo.stdout_name = f"{self.inputs.metadata.options.output_filename}"
+
+        calcinfo = datastructures.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        calcinfo.local_copy_list = local_copy_list
+        # Depth 2 keeps the task directories in the retrieved folder
+        calcinfo.retrieve_list = [ (f"task_*/{name}", ".", 2) for name in self._retrieve_files[kind] + ("run.log", ) ]
+        calcinfo.retrieve_list.append(self.options.output_filename)
+
+
+        return calcinfo
@@ -0,0 +1,68 @@
+from aiida.engine import ExitCode
+from aiida.parsers.parser import Parser
+from aiida.orm import Float, SinglefileData, List
+from aiida_turborvb.auxiliary.fort12 import analyse_fort12
+from aiida_turborvb.prep.wrapper.parser import read_prep_output
+
+class TurboRVBPackedParserWRP(Parser):
+    """
+    Parser class for parsing output of calculation.
+
+    Every task is parsed separately, the outputs are attached to the
+    output namespaces under the label of the task.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+
+    def parse_vmc(self, label, task_dir, parameters):
+        with self.retrieved.open(f"{task_dir}/fort.12", 'rb') as handle:
+            result = analyse_fort12(handle,
+                                    kind="vmc",
+                                    eq=parameters.get("eq", 0),
+                                    reb=parameters.get("reb", None))
+        self.out(f'energy.{label}', Float(result["energy"]))
+        self.out(f'energy_err.{label}', Float(result["energy_err"]))
+        self.out(f'variance_square.{label}', Float(result["variance"]))
+
+    def parse_prep(self, label, task_dir, parameters):
+        with self.retrieved.open(f"{task_dir}/prep.output", 'r') as handle:
+            energy, convergance, not_converged = read_prep_output(handle)
+        if not_converged:
+            raise ValueError(f"Task {label} did not converge")
+        with self.retrieved.open(f"{task_dir}/fort.10_new", 'rb') as handle:
+            self.out(f'fort10.{label}', SinglefileData(file=handle))
+        self.out(f'energy.{label}', Float(energy))
+        self.out(f'convergance.{label}', List(list=convergance))
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        parameters = self.node.inputs.parameters.get_dict()
+        kind = parameters.get("kind", "vmc")
+        labels = sorted([ link.link_label.split("__", 1)[1]
+                          for link in self.node.get_incoming(link_label_filter="fort10__%").all() ])
+
+        failed = []
+        for label in labels:
+            task_dir = f"task_{label}"
+            try:
+                getattr(self, f"parse_{kind}")(label, task_dir, parameters)
+            except (FileNotFoundError, OSError, ValueError, IndexError) as exc:
+                self.logger.warning(f"Task {label} failed: {exc}")
+                failed.append(label)
+
+        if len(failed) == len(labels):
+            return ExitCode(300)
+        if failed:
+            return ExitCode(310)
+
+        return ExitCode(0)
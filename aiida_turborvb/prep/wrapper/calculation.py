@@ -2,10 +2,13 @@
 """
 Calculations provided by aiida_turborvb turborvb main executable.
 """
-from aiida.common import datastructures
+from aiida.common import datastructures, exceptions
 from aiida.engine import CalcJob
-from aiida.orm import SinglefileData, Dict, Str, Float, List
+from aiida.orm import SinglefileData, Dict, Str, Float, List, RemoteData
 from aiida.plugins import DataFactory
+from aiida_turborvb.auxiliary import remote_copy_entries
+from aiida_turborvb.auxiliary.submission import ( stage_inputs, input_commands, box_argument )
+from aiida_turborvb.auxiliary.launcher import ( launcher_settings, environment_commands, launch_command )
 
 class TurboRVBPrepCalculationWRP(CalcJob):
     """
@@ -15,6 +18,9 @@ class TurboRVBPrepCalculationWRP(CalcJob):
     for execution of quantum monte carlo calculations
     """
 
+    # Files taken from parent_folder, pairs of (source, destination)
+    _parent_folder_files = (("fort.10_new", "fort.10"), )
+
     @classmethod
     def define(cls, spec):
         """Define inputs and outputs of the calculation."""
@@ -27,8 +33,10 @@ class TurboRVBPrepCalculationWRP(CalcJob):
             'num_mpiprocs_per_machine': 1,
         }
         spec.input('parameters', valid_type=Dict, help='Input parameters')
-        spec.input('fort10', valid_type=SinglefileData, help='Input fort.10 file containing wavefunction information')
+        spec.input('fort10', valid_type=SinglefileData, required=False, help='Input fort.10 file containing wavefunction information')
         spec.input('pseudo', valid_type=SinglefileData, required=False, help='Input pseudo potential file')
+        spec.input('input_template', valid_type=SinglefileData, required=False, help='Input file previously generated by Turbo-Genius, rendered without calling Turbo-Genius on the compute node')
+        spec.input('parent_folder', valid_type=RemoteData, required=False, help='Remote folder of a previous DFT calculation, its fort.10_new is used as the initial fort.10')
 
         spec.output('fort10', valid_type=SinglefileData, help='Output fort.10 file with optimized molecular orbitals')
         spec.output('occfile', valid_type=SinglefileData, help='File containing occupations of molecular orbitals')
@@ -54,17 +62,14 @@ class TurboRVBPrepCalculationWRP(CalcJob):
         resources = self.inputs.metadata['options']['resources']
         parameters = self.inputs.parameters.get_dict()
 
-        with folder.open("fort.10", "w") as fhandle_out, \
-             self.inputs.fort10.open() as fhandle_in:
-            fhandle_out.write(fhandle_in.read())
-
-        if "pseudo" in self.inputs:
-            with folder.open("pseudo.dat", "w") as fhandle_out, \
-                 self.inputs.pseudo.open() as fhandle_in:
-                fhandle_out.write(fhandle_in.read())
+        # fort.10 of the parent calculation takes precedence over the input one
+        if "parent_folder" not in self.inputs and "fort10" not in self.inputs:
+            raise exceptions.InputValidationError("Either fort10 or parent_folder has to be provided")
 
         with folder.open(self.options.input_filename, "w") as fhandle:
             content = []
+            launcher = launcher_settings(self)
+            content += environment_commands(launcher)
             mpiproc = resources['num_machines'] * resources['num_mpiprocs_per_machine']
             tg_command = 'turbo-genius.sh -j prep -g'
 
@@ -77,40 +82,20 @@ class TurboRVBPrepCalculationWRP(CalcJob):
                 tg_command += f" -grid {grid}"
 
             if "box" in parameters:
-                box = parameters["box"]
-                if isinstance(box, (list, tuple)):
-                    if len(box) == 1:
-                        A = B = C = box[0]
-                    elif len(box) == 3:
-                        A, B, C = box
-                    else:
-                        raise Exception("Bad box")
-                elif isinstance(box, (int, float)):
-                    A = B = C = float(box)
-                else:
-                    raise Exception("Bad box")
-                tg_command += f" -box {A} {B} {C}"
-
-            content.append(tg_command)
-
-            if "occupation_update" in parameters:
-                content.append("cp prep.input source")
-                if isinstance(parameters["occupation_update"], list):
-                    if "namelist_update" not in parameters:
-                        parameters["namelist_update"] = {}
-                    parameters["namelist_update"]["nelocc"] = len(parameters["occupation_update"])
-                    occs = " ".join([str(x) for x in parameters["occupation_update"]])
-                    content.append("sed 's/^[012][012 ]*/"+occs+"/g' source > dest")
-                content.append("cp dest prep.input")
-
-            if "namelist_update" in parameters:
-                content.append("cp prep.input source")
-                for key, value in parameters["namelist_update"].items():
-                    content.append("sed 's/\s*!\?"+key+"\s*=.*$/"+key+"="+f"{value}"+"/g' source > dest")
-                    content.append("cp dest source")
-                content.append("cp dest prep.input")
-
-            content.append(f'mpirun -np {mpiproc} prep-mpi.x < prep.input > prep.output')
+                tg_command += box_argument(parameters["box"])
+
+            occupations = None
+            if isinstance(parameters.get("occupation_update", None), list):
+                occupations = parameters["occupation_update"]
+                if "namelist_update" not in parameters:
+                    parameters["namelist_update"] = {}
+                parameters["namelist_update"]["nelocc"] = len(occupations)
+
+            content += input_commands(self, folder, tg_command, "prep.input", "prep.input",
+                                      parameters.get("namelist_update", None), occupations,
+                                      options=("grid", "box", "doublegrid"))
+
+            content.append(launch_command(launcher, mpiproc, 'prep-mpi.x < prep.input > prep.output'))
 
             fhandle.write("\n".join(content))
 
@@ -122,9 +107,15 @@ class TurboRVBPrepCalculationWRP(CalcJob):
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
-        calcinfo.local_copy_list = [
-            (self.inputs.fort10.uuid, self.inputs.fort10.filename, "fort.10"),
-        ]
+        if "parent_folder" in self.inputs:
+            entries = remote_copy_entries(self.inputs.parent_folder, self._parent_folder_files)
+            if parameters.get("parent_folder_symlink", False):
+                calcinfo.remote_symlink_list = entries
+            else:
+                calcinfo.remote_copy_list = entries
+            calcinfo.local_copy_list = stage_inputs(self.inputs, (("pseudo", "pseudo.dat"), ))
+        else:
+            calcinfo.local_copy_list = stage_inputs(self.inputs)
         calcinfo.retrieve_list = ["fort.10_new",
                                   "occupationlevels.dat",
                                   "prep.output",
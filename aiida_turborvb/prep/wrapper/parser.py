@@ -5,6 +5,25 @@ from aiida.common import exceptions
 from aiida.orm import Float, SinglefileData, List
 import numpy as np
 
+def read_prep_output(handle):
+    """
+    Final energy, energies of SCF iterations and convergence flag from prep.output
+    """
+    energy = 0.0
+    convergance = []
+    not_converged = False
+    for line in handle:
+        if "Iter" in line:
+            try:
+                convergance.append(float(line.split()[5]))
+            except IndexError:
+                pass
+        if "inal self c" in line:
+            energy = line.split()[6]
+        if "Warning Turbo-DFT  terminates without convergence" in line:
+            not_converged = True
+    return energy, convergance, not_converged
+
 class TurboRVBPrepParserWRP(Parser):
     """
     Parser class for parsing output of calculation.
@@ -35,20 +54,8 @@ class TurboRVBPrepParserWRP(Parser):
             with self.retrieved.open("occupationlevels.dat", 'rb') as handle:
                 occfile = SinglefileData(file=handle)
 
-            energy = 0.0
-            convergance = []
-            not_converged = False
             with self.retrieved.open(output_filename, 'r') as handle:
-                for line in handle:
-                    if "Iter" in line:
-                        try:
-                            convergance.append(float(line.split()[5]))
-                        except IndexError:
-                            pass
-                    if "inal self c" in line:
-                        energy = line.split()[6]
-                    if "Warning Turbo-DFT  terminates without convergence" in line:
-                        not_converged = True
+                energy, convergance, not_converged = read_prep_output(handle)
 
             energy = Float(energy)
             convergance = List(list=convergance)
@@ -4,8 +4,22 @@ Calculations provided by aiida_turborvb turborvb main executable.
 """
 from aiida.common import datastructures
 from aiida.engine import CalcJob
-from aiida.orm import SinglefileData, Dict, Str, Float, List, FolderData
+from aiida.orm import SinglefileData, Dict, Str, Float, List, FolderData, ArrayData, RemoteData
 from aiida.plugins import DataFactory
+from aiida_turborvb.auxiliary import remote_copy_entries
+from aiida_turborvb.auxiliary.retrieval import ( split_retrieve_list,
+                                                  finished_command,
+                                                  timed_commands,
+                                                  WALLTIME_FILE,
+                                                  checkpoint_commands,
+                                                  CHECKPOINT_FILE,
+                                                  stoppable_command,
+                                                  STOP_FILE,
+                                                  scratch_commands,
+                                                  scratch_retrieve_name,
+                                                  SCRATCH_ARCHIVE )
+from aiida_turborvb.auxiliary.submission import ( stage_inputs, input_commands )
+from aiida_turborvb.auxiliary.launcher import ( launcher_settings, environment_commands, launch_command )
 
 class TurboRVBVmcCalculationWRP(CalcJob):
     """
@@ -15,6 +29,11 @@ class TurboRVBVmcCalculationWRP(CalcJob):
     for execution of quantum monte carlo calculations
     """
 
+    # Files taken from parent_folder, pairs of (source, destination)
+    _parent_folder_files = (("fort.11", "fort.11"),
+                            ("fort.12", "fort.12"),
+                            ("turborvb.scratch", "turborvb.scratch"))
+
     @classmethod
     def define(cls, spec):
         """Define inputs and outputs of the calculation."""
@@ -29,21 +48,31 @@ class TurboRVBVmcCalculationWRP(CalcJob):
         spec.input('parameters', valid_type=Dict, help='')
         spec.input('fort10', valid_type=SinglefileData, help='')
         spec.input('pseudo', valid_type=SinglefileData, required=False, help='')
+        spec.input('input_template', valid_type=SinglefileData, required=False, help='Input file previously generated by Turbo-Genius, rendered without calling Turbo-Genius on the compute node')
+        spec.input('parent_folder', valid_type=RemoteData, required=False, help='Remote folder of a previous calculation providing fort.11, fort.12 and turborvb.scratch')
+        spec.input('scratch_archive', valid_type=SinglefileData, required=False, help='Compressed turborvb.scratch of a previous calculation, extracted on the compute node')
 
         spec.output('fort11', valid_type=SinglefileData, help='')
-        spec.output('fort12', valid_type=SinglefileData, help='')
-        spec.output('energydata', valid_type=SinglefileData, help='')
+        spec.output('fort12', valid_type=SinglefileData, required=False, help='')
+        spec.output('energydata', valid_type=SinglefileData, required=False, help='')
         spec.output('energy', valid_type=Float, help='')
         spec.output('energy_err', valid_type=Float, help='')
         spec.output('variance_square', valid_type=Float, help='')
         spec.output('variance_square_err', valid_type=Float, help='')
-        spec.output('scratch', valid_type=FolderData, help='')
+        spec.output('wall_time', valid_type=Float, required=False, help='Wall time of the QMC runs in seconds')
+        spec.output('reblocking', valid_type=ArrayData, required=False, help='Blocking analysis for all block sizes')
+        spec.output('scratch', valid_type=FolderData, required=False, help='')
+        spec.output('scratch_archive', valid_type=SinglefileData, required=False, help='Compressed turborvb.scratch')
+        spec.output('blockdata', valid_type=ArrayData, required=False, help='Per-block data extracted from fort.12 when raw files are discarded')
 
         spec.inputs['metadata']['options']['parser_name'].default = 'turborvb.vmcwrp'
         spec.inputs['metadata']['options']['input_filename'].default = 'execute.sh'
         spec.inputs['metadata']['options']['output_filename'].default = 'execute.out'
 
         spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+        spec.exit_code(320, 'ERROR_JOB_INTERRUPTED', message='Job was interrupted (e.g. out of walltime), restart files and completed blocks were parsed.')
+        spec.exit_code(330, 'ERROR_NOT_ENOUGH_BLOCKS', message='Too few blocks of fort.12 for the native reblocking with the given eq and reb.')
+        spec.exit_code(340, 'ERROR_ENERGY_DRIFT', message='Run was stopped by the target_error monitor because the energy drifts.')
 
     def prepare_for_submission(self, folder):
         """
@@ -57,37 +86,33 @@ class TurboRVBVmcCalculationWRP(CalcJob):
         resources = self.inputs.metadata['options']['resources']
         parameters = self.inputs.parameters.get_dict()
 
-        with folder.open("fort.10", "w") as fhandle_out, \
-             self.inputs.fort10.open() as fhandle_in:
-            fhandle_out.write(fhandle_in.read())
-
-        if "pseudo" in self.inputs:
-            with folder.open("pseudo.dat", "w") as fhandle_out, \
-                 self.inputs.pseudo.open() as fhandle_in:
-                fhandle_out.write(fhandle_in.read())
-
         with folder.open(self.options.input_filename, "w") as fhandle:
             content = []
+            launcher = launcher_settings(self)
+            content += environment_commands(launcher)
+            if "scratch_archive" in self.inputs:
+                content.append(f"tar -xzf {SCRATCH_ARCHIVE} && rm {SCRATCH_ARCHIVE}")
             mpiproc = resources['num_machines'] * resources['num_mpiprocs_per_machine']
             tg_command = 'turbo-genius.sh -j vmc -g'
 
-            content.append(tg_command)
-            content.append(f'cp datasvmc.input vmc.input')
-            if "namelist_update" in parameters:
-                content.append("cp vmc.input source")
-                for key, value in parameters["namelist_update"].items():
-                    content.append("sed 's/\s*!\?"+key+"\s*=.*$/"+key+"="+f"{value}"+"/g' source > dest")
-                    content.append("cp dest source")
-                content.append("cp dest vmc.input")
-            content.append(f'mpirun -np {mpiproc} turborvb-mpi.x < vmc.input > vmc.output')
+            content += input_commands(self, folder, tg_command, "datasvmc.input", "vmc.input",
+                                      parameters.get("namelist_update", None))
+            content += checkpoint_commands()
+            content += timed_commands(stoppable_command(launch_command(launcher, mpiproc, 'turborvb-mpi.x < vmc.input > vmc.output')))
             content.append(f'cp vmc.output out_vmc')
-            tg_command = 'turbo-genius.sh -j vmc -post -am manual'
-            if "eq" in parameters:
-                tg_command += f" -eq {parameters['eq']}"
-            if "reb" in parameters:
-                tg_command += f" -reb {parameters['reb']}"
+            # Native post-processing is done by the parser from fort.12
+            if parameters.get("postprocess", "turbogenius") != "native":
+                tg_command = 'turbo-genius.sh -j vmc -post -am manual'
+                if "eq" in parameters:
+                    tg_command += f" -eq {parameters['eq']}"
+                if "reb" in parameters:
+                    tg_command += f" -reb {parameters['reb']}"
+
+                content.append(tg_command)
+
+            content += scratch_commands(parameters)
 
-            content.append(tg_command)
+            content.append(finished_command())
 
             fhandle.write("\n".join(content))
 
@@ -99,16 +124,32 @@ class TurboRVBVmcCalculationWRP(CalcJob):
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
-        calcinfo.local_copy_list = [
-            (self.inputs.fort10.uuid, self.inputs.fort10.filename, "fort.10"),
-        ]
-        calcinfo.retrieve_list = ["fort.11",
-                                  "fort.12",
-                                  "fort.12_fn",
-                                  "pip0.d",
-                                  "out_forcevmc",
-                                  "turborvb.scratch",
-                                  self.options.output_filename]
+        if "parent_folder" in self.inputs:
+            files = self._parent_folder_files
+            # Continuation runs write a new fort.12 holding only their own blocks
+            if not parameters.get("parent_folder_fort12", True):
+                files = [ x for x in files if x[0] != "fort.12" ]
+            entries = remote_copy_entries(self.inputs.parent_folder, files)
+            if parameters.get("parent_folder_symlink", False):
+                calcinfo.remote_symlink_list = entries
+            else:
+                calcinfo.remote_copy_list = entries
+        calcinfo.local_copy_list = stage_inputs(self.inputs)
+        if "scratch_archive" in self.inputs:
+            calcinfo.local_copy_list.append((self.inputs.scratch_archive.uuid,
+                                             self.inputs.scratch_archive.filename,
+                                             SCRATCH_ARCHIVE))
+        retrieve_list = ["fort.11",
+                         "fort.12",
+                         "fort.12_fn",
+                         "pip0.d",
+                         "out_forcevmc",
+                         scratch_retrieve_name(parameters),
+                         WALLTIME_FILE,
+                         CHECKPOINT_FILE,
+                         STOP_FILE,
+                         self.options.output_filename]
+        calcinfo.retrieve_list, calcinfo.retrieve_temporary_list = split_retrieve_list(retrieve_list, parameters)
 
 
         return calcinfo
@@ -4,6 +4,12 @@ from aiida.plugins import CalculationFactory
 from aiida.common import exceptions
 from aiida.orm import Float, SinglefileData, FolderData
 from aiida_turborvb.auxiliary import copy_between_nodes
+from aiida_turborvb.auxiliary.fort12 import Fort12Reader
+from aiida_turborvb.auxiliary.reblocking import analyse
+from aiida_turborvb.auxiliary.retrieval import ( open_output, output_exists, columns_to_array, read_pip0,
+                                                  job_finished, parse_interrupted, read_walltime, read_stop_file,
+                                                  SCRATCH_ARCHIVE )
+from aiida_turborvb.calc.reblock import result_to_outputs
 import numpy as np
 
 class TurboRVBVmcParserWRP(Parser):
@@ -30,33 +36,79 @@ class TurboRVBVmcParserWRP(Parser):
         output_filename = "vmc.output" #self.node.get_option('output_filename')
 
         files_retrieved = self.retrieved.list_object_names()
+        temporary_folder = kwargs.get("retrieved_temporary_folder", None)
+        if not job_finished(self.retrieved, self.node.get_option('output_filename'), temporary_folder):
+            parse_interrupted(self, temporary_folder, kind="vmc")
+            # Stopped on drift with truncated restart files, it must not be continued
+            stop = read_stop_file(self.retrieved)
+            if stop is not None and stop.startswith("drift"):
+                return ExitCode(340)
+            return ExitCode(320)
+        parameters = self.node.inputs.parameters.get_dict()
+        required = ["fort.11", "fort.12"]
+        if parameters.get("postprocess", "turbogenius") != "native":
+            required.append("pip0.d")
+        if not all([ output_exists(self.retrieved, temporary_folder, x) for x in required ]):
+            return ExitCode(300)
+        wall_time = read_walltime(self.retrieved)
+        if wall_time is not None:
+            self.out('wall_time', Float(wall_time))
         with self.retrieved.open("fort.11", 'rb') as handle:
             output_11 = SinglefileData(file=handle)
-        with self.retrieved.open("fort.12", 'rb') as handle:
-            output_12 = SinglefileData(file=handle)
-        with self.retrieved.open("pip0.d", 'rb') as handle:
-            output_energy = SinglefileData(file=handle)
-        with self.retrieved.open("pip0.d", 'rb') as handle:
-            for ii, line in enumerate(handle):
-                if ii == 1:
-                    line_split = line.split()
-                    energy = Float(float(line_split[-2]))
-                    energy_err = Float(float(line_split[-1]))
-                if ii == 2:
-                    line_split = line.split()
-                    variance = Float(float(line_split[-2]))
-                    variance_err = Float(float(line_split[-1]))
-
-        scratch = FolderData()
-        copy_between_nodes("turborvb.scratch", ".", self.retrieved, scratch)
+        discard = parameters.get("discard_raw", False)
+        if not discard:
+            with self.retrieved.open("fort.12", 'rb') as handle:
+                output_12 = SinglefileData(file=handle)
+        native = parameters.get("postprocess", "turbogenius") == "native"
+        if native or discard:
+            # fort.12 is read only once for the analysis and the block data
+            try:
+                with open_output(self.retrieved, temporary_folder, "fort.12") as handle:
+                    with Fort12Reader(handle, kind="vmc") as reader:
+                        columns = reader.get_columns()
+                        if native:
+                            result = analyse(columns["energy"],
+                                             weights=columns.get("weight"),
+                                             energy_square=columns.get("energy_square"),
+                                             eq=parameters.get("eq", 0),
+                                             reb=parameters.get("reb", None))
+                        if discard:
+                            blockdata = columns_to_array(columns)
+            except ValueError as exc:
+                self.logger.error(str(exc))
+                return ExitCode(330)
+        if native:
+            for key, value in result_to_outputs(result).items():
+                self.out(key, value)
+        else:
+            with self.retrieved.open("pip0.d", 'rb') as handle:
+                output_energy = SinglefileData(file=handle)
+            with self.retrieved.open("pip0.d", 'rb') as handle:
+                energy, energy_err, variance, variance_err = read_pip0(handle)
+            self.out('energydata', output_energy)
+            self.out('energy', Float(energy))
+            self.out('energy_err', Float(energy_err))
+            self.out('variance_square', Float(variance))
+            self.out('variance_square_err', Float(variance_err))
+
+        if discard:
+            self.out('blockdata', blockdata)
+        else:
+            self.out('fort12', output_12)
+            if parameters.get("archive_scratch", False):
+                with self.retrieved.open(SCRATCH_ARCHIVE, 'rb') as handle:
+                    self.out('scratch_archive', SinglefileData(file=handle, filename=SCRATCH_ARCHIVE))
+            else:
+                scratch = FolderData()
+                copy_between_nodes("turborvb.scratch", ".", self.retrieved, scratch)
+                self.out('scratch', scratch)
 
         self.out('fort11', output_11)
-        self.out('fort12', output_12)
-        self.out('energydata', output_energy)
-        self.out('energy', energy)
-        self.out('energy_err', energy_err)
-        self.out('variance_square', variance)
-        self.out('variance_square_err', variance_err)
-        self.out('scratch', scratch)
+
+        # Runs stopped by the target_error monitor on target are finished runs
+        stop = read_stop_file(self.retrieved)
+        if stop is not None and stop.startswith("drift"):
+            self.logger.warning(stop)
+            return ExitCode(340)
 
         return ExitCode(0)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_turborvb turborvb main executable.
+"""
+from aiida.common import datastructures
+from aiida.engine import CalcJob
+from aiida.orm import SinglefileData, Dict, Float, ArrayData
+from aiida_turborvb.auxiliary.retrieval import ( split_retrieve_list,
+                                                  finished_command,
+                                                  timed_commands,
+                                                  WALLTIME_FILE,
+                                                  checkpoint_commands,
+                                                  CHECKPOINT_FILE,
+                                                  stoppable_command,
+                                                  STOP_FILE,
+                                                  scratch_commands,
+                                                  scratch_retrieve_name )
+from aiida_turborvb.auxiliary.submission import ( stage_inputs, input_commands )
+from aiida_turborvb.auxiliary.launcher import ( launcher_settings, environment_commands, launch_command )
+
+parameters_help = """
+Input parameters of LRDMC as for the LRDMC wrapper, VMC is set up by vmc_namelist_update,
+vmc_eq and vmc_reb
+"""
+
+class TurboRVBVmcLrdmcCalculationWRP(CalcJob):
+    """
+    AiiDA calculation plugin for TurboRVB.
+
+    Runs VMC and LRDMC one after another in one job. The trial energy of
+    LRDMC is taken from the VMC post-processing on the compute node and
+    fort.11, fort.12 and turborvb.scratch of VMC are used by LRDMC in place.
+
+    Only the LRDMC run is checkpointed and can be stopped through the stop
+    file. A stop file written during VMC is removed before LRDMC starts and
+    a job interrupted during VMC has nothing to be continued from.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        # set default values for AiiDA options
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('parameters', valid_type=Dict, help=parameters_help)
+        spec.input('fort10', valid_type=SinglefileData, help='')
+        spec.input('pseudo', valid_type=SinglefileData, required=False, help='')
+
+        spec.output('vmc_energydata', valid_type=SinglefileData, help='pip0.d of VMC')
+        spec.output('vmc_energy', valid_type=Float, help='VMC energy, used as the LRDMC trial energy')
+        spec.output('vmc_energy_err', valid_type=Float, help='')
+        spec.output('vmc_variance_square', valid_type=Float, help='')
+        spec.output('vmc_variance_square_err', valid_type=Float, help='')
+
+        spec.output('fort11', valid_type=SinglefileData, help='')
+        spec.output('fort12', valid_type=SinglefileData, required=False, help='')
+        spec.output('energydata', valid_type=SinglefileData, required=False, help='')
+        spec.output('energy', valid_type=Float, help='')
+        spec.output('energy_err', valid_type=Float, help='')
+        spec.output('variance_square', valid_type=Float, help='')
+        spec.output('variance_square_err', valid_type=Float, help='')
+        spec.output('wall_time', valid_type=Float, required=False, help='Wall time of the QMC runs in seconds')
+        spec.output('reblocking', valid_type=ArrayData, required=False, help='Blocking analysis for all block sizes')
+        spec.output('correcting_factors', valid_type=ArrayData, required=False, help='Energy as a function of the number of correcting factors')
+        spec.output('blockdata', valid_type=ArrayData, required=False, help='Per-block data extracted from fort.12 when raw files are discarded')
+        spec.output('scratch_archive', valid_type=SinglefileData, required=False, help='Compressed turborvb.scratch')
+
+        spec.inputs['metadata']['options']['parser_name'].default = 'turborvb.vmclrdmcwrp'
+        spec.inputs['metadata']['options']['input_filename'].default = 'execute.sh'
+        spec.inputs['metadata']['options']['output_filename'].default = 'execute.out'
+
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+        spec.exit_code(320, 'ERROR_JOB_INTERRUPTED', message='Job was interrupted (e.g. out of walltime), restart files and completed blocks were parsed.')
+        spec.exit_code(330, 'ERROR_NOT_ENOUGH_BLOCKS', message='Too few blocks of fort.12 for the native reblocking with the given eq and reb.')
+        spec.exit_code(340, 'ERROR_ENERGY_DRIFT', message='Run was stopped by the target_error monitor because the energy drifts.')
+
+    def prepare_for_submission(self, folder):
+        """
+        Create input files.
+
+        :param folder: an `aiida.common.folders.Folder` where the plugin should temporarily place all files
+            needed by the calculation.
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
+
+        resources = self.inputs.metadata['options']['resources']
+        parameters = self.inputs.parameters.get_dict()
+
+        with folder.open(self.options.input_filename, "w") as fhandle:
+            content = []
+            launcher = launcher_settings(self)
+            content += environment_commands(launcher)
+            mpiproc = resources['num_machines'] * resources['num_mpiprocs_per_machine']
+
+            # VMC, always post-processed by Turbo-Genius to get pip0.d
+            content += input_commands(self, folder, 'turbo-genius.sh -j vmc -g', "datasvmc.input", "vmc.input",
+                                      parameters.get("vmc_namelist_update", None))
+            content += timed_commands(launch_command(launcher, mpiproc, 'turborvb-mpi.x < vmc.input > vmc.output'))
+            content.append(f'cp vmc.output out_vmc')
+            tg_command = 'turbo-genius.sh -j vmc -post -am manual'
+            if "vmc_eq" in parameters:
+                tg_command += f" -eq {parameters['vmc_eq']}"
+            if "vmc_reb" in parameters:
+                tg_command += f" -reb {parameters['vmc_reb']}"
+            content.append(tg_command)
+
+            # LRDMC with the VMC energy as etry, unless it is set explicitly
+            updates = dict(parameters.get("namelist_update", {}))
+            content += input_commands(self, folder, 'turbo-genius.sh -j lrdmc -g', "datasfn.input", "fn.input",
+                                      updates if updates else None)
+            if "etry" not in updates:
+                content.append("ETRY=$(awk 'NR==2 {print $(NF-1)}' pip0.d)")
+                content.append('sed -i "s/^\\(\\s*\\)!\\?\\s*etry\\s*=.*$/\\1etry=$ETRY/" fn.input')
+            content.append(f"rm -f {STOP_FILE}")
+            content += checkpoint_commands()
+            content += timed_commands(stoppable_command(launch_command(launcher, mpiproc, 'turborvb-mpi.x < fn.input > fn.output')))
+            content.append(f'cp fn.output out_fn')
+            if parameters.get("postprocess", "turbogenius") != "native":
+                tg_command = 'turbo-genius.sh -j lrdmc -post -am manual'
+                if "eq" in parameters:
+                    tg_command += f" -eq {parameters['eq']}"
+                if "reb" in parameters:
+                    tg_command += f" -reb {parameters['reb']}"
+                if "col" in parameters:
+                    tg_command += f" -col {parameters['col']}"
+                content.append(tg_command)
+
+            content += scratch_commands(parameters)
+
+            content.append(finished_command())
+
+            fhandle.write("\n".join(content))
+
+        codeinfo = datastructures.CodeInfo()
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.cmdline_params = []
+        codeinfo.stdin_name = f"{self.inputs.metadata.options.input_filename}"
+        codeinfo.stdout_name = f"{self.inputs.metadata.options.output_filename}"
+
+        calcinfo = datastructures.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        calcinfo.local_copy_list = stage_inputs(self.inputs)
+        retrieve_list = ["pip0.d",
+                         "fort.11",
+                         "fort.12",
+                         "pip0_fn.d",
+                         scratch_retrieve_name(parameters),
+                         WALLTIME_FILE,
+                         CHECKPOINT_FILE,
+                         STOP_FILE,
+                         self.options.output_filename]
+        calcinfo.retrieve_list, calcinfo.retrieve_temporary_list = split_retrieve_list(retrieve_list, parameters)
+
+
+        return calcinfo
@@ -0,0 +1,35 @@
+from aiida.engine import ExitCode
+from aiida.orm import Float, SinglefileData
+from aiida_turborvb.auxiliary.retrieval import ( read_pip0, job_finished )
+from aiida_turborvb.lrdmc.wrapper.parser import TurboRVBLrdmcParserWRP
+
+class TurboRVBVmcLrdmcParserWRP(TurboRVBLrdmcParserWRP):
+    """
+    Parser class for parsing output of calculation.
+
+    LRDMC outputs are parsed as by the LRDMC parser, the VMC energy is
+    added from ``pip0.d``. A job interrupted during VMC has no ``pip0.d``,
+    its fort.11 and fort.12 are those of VMC and are not attached.
+    """
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        temporary_folder = kwargs.get("retrieved_temporary_folder", None)
+        if "pip0.d" not in self.retrieved.list_object_names():
+            if job_finished(self.retrieved, self.node.get_option('output_filename'), temporary_folder):
+                return ExitCode(300)
+            return ExitCode(320)
+        with self.retrieved.open("pip0.d", 'rb') as handle:
+            self.out('vmc_energydata', SinglefileData(file=handle))
+        with self.retrieved.open("pip0.d", 'rb') as handle:
+            energy, energy_err, variance, variance_err = read_pip0(handle)
+        self.out('vmc_energy', Float(energy))
+        self.out('vmc_energy_err', Float(energy_err))
+        self.out('vmc_variance_square', Float(variance))
+        self.out('vmc_variance_square_err', Float(variance_err))
+
+        return super().parse(**kwargs)
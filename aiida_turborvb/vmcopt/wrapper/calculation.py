@@ -2,10 +2,14 @@
 """
 Calculations provided by aiida_turborvb turborvb main executable.
 """
-from aiida.common import datastructures
+from aiida.common import datastructures, exceptions
 from aiida.engine import CalcJob
-from aiida.orm import SinglefileData, Dict, Str, Float, List
+from aiida.orm import SinglefileData, Dict, Str, Float, Int, List, ArrayData, RemoteData
 from aiida.plugins import DataFactory
+from aiida_turborvb.auxiliary import remote_copy_entries
+from aiida_turborvb.auxiliary.retrieval import ( split_retrieve_list, finished_command )
+from aiida_turborvb.auxiliary.submission import ( stage_inputs, input_commands )
+from aiida_turborvb.auxiliary.launcher import ( launcher_settings, environment_commands, launch_command )
 
 class TurboRVBVmcoptCalculationWRP(CalcJob):
     """
@@ -15,6 +19,11 @@ class TurboRVBVmcoptCalculationWRP(CalcJob):
     for execution of quantum monte carlo calculations
     """
 
+    # Files taken from parent_folder, pairs of (source, destination)
+    _parent_folder_files = (("fort.11", "fort.11"),
+                            ("fort.12", "fort.12"),
+                            ("turborvb.scratch", "turborvb.scratch"))
+
     @classmethod
     def define(cls, spec):
         """Define inputs and outputs of the calculation."""
@@ -29,19 +38,24 @@ class TurboRVBVmcoptCalculationWRP(CalcJob):
         spec.input('parameters', valid_type=Dict, help='')
         spec.input('fort10', valid_type=SinglefileData, help='')
         spec.input('pseudo', valid_type=SinglefileData, required=False, help='')
+        spec.input('input_template', valid_type=SinglefileData, required=False, help='Input file previously generated by Turbo-Genius, rendered without calling Turbo-Genius on the compute node')
+        spec.input('parent_folder', valid_type=RemoteData, required=False, help='Remote folder of a previous calculation providing fort.11, fort.12 and turborvb.scratch')
 
         spec.output('fort10', valid_type=SinglefileData, help='')
         spec.output('fort10_averaged', valid_type=SinglefileData, help='')
         spec.output('fort11', valid_type=SinglefileData, help='')
-        spec.output('fort12', valid_type=SinglefileData, help='')
+        spec.output('fort12', valid_type=SinglefileData, required=False, help='')
         spec.output('forces', valid_type=SinglefileData, help='')
         spec.output('story', valid_type=SinglefileData, help='')
+        spec.output('blockdata', valid_type=ArrayData, required=False, help='Per-block data extracted from fort.12 when raw files are discarded')
+        spec.output('completed_iterations', valid_type=Int, required=False, help='Optimization steps completed by an interrupted job, from story.d or fort.12')
 
         spec.inputs['metadata']['options']['parser_name'].default = 'turborvb.vmcoptwrp'
         spec.inputs['metadata']['options']['input_filename'].default = 'execute.sh'
         spec.inputs['metadata']['options']['output_filename'].default = 'execute.out'
 
         spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+        spec.exit_code(320, 'ERROR_JOB_INTERRUPTED', message='Job was interrupted (e.g. out of walltime), restart files and completed blocks were parsed.')
 
     def prepare_for_submission(self, folder):
         """
@@ -55,35 +69,23 @@ class TurboRVBVmcoptCalculationWRP(CalcJob):
         resources = self.inputs.metadata['options']['resources']
         parameters = self.inputs.parameters.get_dict()
 
-        with folder.open("fort.10", "w") as fhandle_out, \
-             self.inputs.fort10.open() as fhandle_in:
-            fhandle_out.write(fhandle_in.read())
-
-        if "pseudo" in self.inputs:
-            with folder.open("pseudo.dat", "w") as fhandle_out, \
-                 self.inputs.pseudo.open() as fhandle_in:
-                fhandle_out.write(fhandle_in.read())
+        if "optmethod" in parameters:
+            raise exceptions.InputValidationError("optmethod is not a Turbo-Genius option, "
+                                                  "set the optimization method (itestr4) in namelist_update")
 
         with folder.open(self.options.input_filename, "w") as fhandle:
             content = []
+            launcher = launcher_settings(self)
+            content += environment_commands(launcher)
             mpiproc = resources['num_machines'] * resources['num_mpiprocs_per_machine']
             tg_command = 'turbo-genius.sh -j vmcopt -g'
 
             if "opt" in parameters:
-                tg_command += " --opt {parameters['opt']}"
-
-            if "optmethod" in parameters:
-                tg_command += " --opt {parameters['optmethod']}"
+                tg_command += f" --opt {parameters['opt']}"
 
-            content.append(tg_command)
-            content.append(f'cp datasmin.input vmcopt.input')
-            if "namelist_update" in parameters:
-                content.append("cp vmcopt.input source")
-                for key, value in parameters["namelist_update"].items():
-                    content.append("sed 's/\s*!\?"+key+"\s*=.*$/"+key+"="+f"{value}"+"/g' source > dest")
-                    content.append("cp dest source")
-                content.append("cp dest vmcopt.input")
-            content.append(f'mpirun -np {mpiproc} turborvb-mpi.x < vmcopt.input > vmcopt.output')
+            content += input_commands(self, folder, tg_command, "datasmin.input", "vmcopt.input",
+                                      parameters.get("namelist_update", None), options=("opt", ))
+            content.append(launch_command(launcher, mpiproc, 'turborvb-mpi.x < vmcopt.input > vmcopt.output'))
             content.append(f'cp vmcopt.output out_min')
             tg_command = 'turbo-genius.sh -j vmcopt -post -am manual'
             if "eq" in parameters:
@@ -91,6 +93,8 @@ class TurboRVBVmcoptCalculationWRP(CalcJob):
 
             content.append(tg_command)
 
+            content.append(finished_command())
+
             fhandle.write("\n".join(content))
 
         codeinfo = datastructures.CodeInfo()
@@ -101,18 +105,32 @@ class TurboRVBVmcoptCalculationWRP(CalcJob):
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
-        calcinfo.local_copy_list = [
-            (self.inputs.fort10.uuid, self.inputs.fort10.filename, "fort.10"),
-        ]
-        calcinfo.retrieve_list = ["fort.10_org",
-                                  "fort.10_averaged",
-                                  "fort.11",
-                                  "fort.12",
-                                  "fort.12_fn",
-                                  "forces.dat",
-                                  "story.d",
-                                  "turborvb.scratch",
-                                  self.options.output_filename]
+        if "parent_folder" in self.inputs:
+            files = list(self._parent_folder_files)
+            if not parameters.get("parent_folder_fort12", True):
+                files = [ x for x in files if x[0] != "fort.12" ]
+            # Wavefunction optimized so far, replaces the fort10 input
+            if parameters.get("parent_folder_fort10", False):
+                files.append(("fort.10", "fort.10"))
+            entries = remote_copy_entries(self.inputs.parent_folder, files)
+            if parameters.get("parent_folder_symlink", False):
+                calcinfo.remote_symlink_list = entries
+            else:
+                calcinfo.remote_copy_list = entries
+        if parameters.get("parent_folder_fort10", False) and "parent_folder" in self.inputs:
+            calcinfo.local_copy_list = stage_inputs(self.inputs, (("pseudo", "pseudo.dat"), ))
+        else:
+            calcinfo.local_copy_list = stage_inputs(self.inputs)
+        retrieve_list = ["fort.10_org",
+                         "fort.10_averaged",
+                         "fort.11",
+                         "fort.12",
+                         "fort.12_fn",
+                         "forces.dat",
+                         "story.d",
+                         "turborvb.scratch",
+                         self.options.output_filename]
+        calcinfo.retrieve_list, calcinfo.retrieve_temporary_list = split_retrieve_list(retrieve_list, parameters)
 
 
         return calcinfo
@@ -2,7 +2,9 @@ from aiida.engine import ExitCode
 from aiida.parsers.parser import Parser
 from aiida.plugins import CalculationFactory
 from aiida.common import exceptions
-from aiida.orm import Float, SinglefileData, FolderData
+from aiida.orm import Float, Int, SinglefileData, FolderData
+from aiida_turborvb.auxiliary.retrieval import ( open_output, output_exists, blockdata_to_array, job_finished, parse_interrupted,
+                                                  completed_iterations )
 import numpy as np
 
 class TurboRVBVmcoptParserWRP(Parser):
@@ -29,12 +31,31 @@ class TurboRVBVmcoptParserWRP(Parser):
         output_filename = "vmcopt.output" #self.node.get_option('output_filename')
 
         files_retrieved = self.retrieved.list_object_names()
+        if not job_finished(self.retrieved, self.node.get_option('output_filename')):
+            parse_interrupted(self, kwargs.get("retrieved_temporary_folder", None), kind=None)
+            parameters = self.node.inputs.parameters.get_dict()
+            # fort.12 continued from the parent folder holds the steps of the previous jobs too
+            own_fort12 = "parent_folder" not in self.node.inputs or not parameters.get("parent_folder_fort12", True)
+            iterations = completed_iterations(self.retrieved, kwargs.get("retrieved_temporary_folder", None),
+                                              fort12=own_fort12)
+            if iterations is not None:
+                self.out('completed_iterations', Int(iterations))
+            return ExitCode(320)
+        temporary_folder = kwargs.get("retrieved_temporary_folder", None)
+        required = ("fort.10_org", "fort.10_averaged", "fort.11", "fort.12", "forces.dat", "story.d")
+        if not all([ output_exists(self.retrieved, temporary_folder, x) for x in required ]):
+            return ExitCode(300)
         with self.retrieved.open("fort.10_org", 'rb') as handle:
             output_10 = SinglefileData(file=handle)
         with self.retrieved.open("fort.11", 'rb') as handle:
             output_11 = SinglefileData(file=handle)
-        with self.retrieved.open("fort.12", 'rb') as handle:
-            output_12 = SinglefileData(file=handle)
+        parameters = self.node.inputs.parameters.get_dict()
+        if parameters.get("discard_raw", False):
+            with open_output(self.retrieved, temporary_folder, "fort.12") as handle:
+                self.out('blockdata', blockdata_to_array(handle, kind="vmc"))
+        else:
+            with self.retrieved.open("fort.12", 'rb') as handle:
+                self.out('fort12', SinglefileData(file=handle))
         with self.retrieved.open("fort.10_averaged", 'rb') as handle:
             output_10_ave = SinglefileData(file=handle)
         with self.retrieved.open("forces.dat", 'rb') as handle:
@@ -48,7 +69,6 @@ class TurboRVBVmcoptParserWRP(Parser):
         self.out('fort10', output_10)
         self.out('fort10_averaged', output_10_ave)
         self.out('fort11', output_11)
-        self.out('fort12', output_12)
         self.out('forces', output_forces)
         self.out('story', output_story)
 
@@ -0,0 +1,311 @@
+import math
+
+from aiida.orm import Int, Float, Dict, SinglefileData, ArrayData, load_node
+from aiida.engine import WorkChain, ToContext, calcfunction, while_
+from aiida.plugins.factories import CalculationFactory
+
+from aiida_turborvb.calc.reblock import merge_blockdata, analyse_segments, segment_columns
+from aiida_turborvb.auxiliary.retrieval import checkpoint_updated
+
+Vmc    = CalculationFactory('turborvb.vmcwrp')
+Lrdmc  = CalculationFactory('turborvb.lrdmcwrp')
+
+@calcfunction
+def prepare_continuation_pars(pars, ngen, options=None):
+    """
+    Parameters of a run continuing from the parent folder for ngen steps
+
+    :param options: top level parameters overriding the defaults, e.g. ``parent_folder_fort12``
+    """
+    p = pars.get_dict()
+    p["namelist_update"] = dict(p.get("namelist_update", {}))
+    p["namelist_update"]["iopt"] = 0
+    p["namelist_update"]["ngen"] = ngen.value
+    p["parent_folder_fort12"] = False
+    if options is not None:
+        p.update(options.get_dict())
+    return Dict(dict=p)
+
+def samples_needed(nsteps, error, target, safety=1.1):
+    """
+    Additional steps to reach the target error assuming error ~ 1/sqrt(N)
+    """
+    return int(math.ceil(nsteps * ((error / target)**2 - 1.0) * safety))
+
+class AdaptiveVMC(WorkChain):
+    """
+    VMC continued until the energy error reaches the target
+
+    After every run, the block data of all runs are reblocked together.
+    Only the final merge is stored, so the stored block data grow linearly
+    with the number of runs. If the error is larger than ``target_error``,
+    the number of additional steps is estimated from the error ~ 1/sqrt(N) scaling and a
+    continuation run (``iopt = 0``) restarts from fort.11 and
+    turborvb.scratch of the previous run through ``parent_folder``.
+
+    ``ngen`` has to be in ``namelist_update`` of the VMC parameters.
+    """
+
+    _calculation = Vmc
+    _namespace = "vmc"
+    _kind = "vmc"
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+        spec.expose_inputs(cls._calculation, namespace=cls._namespace)
+        spec.input("target_error", valid_type = Float, help="Requested error of the energy")
+        spec.input("max_iterations", valid_type = Int, default=lambda: Int(5),
+                   help="Maximum number of runs")
+        spec.output("energy", valid_type = Float)
+        spec.output("energy_err", valid_type = Float)
+        spec.output("variance_square", valid_type = Float, required=False)
+        spec.output("variance_square_err", valid_type = Float, required=False)
+        spec.output("reblocking", valid_type = ArrayData)
+        spec.output("blockdata", valid_type = ArrayData)
+        spec.output("fort11", valid_type = SinglefileData)
+        spec.outline(
+            cls.setup,
+            while_(cls.should_continue)(
+                cls.run_segment,
+                cls.inspect_segment),
+            cls.results
+        )
+        spec.exit_code(300, 'ERROR_MISSING_NGEN', message='ngen is not in namelist_update of the parameters.')
+        spec.exit_code(401, 'ERROR_SEGMENT_FAILED', message='One of the runs failed.')
+        spec.exit_code(402, 'ERROR_NOT_CONVERGED', message='Target error was not reached within max_iterations runs.')
+
+    def setup(self):
+        parameters = self.inputs[self._namespace].parameters.get_dict()
+        if "ngen" not in parameters.get("namelist_update", {}):
+            return self.exit_codes.ERROR_MISSING_NGEN
+        self.ctx.ngen = parameters["namelist_update"]["ngen"]
+        self.ctx.nsteps = 0
+        self.ctx.iteration = 0
+        self.ctx.converged = False
+        self.ctx.failed = False
+        self.ctx.segments = []
+
+    def should_continue(self):
+        return ( not self.ctx.converged and not self.ctx.failed and
+                 self.ctx.iteration < self.inputs.max_iterations.value )
+
+    def segment_inputs(self):
+        inputs = self.exposed_inputs(self._calculation, namespace=self._namespace)
+        if self.ctx.iteration > 0:
+            inputs["parameters"] = prepare_continuation_pars(inputs["parameters"], Int(self.ctx.ngen))
+            inputs["parent_folder"] = self.ctx.last.outputs.remote_folder
+            # Restart files of the first run are replaced by the parent folder
+            for key in ("fort11", "fort12", "scratch", "scratch_archive"):
+                inputs.pop(key, None)
+        return inputs
+
+    def run_segment(self):
+        self.report(f"Run {self.ctx.iteration} with {self.ctx.ngen} steps")
+        future = self.submit(self._calculation, **self.segment_inputs())
+        return ToContext(last = future)
+
+    def add_segment(self, node):
+        self.ctx.nsteps += self.ctx.ngen
+        self.ctx.iteration += 1
+        self.ctx.fort11 = node.outputs.fort11.uuid
+        if "fort12" in node.outputs:
+            self.ctx.segments.append(node.outputs.fort12.uuid)
+        else:
+            self.ctx.segments.append(node.outputs.blockdata.uuid)
+
+    def merge_parameters(self):
+        parameters = self.inputs[self._namespace].parameters.get_dict()
+        return { "kind" : self._kind,
+                 "eq"   : parameters.get("eq", 0),
+                 "reb"  : parameters.get("reb", None) }
+
+    def analyse(self):
+        """
+        Energy and error of all runs, nothing is stored
+        """
+        return analyse_segments([ load_node(uuid) for uuid in self.ctx.segments ], **self.merge_parameters())
+
+    def merge(self):
+        segments = { f"segment_{ii}" : load_node(uuid) for ii, uuid in enumerate(self.ctx.segments) }
+        return merge_blockdata(Dict(dict=self.merge_parameters()), **segments)
+
+    def next_ngen(self, error):
+        ngen = max(samples_needed(self.ctx.nsteps, error, self.inputs.target_error.value),
+                   self.ctx.nsteps // 10, 1)
+        nweight = self.inputs[self._namespace].parameters.get_dict().get("namelist_update", {}).get("nweight", None)
+        if nweight:
+            ngen = int(math.ceil(ngen / nweight) * nweight)
+        return ngen
+
+    def inspect_segment(self):
+        node = self.ctx.last
+        if not node.is_finished_ok:
+            self.report(f"Run {self.ctx.iteration} failed with exit status {node.exit_status}")
+            self.ctx.failed = True
+            return
+        self.add_segment(node)
+
+        result = self.analyse()
+        error = result["energy_err"]
+        self.report(f"Energy {result['energy']} +- {error} after {self.ctx.nsteps} steps")
+        if error <= self.inputs.target_error.value:
+            self.ctx.converged = True
+            return
+        self.ctx.ngen = self.next_ngen(error)
+
+    def results(self):
+        if not self.ctx.segments:
+            return self.exit_codes.ERROR_SEGMENT_FAILED
+        for key, value in self.merge().items():
+            self.out(key, value)
+        self.out("fort11", load_node(self.ctx.fort11))
+        if self.ctx.failed:
+            return self.exit_codes.ERROR_SEGMENT_FAILED
+        if not self.ctx.converged:
+            return self.exit_codes.ERROR_NOT_CONVERGED
+
+def core_hours(node):
+    """
+    Core hours used by a CalcJob, the walltime limit is used if the
+    scheduler did not report the elapsed time
+    """
+    seconds = None
+    job_info = node.get_last_job_info()
+    if job_info is not None:
+        seconds = getattr(job_info, "wallclock_time_seconds", None)
+    if seconds is None:
+        seconds = node.get_option("max_wallclock_seconds") or 0
+    resources = node.get_option("resources")
+    cores = resources.get("num_machines", 1) * resources.get("num_mpiprocs_per_machine", 1)
+    return cores * seconds / 3600.0
+
+def budget_steps(core_hours, nsteps, budget):
+    """
+    Steps affordable with the rest of the budget at the cost per step so far,
+    ``None`` if the cost is not known yet
+    """
+    if nsteps <= 0 or core_hours <= 0:
+        return None
+    return int((budget - core_hours) / (core_hours / nsteps))
+
+@calcfunction
+def sum_core_hours(**runs):
+    """
+    Core hours of all runs, labeled ``run_<i>``
+    """
+    return Float(sum([ x.value for x in runs.values() ]))
+
+class AdaptiveLRDMC(AdaptiveVMC):
+    """
+    LRDMC continued until the energy error reaches the target
+
+    Works as :class:`AdaptiveVMC`, the merged statistics use the weighted
+    LRDMC block data. With ``max_core_hours`` the last run is shortened to
+    the remaining budget and the workchain stops once the budget is spent.
+
+    A run killed by the scheduler (e.g. on walltime) after writing a new
+    checkpoint is not repeated, the next run resumes from fort.11 and
+    turborvb.scratch left in its remote folder. The blocks it wrote to
+    fort.12 are merged and counted, with ``nweight`` steps per block.
+    """
+
+    _calculation = Lrdmc
+    _namespace = "lrdmc"
+    _kind = "lrdmc"
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+        spec.input("max_core_hours", valid_type = Float, required=False,
+                   help="Budget of core hours of all runs")
+        spec.input("max_resumes", valid_type = Int, default=lambda: Int(2),
+                   help="Maximum number of consecutive resumes after interrupted runs")
+        spec.output("core_hours", valid_type = Float)
+        spec.exit_code(403, 'ERROR_BUDGET_EXHAUSTED', message='Core hour budget was spent before reaching the target error.')
+
+    def setup(self):
+        ret = super().setup()
+        self.ctx.core_hours = 0.0
+        self.ctx.run_hours = []
+        self.ctx.resumes = 0
+        self.ctx.budget_exhausted = False
+        return ret
+
+    def should_continue(self):
+        return super().should_continue() and not self.ctx.budget_exhausted
+
+    def is_resumable(self, node):
+        """
+        Check that the interrupted run left a newer checkpoint than the one it started from
+        """
+        if "remote_folder" not in node.outputs or "retrieved" not in node.outputs:
+            return False
+        return checkpoint_updated(node.outputs.retrieved)
+
+    def add_interrupted_segment(self, node):
+        """
+        Merge and count the completed blocks of an interrupted run
+        """
+        if "blockdata" in node.outputs:
+            segment = node.outputs.blockdata
+        elif "fort.12" in node.outputs.retrieved.list_object_names():
+            segment = node.outputs.retrieved
+        else:
+            self.report(f"Blocks of run {node.pk} were not retrieved, its steps are not counted")
+            return
+        nweight = self.inputs[self._namespace].parameters.get_dict().get("namelist_update", {}).get("nweight", None)
+        if nweight is None:
+            self.report(f"nweight is not in namelist_update, the steps of run {node.pk} are not counted")
+        else:
+            self.ctx.nsteps += len(segment_columns(segment, self._kind)["energy"]) * nweight
+        self.ctx.segments.append(segment.uuid)
+
+    def inspect_segment(self):
+        node = self.ctx.last
+        self.ctx.run_hours.append(core_hours(node))
+        self.ctx.core_hours += self.ctx.run_hours[-1]
+
+        if node.is_finished_ok:
+            self.ctx.resumes = 0
+            super().inspect_segment()
+        elif self.is_resumable(node) and self.ctx.resumes < self.inputs.max_resumes.value:
+            self.ctx.resumes += 1
+            self.ctx.iteration += 1
+            self.report(f"Run {node.pk} interrupted, resuming from its remote folder")
+            self.add_interrupted_segment(node)
+        else:
+            super().inspect_segment()
+            return
+        self.check_budget()
+
+    def check_budget(self):
+        """
+        Stop, or shorten the next run, once the budget is spent, after finished and resumed runs
+        """
+        if self.ctx.converged or "max_core_hours" not in self.inputs:
+            return
+        budget = self.inputs.max_core_hours.value
+        if self.ctx.core_hours >= budget:
+            self.report(f"Budget of {budget} core hours spent")
+            self.ctx.budget_exhausted = True
+            return
+        remaining = budget_steps(self.ctx.core_hours, self.ctx.nsteps, budget)
+        if remaining is None:
+            return
+        if remaining < max(self.ctx.ngen // 10, 1):
+            self.report(f"Budget of {budget} core hours spent")
+            self.ctx.budget_exhausted = True
+        elif remaining < self.ctx.ngen:
+            self.report(f"Last run shortened to {remaining} steps by the budget")
+            self.ctx.ngen = remaining
+
+    def results(self):
+        runs = { f"run_{ii}" : Float(x) for ii, x in enumerate(self.ctx.run_hours) }
+        self.out("core_hours", sum_core_hours(**runs))
+        ret = super().results()
+        if ret is None and self.ctx.budget_exhausted:
+            return self.exit_codes.ERROR_BUDGET_EXHAUSTED
+        if ret == self.exit_codes.ERROR_NOT_CONVERGED and self.ctx.budget_exhausted:
+            return self.exit_codes.ERROR_BUDGET_EXHAUSTED
+        return ret
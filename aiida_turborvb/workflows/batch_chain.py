@@ -0,0 +1,428 @@
+import datetime
+
+from aiida.common import timezone
+from aiida.orm import Int, Float, Dict, Bool, List, Code, Group, StructureData, SinglefileData, CalcJobNode, QueryBuilder, load_node
+from aiida.engine import WorkChain, ToContext, calcfunction, if_, while_
+from aiida.plugins.factories import CalculationFactory
+
+from aiida_turborvb.workflows.dft_chain import DFT, prepare_MF10_pars, prepare_AP_pars
+from aiida_turborvb.workflows.qmc_chain import QMC
+
+Mf10  = CalculationFactory('turborvb.makefort10wrp')
+AP    = CalculationFactory('turborvb.assemblingpseudowrp')
+
+#: Process states of CalcJobs occupying the scheduler or the daemon
+ACTIVE_STATES = ("created", "waiting", "running")
+
+#: Values collected for every structure, see :func:`collect_results`
+RESULT_NAMES = ("pk", "exit_status", "dft_energy", "energy", "energy_err", "pseudo")
+
+def active_calcjobs(code, stale_seconds=None):
+    """
+    Query of the CalcJobs of the code that did not terminate yet
+
+    :param stale_seconds: skip CalcJobs not modified for longer, e.g. left
+        behind by a killed daemon. The scheduler state of a CalcJob handled
+        by a daemon is updated at every poll of the scheduler.
+    """
+    filters = {"attributes.process_state": {"in": list(ACTIVE_STATES)}}
+    if stale_seconds is not None:
+        filters["mtime"] = {">": timezone.now() - datetime.timedelta(seconds=stale_seconds)}
+    qb = QueryBuilder()
+    qb.append(Code, filters={"id": code.pk}, tag="code")
+    qb.append(CalcJobNode, with_incoming="code", filters=filters, project=["id"])
+    return qb
+
+def count_active_calcjobs(code, stale_seconds=None):
+    """
+    Number of CalcJobs of the code that did not terminate yet
+    """
+    return active_calcjobs(code, stale_seconds).count()
+
+def oldest_active_calcjob(code, stale_seconds=None):
+    """
+    The active CalcJob of the code created first, ``None`` if there is none
+    """
+    qb = active_calcjobs(code, stale_seconds)
+    qb.order_by({CalcJobNode: {"ctime": "asc"}})
+    qb.limit(1)
+    result = qb.all()
+    return load_node(result[0][0]) if result else None
+
+def atom_key(structure):
+    """
+    Key of the structures sharing the assembled pseudo potential
+
+    ``pseudo.dat`` has one entry per atom, so only structures with the
+    same atoms in the same order can share it.
+    """
+    return ",".join([ structure.get_kind(site.kind_name).symbol for site in structure.sites ])
+
+@calcfunction
+def collect_results(**kwargs):
+    """
+    Results of the structures of a lane keyed by structure UUID
+
+    Inputs are labeled ``t<i>_structure`` and ``t<i>_<name>`` with the
+    names of ``RESULT_NAMES``, missing names are skipped. ``pseudo`` is
+    stored as UUID.
+    """
+    ret = {}
+    tasks = sorted(set([ key.split("_", 1)[0] for key in kwargs ]))
+    for task in tasks:
+        result = {}
+        for name in RESULT_NAMES:
+            node = kwargs.get(f"{task}_{name}", None)
+            if node is None:
+                continue
+            result[name] = node.uuid if isinstance(node, SinglefileData) else node.value
+        ret[kwargs[f"{task}_structure"].uuid] = result
+    return Dict(dict=ret)
+
+@calcfunction
+def merge_results(**kwargs):
+    """
+    Merge the results of the lanes
+    """
+    ret = {}
+    for value in kwargs.values():
+        ret.update(value.get_dict())
+    return Dict(dict=ret)
+
+class Assembly(WorkChain):
+    """
+    Pseudo potential (assembling pseudo) of one structure
+
+    makefort10 runs only as input of assembling pseudo. Its ``fort.10`` is
+    not shared, the symmetries and the tied parameters it writes depend
+    on the geometry.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        super(Assembly, cls).define(spec)
+        spec.input("mf10_code", valid_type = Code)
+        spec.input("ap_code", valid_type = Code)
+        spec.input("structure", valid_type = StructureData)
+        spec.input("parameters", valid_type = Dict)
+        spec.output("pseudo", valid_type = SinglefileData)
+        spec.outline(
+            cls.mf10,
+            if_(cls.is_mf10_ok)(cls.ap),
+            cls.results
+        )
+        spec.exit_code(401, 'ERROR_MF10_FAILED', message='makefort10 failed.')
+        spec.exit_code(402, 'ERROR_AP_FAILED', message='Assembling pseudo failed.')
+
+    def is_mf10_ok(self):
+        return self.ctx.mf10.is_finished_ok
+
+    def mf10(self):
+        inputs = dict( code       = self.inputs.mf10_code,
+                       structure  = self.inputs.structure,
+                       parameters = prepare_MF10_pars(self.inputs.parameters) )
+        future = self.submit(Mf10, **inputs)
+        return ToContext(mf10 = future)
+
+    def ap(self):
+        inputs = dict( code       = self.inputs.ap_code,
+                       fort10     = self.ctx.mf10.outputs.fort10,
+                       parameters = prepare_AP_pars(self.inputs.parameters) )
+        future = self.submit(AP, **inputs)
+        return ToContext(ap = future)
+
+    def results(self):
+        if not self.ctx.mf10.is_finished_ok:
+            return self.exit_codes.ERROR_MF10_FAILED
+        if not self.ctx.ap.is_finished_ok:
+            return self.exit_codes.ERROR_AP_FAILED
+        self.out("pseudo", self.ctx.ap.outputs.pseudo)
+
+class DFTQMC(WorkChain):
+    """
+    DFT followed by QMC for one structure
+    """
+
+    @classmethod
+    def define(cls, spec):
+        super(DFTQMC, cls).define(spec)
+        spec.expose_inputs(DFT, namespace="dft")
+        spec.expose_inputs(QMC, namespace="qmc", exclude=("fort10", "pseudo"),
+                           namespace_options={"required": False, "populate_defaults": False})
+        spec.input("run_qmc", valid_type = Bool, default=lambda: Bool(True))
+        spec.output("dft_energy", valid_type = Float)
+        spec.output("pseudo", valid_type = SinglefileData, required=False)
+        spec.output("energy", valid_type = Float, required=False)
+        spec.output("energy_err", valid_type = Float, required=False)
+        spec.outline(
+            cls.dft,
+            if_(cls.is_qmc)(cls.qmc),
+            cls.results
+        )
+        spec.exit_code(401, 'ERROR_DFT_FAILED', message='DFT workchain failed.')
+        spec.exit_code(402, 'ERROR_QMC_FAILED', message='QMC workchain failed.')
+
+    def dft(self):
+        inputs = self.exposed_inputs(DFT, namespace="dft")
+        future = self.submit(DFT, **inputs)
+        return ToContext(dft = future)
+
+    def is_qmc(self):
+        return self.inputs.run_qmc.value and "qmc" in self.inputs and self.ctx.dft.is_finished_ok
+
+    def qmc(self):
+        inputs = self.exposed_inputs(QMC, namespace="qmc")
+        inputs["fort10"] = self.ctx.dft.outputs.fort10
+        if "pseudo" in self.ctx.dft.outputs:
+            inputs["pseudo"] = self.ctx.dft.outputs.pseudo
+        future = self.submit(QMC, **inputs)
+        return ToContext(qmc = future)
+
+    def results(self):
+        if not self.ctx.dft.is_finished_ok:
+            return self.exit_codes.ERROR_DFT_FAILED
+        self.out("dft_energy", self.ctx.dft.outputs.energy)
+        if "pseudo" in self.ctx.dft.outputs:
+            self.out("pseudo", self.ctx.dft.outputs.pseudo)
+        if "qmc" in self.ctx:
+            if not self.ctx.qmc.is_finished_ok:
+                return self.exit_codes.ERROR_QMC_FAILED
+            self.out("energy", self.ctx.qmc.outputs.energy)
+            self.out("energy_err", self.ctx.qmc.outputs.energy_err)
+
+class BatchLane(WorkChain):
+    """
+    Structures of a batch run one after another
+
+    Every lane has at most one process, and so at most one CalcJob, active
+    at a time. The next structure is submitted as soon as the previous
+    one finished, unless one of the codes has ``max_inflight`` active
+    CalcJobs, including the CalcJobs started by other processes. The lane
+    then waits until the oldest of them terminates and checks again.
+    CalcJobs not modified for ``stale_seconds`` are neither counted nor
+    waited for, so a CalcJob left in an active state by a killed daemon
+    does not block the lane.
+
+    With ``assembly`` the lane runs :class:`Assembly`, otherwise
+    :class:`DFTQMC` with the pseudo potential of ``shared``.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        super(BatchLane, cls).define(spec)
+        spec.input("mf10_code", valid_type = Code)
+        spec.input("ap_code", valid_type = Code)
+        spec.input("cf10m_code", valid_type = Code)
+        spec.input("prep_code", valid_type = Code)
+        spec.input("vmcopt_code", valid_type = Code, required=False)
+        spec.input("vmc_code", valid_type = Code, required=False)
+        spec.input("lrdmc_code", valid_type = Code, required=False)
+        spec.input("dft_parameters", valid_type = Dict)
+        spec.input("qmc_parameters", valid_type = Dict, required=False,
+                   help="QMC runs only if given together with the QMC codes")
+        spec.input("max_inflight", valid_type = Int, default=lambda: Int(50),
+                   help="Maximum number of active CalcJobs per Code")
+        spec.input("stale_seconds", valid_type = Int, default=lambda: Int(7200),
+                   help="Active CalcJobs not modified for longer are not counted")
+        spec.input("structures", valid_type = List, help="UUIDs of StructureData in the order of submission")
+        spec.input("assembly", valid_type = Bool, default=lambda: Bool(False),
+                   help="Assemble the pseudo potential instead of running the pipeline")
+        spec.input("shared", valid_type = Dict, required=False,
+                   help="UUIDs of the assembled pseudo potentials keyed by atom_key")
+        spec.output("results", valid_type = Dict)
+        spec.outline(
+            cls.setup,
+            while_(cls.has_pending)(
+                if_(cls.is_saturated)(
+                    cls.wait_for_slot
+                ).else_(
+                    cls.submit_next,
+                    cls.inspect_next
+                )
+            ),
+            cls.results
+        )
+
+    def setup(self):
+        self.ctx.pending = list(self.inputs.structures.get_list())
+        self.ctx.done = []
+        self.ctx.run_qmc = ( "qmc_parameters" in self.inputs and
+                             all([ f"{x}_code" in self.inputs for x in ("vmcopt", "vmc", "lrdmc") ]) )
+
+    def has_pending(self):
+        return len(self.ctx.pending) > 0
+
+    def get_codes(self):
+        names = ["mf10", "ap"]
+        if not self.inputs.assembly.value:
+            names += ["cf10m", "prep"]
+            if self.ctx.run_qmc:
+                names += ["vmcopt", "vmc", "lrdmc"]
+        return [ self.inputs[f"{x}_code"] for x in names ]
+
+    def saturated_code(self):
+        """
+        A code with ``max_inflight`` or more active CalcJobs, ``None`` if there is none
+        """
+        for code in self.get_codes():
+            if count_active_calcjobs(code, self.inputs.stale_seconds.value) >= self.inputs.max_inflight.value:
+                return code
+        return None
+
+    def is_saturated(self):
+        return self.saturated_code() is not None
+
+    def wait_for_slot(self):
+        code = self.saturated_code()
+        node = oldest_active_calcjob(code, self.inputs.stale_seconds.value) if code is not None else None
+        if node is None or node.is_terminated:
+            # Terminated in the meantime, the count is checked again
+            return
+        self.report(f"Code {code.label} has {self.inputs.max_inflight.value} active CalcJobs, waiting for pk {node.pk}")
+        return ToContext(slot = node)
+
+    def pipeline_inputs(self, structure):
+        inputs = { "dft" : { "mf10_code"  : self.inputs.mf10_code,
+                             "ap_code"    : self.inputs.ap_code,
+                             "cf10m_code" : self.inputs.cf10m_code,
+                             "prep_code"  : self.inputs.prep_code,
+                             "structure"  : structure,
+                             "parameters" : self.inputs.dft_parameters },
+                   "run_qmc" : Bool(self.ctx.run_qmc) }
+        if self.ctx.run_qmc:
+            inputs["qmc"] = { "vmcopt_code" : self.inputs.vmcopt_code,
+                              "vmc_code"    : self.inputs.vmc_code,
+                              "lrdmc_code"  : self.inputs.lrdmc_code,
+                              "parameters"  : self.inputs.qmc_parameters }
+        shared = self.inputs.shared.get_dict() if "shared" in self.inputs else {}
+        if atom_key(structure) in shared:
+            inputs["dft"]["pseudo"] = load_node(shared[atom_key(structure)])
+        return inputs
+
+    def submit_next(self):
+        structure = load_node(self.ctx.pending[0])
+        if self.inputs.assembly.value:
+            future = self.submit(Assembly,
+                                 mf10_code  = self.inputs.mf10_code,
+                                 ap_code    = self.inputs.ap_code,
+                                 structure  = structure,
+                                 parameters = self.inputs.dft_parameters)
+        else:
+            future = self.submit(DFTQMC, **self.pipeline_inputs(structure))
+        return ToContext(current = future)
+
+    def inspect_next(self):
+        self.ctx.done.append((self.ctx.pending.pop(0), self.ctx.current.pk))
+
+    def results(self):
+        inputs = {}
+        for ii, (uuid, pk) in enumerate(self.ctx.done):
+            node = load_node(pk)
+            inputs[f"t{ii}_structure"] = load_node(uuid)
+            inputs[f"t{ii}_pk"] = Int(pk)
+            if node.exit_status is not None:
+                inputs[f"t{ii}_exit_status"] = Int(node.exit_status)
+            for name in RESULT_NAMES[2:]:
+                if name in node.outputs:
+                    inputs[f"t{ii}_{name}"] = node.outputs[name]
+        failed = len([ x for x in self.ctx.done if load_node(x[1]).exit_status != 0 ])
+        self.report(f"Finished {len(self.ctx.done)} structures, {failed} failed")
+        self.out("results", collect_results(**inputs))
+
+class Batch(WorkChain):
+    """
+    DFT and QMC for all structures of a group
+
+    The structures are distributed over at most ``max_inflight`` lanes
+    (see :class:`BatchLane`), so that no Code has more than ``max_inflight``
+    active CalcJobs, the CalcJobs started by other processes are counted
+    too. A lane submits its next structure as soon as the previous one
+    finished.
+
+    If pseudo potentials are used, structures with the same atoms in the
+    same order (see :func:`atom_key`) share the assembled pseudo potential.
+    It is prepared first, once for every such group of structures. The
+    basis is set by the DFT parameters, makefort10 runs for every
+    structure, since the symmetries and the tied parameters of ``fort.10``
+    depend on the geometry.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        super(Batch, cls).define(spec)
+        spec.expose_inputs(BatchLane, exclude=("structures", "assembly", "shared"))
+        spec.input("structures", valid_type = Group, help="Group of StructureData")
+        spec.output("results", valid_type = Dict)
+        spec.outline(
+            cls.setup,
+            if_(cls.has_shared)(
+                cls.assemble,
+                cls.inspect_assembly),
+            cls.run_lanes,
+            cls.results
+        )
+        spec.exit_code(300, 'ERROR_NO_STRUCTURES', message='The group contains no StructureData.')
+
+    def setup(self):
+        structures = [ node for node in self.inputs.structures.nodes if isinstance(node, StructureData) ]
+        if not structures:
+            return self.exit_codes.ERROR_NO_STRUCTURES
+
+        self.ctx.structures = [ node.uuid for node in structures ]
+        self.ctx.keys = { node.uuid : atom_key(node) for node in structures }
+        # The first structure of every key shared by more structures assembles the pseudo potential
+        self.ctx.references = {}
+        counts = {}
+        for uuid in self.ctx.structures:
+            key = self.ctx.keys[uuid]
+            counts[key] = counts.get(key, 0) + 1
+            self.ctx.references.setdefault(key, uuid)
+        self.ctx.references = { key : uuid for key, uuid in self.ctx.references.items() if counts[key] > 1 }
+        if "pseudo" not in self.inputs.dft_parameters.get_dict():
+            self.ctx.references = {}
+        self.ctx.shared = {}
+
+    def has_shared(self):
+        return len(self.ctx.references) > 0
+
+    def submit_lanes(self, structures, **kwargs):
+        inputs = self.exposed_inputs(BatchLane)
+        nlanes = min(self.inputs.max_inflight.value, len(structures))
+        lanes = {}
+        for ii in range(nlanes):
+            lanes[f"lane_{ii}"] = self.submit(BatchLane,
+                                              structures = List(list=structures[ii::nlanes]),
+                                              **inputs,
+                                              **kwargs)
+        self.ctx.lanes = list(lanes.keys())
+        self.report(f"Submitted {len(structures)} structures in {nlanes} lanes")
+        return ToContext(**lanes)
+
+    def assemble(self):
+        return self.submit_lanes(list(self.ctx.references.values()), assembly = Bool(True))
+
+    def inspect_assembly(self):
+        for label in self.ctx.lanes:
+            lane = self.ctx[label]
+            if "results" not in lane.outputs:
+                continue
+            for uuid, result in lane.outputs.results.get_dict().items():
+                if result.get("exit_status", None) != 0:
+                    self.report(f"Assembly of structure {uuid} failed, its group assembles pseudo separately")
+                    continue
+                self.ctx.shared[self.ctx.keys[uuid]] = result["pseudo"]
+
+    def run_lanes(self):
+        # Structures of the same key are spread over the lanes
+        structures = sorted(self.ctx.structures, key=lambda x: self.ctx.keys[x])
+        return self.submit_lanes(structures, shared = Dict(dict=self.ctx.shared))
+
+    def results(self):
+        results = {}
+        for label in self.ctx.lanes:
+            lane = self.ctx[label]
+            if "results" in lane.outputs:
+                results[label] = lane.outputs.results
+            else:
+                self.report(f"Lane pk {lane.pk} did not finish, its structures are missing in the results")
+        self.out("results", merge_results(**results))
@@ -1,4 +1,4 @@
-from aiida.orm import Int, Float, Dict, StructureData, Code, Str
+from aiida.orm import Int, Float, Dict, StructureData, Code, Str, SinglefileData
 from aiida.engine import WorkChain, ToContext, calcfunction, if_
 from aiida.plugins.factories import CalculationFactory
 
@@ -83,7 +83,11 @@ class DFT(WorkChain):
         spec.input("prep_code", valid_type = Code)
         spec.input("structure", valid_type = StructureData)
         spec.input("parameters", valid_type = Dict)
+        spec.input("pseudo", valid_type = SinglefileData, required=False,
+                   help="Assembled pseudo potential, assembling pseudo is skipped if given")
         spec.output("energy", valid_type = Float)
+        spec.output("fort10", valid_type = SinglefileData, required=False)
+        spec.output("pseudo", valid_type = SinglefileData, required=False)
         spec.outline(
             cls.mf10,
             if_(cls.is_pseudo)(cls.ap),
@@ -94,7 +98,17 @@ class DFT(WorkChain):
 
     def is_pseudo(self):
         parameters = self.inputs.parameters.get_dict()
-        return "pseudo" in parameters
+        return "pseudo" in parameters and "pseudo" not in self.inputs
+
+    def get_basis(self):
+        return self.ctx.mf10.outputs.fort10
+
+    def get_pseudo(self):
+        if "pseudo" in self.inputs:
+            return self.inputs.pseudo
+        if "ap" in self.ctx:
+            return self.ctx.ap.outputs.pseudo
+        return None
 
     def mf10(self):
         inputs = dict( code       = self.inputs.mf10_code,
@@ -106,7 +120,7 @@ class DFT(WorkChain):
 
     def ap(self):
         inputs = dict( code       = self.inputs.ap_code,
-                       fort10     = self.ctx.mf10.outputs.fort10,
+                       fort10     = self.get_basis(),
                        parameters = prepare_AP_pars(self.inputs.parameters)
                      )
         future = self.submit(AP, **inputs)
@@ -114,12 +128,11 @@ class DFT(WorkChain):
 
     def cf10m(self):
         inputs = dict( code       = self.inputs.cf10m_code,
-                       fort10     = self.ctx.mf10.outputs.fort10,
+                       fort10     = self.get_basis(),
                        parameters = prepare_CF10M_pars(self.inputs.parameters) )
-        try:
-            inputs["pseudo"] = self.ctx.ap.outputs.pseudo
-        except:
-            pass
+        pseudo = self.get_pseudo()
+        if pseudo is not None:
+            inputs["pseudo"] = pseudo
         future = self.submit(Cf10m, **inputs)
         return ToContext(cf10m = future)
 
@@ -128,17 +141,15 @@ class DFT(WorkChain):
                        fort10     = self.ctx.cf10m.outputs.fort10,
                        parameters = prepare_PREP_pars(self.inputs.parameters,
                                                       self.inputs.structure) )
-        try:
-            inputs["pseudo"] = self.ctx.ap.outputs.pseudo
-        except:
-            pass
+        pseudo = self.get_pseudo()
+        if pseudo is not None:
+            inputs["pseudo"] = pseudo
         future = self.submit(Prep, **inputs)
         return ToContext(prep = future)
 
     def energy(self):
         self.out("energy", self.ctx.prep.outputs.energy)
-        try:
+        self.out("fort10", self.ctx.prep.outputs.fort10)
+        if "pseudo" in self.ctx.prep.inputs:
             self.out("pseudo", self.ctx.prep.inputs.pseudo)
-        except:
-            pass
 
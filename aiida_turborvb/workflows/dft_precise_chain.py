@@ -1,4 +1,4 @@
-from aiida.orm import Int, Float, Dict, StructureData, Code, Str
+from aiida.orm import Int, Float, Dict, StructureData, Code, Str, Bool
 from aiida.engine import WorkChain, ToContext, calcfunction, if_, while_
 from aiida.plugins.factories import CalculationFactory
 
@@ -9,6 +9,9 @@ AP    = CalculationFactory('turborvb.assemblingpseudowrp')
 Cf10m = CalculationFactory('turborvb.convertfort10molwrp')
 Prep  = CalculationFactory('turborvb.prepwrp')
 
+#: Namelist values of warm-started preps, prep reads the initial orbitals from fort.10 with iopt = 0
+WARM_START_NAMELIST = { "iopt" : 0 }
+
 def add_this(name, src, dst):
     if name in src:
         dst[name] = src[name]
@@ -37,7 +40,7 @@ def prepare_CF10M_pars(pars):
     return ret
 
 @calcfunction
-def prepare_PREP_pars(pars, structure, density):
+def prepare_PREP_pars(pars, structure, density, warm_start=None):
     p = pars.get_dict()
     structure_ = structure.get_ase()
     positions = structure_.get_positions()
@@ -55,6 +58,11 @@ def prepare_PREP_pars(pars, structure, density):
 
     for prop in ("box", "doublegrid"):
         add_this(prop, p, ret)
+    if "prep_namelist_update" in p:
+        ret["namelist_update"] = dict(p["prep_namelist_update"])
+    if warm_start is not None and warm_start.value:
+        ret.setdefault("namelist_update", {}).update(WARM_START_NAMELIST)
+        ret["namelist_update"].update(p.get("warm_start_namelist_update", {}))
     ret = Dict(dict=ret)
     return ret
 
@@ -73,13 +81,35 @@ def calc_density_convergence(**kwargs):
             if index not in data:
                 data[index] = {}
             data[index]["energy"] = v
+        if "iterations" in k:
+            index = int(k.replace("iterations_",""))
+            if index not in data:
+                data[index] = {}
+            data[index]["iterations"] = v
     for index, d in data.items():
-        if len(d) != 2: continue
+        if "density" not in d or "energy" not in d: continue
         ret["density"].append([d["density"], d["energy"]])
+        if "iterations" in d:
+            ret.setdefault("scf_iterations", []).append([d["density"], d["iterations"]])
 
     return Dict(dict = ret)
 
 
+def extrapolate_grid(densities, energies, degree=2):
+    """
+    Fit energy as a polynomial in the squared grid spacing
+
+    :returns: extrapolated energy at zero spacing and the estimated error
+        of the energy of the finest grid
+    """
+    import numpy as np
+    h2 = np.asarray(densities, dtype=float)**2
+    energies = np.asarray(energies, dtype=float)
+    degree = min(degree, len(h2) - 1)
+    coefs = np.polyfit(h2, energies, degree)
+    e0 = coefs[-1]
+    return e0, abs(energies[np.argmin(h2)] - e0)
+
 @calcfunction
 def get_energy():
     return Float(0.0)
@@ -87,6 +117,20 @@ def get_energy():
 class DFTPrecise(WorkChain):
     """
     A workflow for DFT precise calculation using TurboDFT
+
+    The grid densities are independent, all Prep calculations of the sweep
+    are submitted at once. With ``max_concurrent`` in the parameters the
+    sweep is submitted in waves of at most that many calculations.
+
+    With ``adaptive`` in the parameters the sweep starts with two
+    densities and the energy is extrapolated to zero grid spacing after
+    every wave. The next, finer density is added only while the estimated
+    error of the finest grid is larger than ``tolerance``.
+
+    With ``warm_start`` every Prep starts from the orbitals in
+    ``fort.10_new`` of the finest density finished so far, taken from its
+    remote folder. The densities then run one after another, or in waves
+    of ``max_concurrent`` starting from the previous wave.
     """
 
     @classmethod
@@ -105,16 +149,34 @@ class DFTPrecise(WorkChain):
             if_(cls.is_pseudo)(cls.ap),
             cls.cf10m,
             while_(cls.is_finished)(
-                cls.prep),
+                cls.prep,
+                cls.inspect_prep),
             cls.energy
         )
 
     def setup(self):
-        self.density = 0.10
-        self.stopdensity = 0.08
-        self.deltadensity = 0.005
-        self.density += self.deltadensity
-        self.index = -1
+        parameters = self.inputs.parameters.get_dict()
+        if "densities" in parameters:
+            densities = [ float(x) for x in parameters["densities"] ]
+        else:
+            densities = []
+            density = 0.10
+            while 0.08 < density:
+                densities.append(round(density, 6))
+                density -= 0.005
+        self.ctx.max_concurrent = parameters.get("max_concurrent", None)
+        self.ctx.index = 0
+        self.ctx.warm_start = parameters.get("warm_start", False)
+
+        self.ctx.adaptive = parameters.get("adaptive", False)
+        if self.ctx.adaptive:
+            self.ctx.tolerance = float(parameters.get("tolerance", 1e-4))
+            self.ctx.step = densities[0] - densities[1] if len(densities) > 1 else 0.005
+            self.ctx.min_density = float(parameters.get("min_density", 0.05))
+            self.ctx.max_points = int(parameters.get("max_points", 8))
+            self.ctx.refine = parameters.get("refine", False)
+            densities = [densities[0], densities[0] - self.ctx.step]
+        self.ctx.densities = densities
 
     def is_pseudo(self):
         parameters = self.inputs.parameters.get_dict()
@@ -143,43 +205,104 @@ class DFTPrecise(WorkChain):
         future = self.submit(Cf10m, **inputs)
         return ToContext(cf10m = future)
 
-    def prep(self):
+    def previous_prep(self, index):
+        """
+        Last successful Prep before ``index``, all of them have to be finished
+        """
+        for previous in range(index - 1, -1, -1):
+            prep = self.ctx[f"prep_{previous}"]
+            if prep.is_finished_ok:
+                return prep
+        return None
+
+    def submit_prep(self, index, density):
+        # Preps of the same wave run at the same time, start from the previous wave
+        parent = self.previous_prep(self.ctx.index) if self.ctx.warm_start else None
         parameters = prepare_PREP_pars(self.inputs.parameters,
-                                                      self.inputs.structure,
-                                                      Float(self.density))
+                                       self.inputs.structure,
+                                       Float(density),
+                                       Bool(parent is not None))
         inputs = dict( code       = self.inputs.prep_code,
-                       fort10     = self.ctx.cf10m.outputs.fort10,
                        parameters = parameters)
+        if parent is None:
+            inputs["fort10"] = self.ctx.cf10m.outputs.fort10
+        else:
+            inputs["parent_folder"] = parent.outputs.remote_folder
+            self.report(f"Density {density} starts from orbitals of pk {parent.pk}")
         try:
             inputs["pseudo"] = self.ctx.ap.outputs.pseudo
         except:
             pass
-        self.report("Running density {}".format(self.density))
-        future = self.submit(Prep, **inputs)
-        tocontext = {f"prep_{self.index}" : future}
-        self.report(f"Adding {tocontext} {parameters.get_dict()}")
+        self.report("Running density {}".format(density))
+        return self.submit(Prep, **inputs)
+
+    def prep(self):
+        stop = len(self.ctx.densities)
+        if self.ctx.max_concurrent:
+            stop = min(stop, self.ctx.index + int(self.ctx.max_concurrent))
+        elif self.ctx.warm_start:
+            stop = min(stop, self.ctx.index + 1)
+
+        tocontext = {}
+        for index in range(self.ctx.index, stop):
+            tocontext[f"prep_{index}"] = self.submit_prep(index, self.ctx.densities[index])
+        self.ctx.index = stop
+        self.report(f"Submitted {len(tocontext)} densities, {stop} of {len(self.ctx.densities)}")
         return ToContext(**tocontext)
 
     def is_finished(self):
-        self.density -= self.deltadensity
-        self.index += 1
+        return self.ctx.index < len(self.ctx.densities)
 
-        if self.stopdensity < self.density:
-            return True
-        return False
+    def finished_points(self):
+        densities, energies = [], []
+        for index in range(self.ctx.index):
+            prep = self.ctx[f"prep_{index}"]
+            if "energy" in prep.outputs:
+                densities.append(self.ctx.densities[index])
+                energies.append(prep.outputs.energy.value)
+        return densities, energies
+
+    def inspect_prep(self):
+        if not self.ctx.adaptive or self.ctx.index < len(self.ctx.densities):
+            return
+
+        densities, energies = self.finished_points()
+        if len(densities) < 2:
+            self.report("Less than two densities finished, stopping the sweep")
+            return
+
+        e0, error = extrapolate_grid(densities, energies)
+        self.report(f"Extrapolated energy {e0}, estimated grid error {error}")
+        if error < self.ctx.tolerance:
+            self.report(f"Grid converged at density {min(densities)}")
+            return
+        if len(self.ctx.densities) >= self.ctx.max_points:
+            self.report("Maximum number of densities reached, grid not converged")
+            return
+
+        if self.ctx.refine and error < 4 * self.ctx.tolerance:
+            self.ctx.step /= 2
+        density = round(self.ctx.densities[-1] - self.ctx.step, 6)
+        if density < self.ctx.min_density:
+            self.report("Minimum density reached, grid not converged")
+            return
+        self.ctx.densities.append(density)
 
     def energy(self):
         data = {}
-        while True:
-            self.index -= 1
-            if self.index < 0: break
-            prep = getattr(self.ctx, f"prep_{self.index}")
-            data[f"density_{self.index}"] = prep.inputs.parameters.get_dict()["grid"]
-            data[f"energy_{self.index}"] = prep.outputs.energy
+        for index in range(self.ctx.index):
+            prep = self.ctx[f"prep_{index}"]
+            if "energy" not in prep.outputs:
+                self.report(f"Density {self.ctx.densities[index]} did not finish, skipping")
+                continue
+            data[f"density_{index}"] = Float(self.ctx.densities[index])
+            data[f"energy_{index}"] = prep.outputs.energy
+            if "convergance" in prep.outputs:
+                iterations = len(prep.outputs.convergance.get_list())
+                data[f"iterations_{index}"] = Int(iterations)
+                self.report(f"Density {self.ctx.densities[index]}: {iterations} SCF iterations")
 
         self.report(data)
         density_conv = calc_density_convergence(**data)
         self.report(density_conv.get_dict())
         self.out("density_convergance", density_conv)
-
-
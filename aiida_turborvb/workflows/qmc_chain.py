@@ -90,13 +90,11 @@ class QMC(WorkChain):
         return ToContext(vmc = future)
 
     def lrdmc(self):
-        inputs = dict( code         = self.inputs.lrdmc_code,
-                       fort10       = self.ctx.vmcopt.outputs.fort10_averaged,
-                       fort11       = self.ctx.vmc.outputs.fort11,
-                       fort12       = self.ctx.vmc.outputs.fort12,
-                       scratch      = self.ctx.vmc.outputs.scratch,
-                       trial_energy = self.ctx.vmc.outputs.energy,
-                       parameters   = prepare_LRDMC_pars(self.inputs.parameters) )
+        inputs = dict( code          = self.inputs.lrdmc_code,
+                       fort10        = self.ctx.vmcopt.outputs.fort10_averaged,
+                       parent_folder = self.ctx.vmc.outputs.remote_folder,
+                       trial_energy  = self.ctx.vmc.outputs.energy,
+                       parameters    = prepare_LRDMC_pars(self.inputs.parameters) )
         if "pseudo" in self.inputs:
             inputs["pseudo"] = self.inputs.pseudo
         future = self.submit(Lrdmc, **inputs)
@@ -0,0 +1,109 @@
+from aiida.common import AttributeDict
+from aiida.orm import Int, Dict
+from aiida.engine import BaseRestartWorkChain, ExitCode, ProcessHandlerReport, process_handler, while_
+from aiida.plugins.factories import CalculationFactory
+
+from aiida_turborvb.workflows.adaptive_chain import prepare_continuation_pars
+
+Vmcopt = CalculationFactory('turborvb.vmcoptwrp')
+Vmc    = CalculationFactory('turborvb.vmcwrp')
+Lrdmc  = CalculationFactory('turborvb.lrdmcwrp')
+
+#: ERROR_JOB_INTERRUPTED of the QMC wrapper CalcJobs
+JOB_INTERRUPTED = ExitCode(320)
+
+class QMCRestart(BaseRestartWorkChain):
+    """
+    QMC wrapper calculation resubmitted after interruptions
+
+    If a run is interrupted (e.g. out of walltime), the next run continues
+    with ``iopt = 0`` from fort.11, fort.12 and turborvb.scratch left in its
+    remote folder, for the steps that were not done yet. Completed steps
+    are counted from the blocks of ``fort.12`` (``blockdata``) or, for the
+    optimization, from ``completed_iterations``, times ``nweight``; fort.12
+    is copied to the continuation, which appends its blocks. Without
+    ``nweight`` in ``namelist_update`` the full ``ngen`` is run again.
+    """
+
+    _process_class = Vmc
+    # Top level parameters of continuation runs
+    _continuation_options = { "parent_folder_fort12" : True }
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+        spec.expose_inputs(cls._process_class, namespace="calc")
+        spec.expose_outputs(cls._process_class)
+        spec.outline(
+            cls.setup,
+            while_(cls.should_run_process)(
+                cls.run_process,
+                cls.inspect_process),
+            cls.results
+        )
+
+    def setup(self):
+        super().setup()
+        self.ctx.inputs = AttributeDict(self.exposed_inputs(self._process_class, "calc"))
+        namelist = self.ctx.inputs.parameters.get_dict().get("namelist_update", {})
+        self.ctx.ngen = namelist.get("ngen", None)
+        self.ctx.nweight = namelist.get("nweight", None)
+        self.ctx.done = 0
+
+    def remaining_steps(self, node):
+        """
+        Steps left after the interrupted run, ``None`` if unknown
+        """
+        if self.ctx.ngen is None:
+            return None
+        if self.ctx.nweight is None:
+            return self.ctx.ngen
+        if "completed_iterations" in node.outputs:
+            # Steps of this run only, story.d is not continued
+            self.ctx.done += node.outputs.completed_iterations.value * self.ctx.nweight
+            done = self.ctx.done
+        elif "blockdata" in node.outputs:
+            # Blocks of all runs, fort.12 is continued
+            done = len(node.outputs.blockdata.get_array("energy")) * self.ctx.nweight
+        else:
+            return self.ctx.ngen
+        return max(self.ctx.ngen - done, self.ctx.nweight)
+
+    @process_handler(priority=500, exit_codes=[JOB_INTERRUPTED])
+    def handle_interrupted(self, node):
+        """
+        Continue from the restart files of the interrupted run
+        """
+        self.ctx.inputs.parent_folder = node.outputs.remote_folder
+        for key in ("fort11", "fort12", "scratch", "scratch_archive"):
+            self.ctx.inputs.pop(key, None)
+
+        remaining = self.remaining_steps(node)
+        if remaining is None:
+            remaining = self.ctx.inputs.parameters.get_dict().get("namelist_update", {}).get("ngen", 0)
+        self.ctx.inputs.parameters = prepare_continuation_pars(self.ctx.inputs.parameters,
+                                                               Int(remaining),
+                                                               Dict(dict=self._continuation_options))
+        self.report(f"{node.process_label}<{node.pk}> was interrupted, continuing for {remaining} steps")
+        return ProcessHandlerReport(do_break=True)
+
+class VmcRestart(QMCRestart):
+    """
+    VMC wrapper calculation resubmitted after interruptions
+    """
+    _process_class = Vmc
+
+class LrdmcRestart(QMCRestart):
+    """
+    LRDMC wrapper calculation resubmitted after interruptions
+    """
+    _process_class = Lrdmc
+
+class VmcoptRestart(QMCRestart):
+    """
+    VMC optimization resubmitted after interruptions, the wavefunction
+    optimized so far is taken from the remote folder
+    """
+    _process_class = Vmcopt
+    _continuation_options = { "parent_folder_fort12" : True,
+                              "parent_folder_fort10" : True }
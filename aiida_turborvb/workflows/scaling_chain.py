@@ -0,0 +1,208 @@
+from aiida.common import AttributeDict
+from aiida.orm import Int, Dict, List, Str
+from aiida.engine import WorkChain, ToContext, calcfunction, while_
+from aiida.plugins.factories import CalculationFactory
+
+from aiida_turborvb.calc.advisor import wall_time
+
+Vmc    = CalculationFactory('turborvb.vmcwrp')
+Lrdmc  = CalculationFactory('turborvb.lrdmcwrp')
+
+#: Columns of the output tables
+COLUMNS = ("pk", "num_machines", "num_mpiprocs_per_machine", "threads", "cores", "walkers",
+           "wall_time", "energy_err", "samples_per_second", "efficiency", "core_hours_variance")
+
+@calcfunction
+def prepare_layout_pars(pars, layout):
+    """
+    Parameters of one benchmark run, OpenMP threads and walkers of the layout
+    """
+    p = pars.get_dict()
+    l = layout.get_dict()
+    p["launcher"] = dict(p.get("launcher", {}))
+    p["launcher"]["threads"] = l["threads"]
+    if l.get("nw", None) is not None:
+        p["namelist_update"] = dict(p.get("namelist_update", {}))
+        p["namelist_update"]["nw"] = l["nw"]
+    return Dict(dict=p)
+
+def scaling_table(rows):
+    """
+    Throughput, parallel efficiency and cost of the benchmark runs
+
+    The efficiency is the throughput per core relative to the first
+    successful run. ``core_hours_variance`` is the cost of the run times
+    the variance of its energy, i.e. the core hours needed for an error
+    bar of 1 Ha, divide it by the square of the requested error.
+
+    :param rows: list of dictionaries with the layout, ``ngen``, ``walkers``,
+        ``wall_time`` and ``energy_err`` of every run, ``None`` for failed runs
+    :returns: dictionary of columns
+    """
+    reference = None
+    table = { key : [] for key in COLUMNS }
+    for row in rows:
+        row = dict(row)
+        row["samples_per_second"] = row["efficiency"] = row["core_hours_variance"] = None
+        if row["wall_time"] and row["energy_err"] is not None:
+            row["samples_per_second"] = row["ngen"] * row["walkers"] / row["wall_time"]
+            per_core = row["samples_per_second"] / row["cores"]
+            if reference is None:
+                reference = per_core
+            row["efficiency"] = per_core / reference
+            row["core_hours_variance"] = row["cores"] * row["wall_time"] / 3600.0 * row["energy_err"]**2
+        for key in COLUMNS:
+            table[key].append(row[key])
+    return table
+
+@calcfunction
+def collect_scaling_table(rows):
+    """
+    Table of :func:`scaling_table` from the rows of the runs
+    """
+    return Dict(dict=scaling_table(rows.get_list()))
+
+class Scaling(WorkChain):
+    """
+    Strong or weak scaling benchmark of VMC and optionally LRDMC
+
+    Short runs of the same wavefunction are done for every layout of
+    ``layouts``, a list of dictionaries with ``num_machines`` (default 1),
+    ``num_mpiprocs_per_machine`` and ``threads`` (default 1). The threads
+    are requested as ``num_cores_per_mpiproc`` of the resources and set by
+    the launcher of the wrapper CalcJobs.
+
+    In strong scaling the number of walkers is the same for all runs. In
+    weak scaling ``nw`` of ``namelist_update`` is the number of walkers of
+    the first layout and it grows with the number of MPI processes.
+    ``ngen`` has to be in ``namelist_update``.
+
+    The runs are done ``max_concurrent`` at a time, one by default so that
+    they do not compete for the same nodes.
+    """
+
+    _calculations = { "vmc" : Vmc, "lrdmc" : Lrdmc }
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+        spec.expose_inputs(Vmc, namespace="vmc")
+        spec.expose_inputs(Lrdmc, namespace="lrdmc", exclude=("fort10", "pseudo"),
+                           namespace_options={"required": False, "populate_defaults": False})
+        spec.input("layouts", valid_type = List, help="Resources of the runs")
+        spec.input("scaling", valid_type = Str, default=lambda: Str("strong"),
+                   help="strong or weak")
+        spec.input("max_concurrent", valid_type = Int, default=lambda: Int(1),
+                   help="Maximum number of runs at the same time")
+        spec.output("vmc_table", valid_type = Dict)
+        spec.output("lrdmc_table", valid_type = Dict, required=False)
+        spec.outline(
+            cls.setup,
+            while_(cls.has_pending)(
+                cls.submit_wave,
+                cls.inspect_wave),
+            cls.results
+        )
+        spec.exit_code(300, 'ERROR_MISSING_NGEN', message='ngen is not in namelist_update of the parameters.')
+        spec.exit_code(301, 'ERROR_MISSING_NW', message='nw is not in namelist_update of the parameters, it is needed for weak scaling.')
+        spec.exit_code(302, 'ERROR_BAD_LAYOUT', message='A layout has no num_mpiprocs_per_machine or scaling is not strong or weak.')
+        spec.exit_code(401, 'ERROR_ALL_RUNS_FAILED', message='None of the runs finished.')
+
+    def setup(self):
+        self.ctx.layouts = []
+        for layout in self.inputs.layouts.get_list():
+            if "num_mpiprocs_per_machine" not in layout:
+                return self.exit_codes.ERROR_BAD_LAYOUT
+            self.ctx.layouts.append({ "num_machines"             : layout.get("num_machines", 1),
+                                      "num_mpiprocs_per_machine" : layout["num_mpiprocs_per_machine"],
+                                      "threads"                  : layout.get("threads", 1) })
+        if self.inputs.scaling.value not in ("strong", "weak"):
+            return self.exit_codes.ERROR_BAD_LAYOUT
+
+        self.ctx.kinds = ["vmc"]
+        if "lrdmc" in self.inputs and "parameters" in self.inputs.lrdmc:
+            self.ctx.kinds.append("lrdmc")
+        for kind in self.ctx.kinds:
+            namelist = self.inputs[kind].parameters.get_dict().get("namelist_update", {})
+            if "ngen" not in namelist:
+                return self.exit_codes.ERROR_MISSING_NGEN
+            if self.inputs.scaling.value == "weak" and "nw" not in namelist:
+                return self.exit_codes.ERROR_MISSING_NW
+
+        self.ctx.pending = [ (kind, ii) for kind in self.ctx.kinds for ii in range(len(self.ctx.layouts)) ]
+        self.ctx.wave = []
+        self.ctx.rows = { kind : [None] * len(self.ctx.layouts) for kind in self.ctx.kinds }
+
+    def has_pending(self):
+        return len(self.ctx.pending) > 0
+
+    def walkers(self, kind, layout):
+        """
+        Walkers of a run, TurboRVB uses one walker per process by default
+        """
+        namelist = self.inputs[kind].parameters.get_dict().get("namelist_update", {})
+        procs = layout["num_machines"] * layout["num_mpiprocs_per_machine"]
+        if self.inputs.scaling.value == "weak":
+            first = self.ctx.layouts[0]
+            return namelist["nw"] * procs // (first["num_machines"] * first["num_mpiprocs_per_machine"])
+        return namelist.get("nw", procs)
+
+    def run_inputs(self, kind, index):
+        calculation = self._calculations[kind]
+        inputs = AttributeDict(self.exposed_inputs(calculation, namespace=kind))
+        if kind != "vmc":
+            inputs["fort10"] = self.inputs.vmc.fort10
+            if "pseudo" in self.inputs.vmc:
+                inputs["pseudo"] = self.inputs.vmc.pseudo
+
+        layout = self.ctx.layouts[index]
+        nw = self.walkers(kind, layout) if self.inputs.scaling.value == "weak" else None
+        inputs["parameters"] = prepare_layout_pars(inputs["parameters"],
+                                                   Dict(dict={ "threads" : layout["threads"], "nw" : nw }))
+        metadata = AttributeDict(inputs.get("metadata", {}))
+        options = dict(metadata.get("options", {}))
+        options["resources"] = { "num_machines"             : layout["num_machines"],
+                                 "num_mpiprocs_per_machine" : layout["num_mpiprocs_per_machine"],
+                                 "num_cores_per_mpiproc"    : layout["threads"] }
+        metadata["options"] = options
+        inputs["metadata"] = metadata
+        return inputs
+
+    def submit_wave(self):
+        size = max(1, self.inputs.max_concurrent.value)
+        self.ctx.wave = self.ctx.pending[:size]
+        self.ctx.pending = self.ctx.pending[size:]
+        tocontext = {}
+        for kind, index in self.ctx.wave:
+            calculation = self._calculations[kind]
+            tocontext[f"{kind}_{index}"] = self.submit(calculation, **self.run_inputs(kind, index))
+            self.report(f"Submitted {kind} on {self.ctx.layouts[index]}")
+        return ToContext(**tocontext)
+
+    def inspect_wave(self):
+        for kind, index in self.ctx.wave:
+            node = self.ctx[f"{kind}_{index}"]
+            layout = self.ctx.layouts[index]
+            namelist = self.inputs[kind].parameters.get_dict()["namelist_update"]
+            row = dict(layout)
+            row.update({ "pk"         : node.pk,
+                         "cores"      : layout["num_machines"] * layout["num_mpiprocs_per_machine"] * layout["threads"],
+                         "walkers"    : self.walkers(kind, layout),
+                         "ngen"       : namelist["ngen"],
+                         "wall_time"  : None,
+                         "energy_err" : None })
+            if node.is_finished_ok:
+                row["wall_time"] = wall_time(node)
+                row["energy_err"] = node.outputs.energy_err.value
+            else:
+                self.report(f"{kind} on {layout} failed with exit status {node.exit_status}")
+            self.ctx.rows[kind][index] = row
+
+    def results(self):
+        finished = False
+        for kind in self.ctx.kinds:
+            table = collect_scaling_table(List(list=self.ctx.rows[kind]))
+            finished = finished or any([ x is not None for x in table["energy_err"] ])
+            self.out(f"{kind}_table", table)
+        if not finished:
+            return self.exit_codes.ERROR_ALL_RUNS_FAILED
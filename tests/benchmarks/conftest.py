@@ -0,0 +1,51 @@
+"""
+Code and input nodes of the benchmarks, stored in a temporary AiiDA profile
+
+The fixtures of aiida-core are imported here rather than declared in
+``pytest_plugins`` of a top-level conftest, so that only the benchmarks
+need a database. The ``--synthetic-*`` options are available when pytest
+is started on this directory, e.g. ``pytest tests/benchmarks``.
+"""
+import pytest
+from aiida.manage.tests.pytest_fixtures import *  # pylint: disable=wildcard-import,unused-wildcard-import
+from aiida.orm import SinglefileData, StructureData
+
+from aiida_turborvb.mock.synthetic import DEFAULT_SIZE, get_size, task_labels, write_fort10, write_text
+
+def pytest_addoption(parser):
+    group = parser.getgroup("turborvb", "size of the synthetic TurboRVB outputs of the benchmarks")
+    for key, value in DEFAULT_SIZE.items():
+        group.addoption(f"--synthetic-{key.replace('_', '-')}", type=int, default=value, dest=f"synthetic_{key}")
+
+@pytest.fixture(scope="session")
+def synthetic_size(request):
+    """
+    Size of the synthetic outputs set by the ``--synthetic-*`` options
+    """
+    return get_size({ key : request.config.getoption(f"synthetic_{key}", value) for key, value in DEFAULT_SIZE.items() })
+
+@pytest.fixture
+def turborvb_code(aiida_profile, aiida_local_code_factory):
+    """
+    Code on the local computer, the executable is never run
+    """
+    return aiida_local_code_factory("turborvb.vmcwrp", "bash")
+
+@pytest.fixture
+def input_nodes(aiida_profile, synthetic_size, tmp_path):
+    """
+    Stored input nodes shared by the cases
+    """
+    path = tmp_path / "fort.10"
+    write_fort10(str(path), synthetic_size["nel"], synthetic_size["nshell"])
+    fort10 = SinglefileData(file=str(path)).store()
+    path = tmp_path / "pseudo.dat"
+    write_text(str(path), "ECP\n" + "1.0 2.0 3.0\n" * synthetic_size["nshell"])
+    pseudo = SinglefileData(file=str(path)).store()
+    structure = StructureData(cell=[[10.0, 0.0, 0.0], [0.0, 10.0, 0.0], [0.0, 0.0, 10.0]])
+    structure.append_atom(position=(0.0, 0.0, 0.0), symbols="H")
+    structure.append_atom(position=(0.0, 0.0, 0.74), symbols="H")
+    return { "fort10"       : fort10,
+             "pseudo"       : pseudo,
+             "structure"    : structure.store(),
+             "fort10_tasks" : { label : fort10 for label in task_labels(synthetic_size["tasks"]) } }
@@ -0,0 +1,149 @@
+"""
+Overhead of the plugin layer: ``prepare_for_submission`` and the parsers
+
+Every wrapper CalcJob of the package is prepared and every parser is run
+on synthetic outputs of configurable size (see
+:mod:`aiida_turborvb.mock.synthetic`) in a temporary profile. The peak of
+the Python memory allocations of one call is saved in ``extra_info``::
+
+    pytest tests/benchmarks --synthetic-nblocks 100000 --benchmark-autosave
+    pytest tests/benchmarks --synthetic-nblocks 100000 --benchmark-compare --benchmark-compare-fail=min:50%
+
+The stand-alone CalcJobs need basis sets and pseudo potentials of
+aiida-gaussian-datatypes, only their parsers are run.
+"""
+import shutil
+import tracemalloc
+
+import pytest
+from aiida.common import exceptions
+from aiida.common.folders import SandboxFolder
+from aiida.common.links import LinkType
+from aiida.engine.utils import instantiate_process
+from aiida.manage.manager import get_manager
+from aiida.orm import CalcJobNode, Dict, FolderData
+from aiida.plugins import CalculationFactory, ParserFactory
+
+from aiida_turborvb.auxiliary.retrieval import FINISHED_MARKER, RAW_FILES
+from aiida_turborvb.mock.synthetic import write_outputs
+
+#: Cases: name, entry point, kind of synthetic outputs, parameters and inputs besides parameters
+CASES = (("makefort10wrp",         "turborvb.makefort10wrp",       "makefort10",       {"basis": "cc-pVDZ"}, ("structure", )),
+         ("convertfort10molwrp",   "turborvb.convertfort10molwrp", "convertfort10mol", {}, ("fort10", )),
+         ("assemblingpseudowrp",   "turborvb.assemblingpseudowrp", "assemblingpseudo", {"pseudo": "BFD"}, ("fort10", )),
+         ("prepwrp",               "turborvb.prepwrp",             "prep",             {"grid": 0.1}, ("fort10", "pseudo")),
+         ("dftwrp",                "turborvb.dftwrp",              "dft",              {"grid": 0.1, "pseudo": "BFD"}, ("structure", )),
+         ("vmcoptwrp",             "turborvb.vmcoptwrp",           "vmcopt",           {"namelist_update": {"ngen": 1000}}, ("fort10", "pseudo")),
+         ("vmcwrp",                "turborvb.vmcwrp",              "vmc",              {"namelist_update": {"ngen": 1000}}, ("fort10", "pseudo")),
+         ("vmcwrp[native]",        "turborvb.vmcwrp",              "vmc",              {"postprocess": "native"}, ("fort10", "pseudo")),
+         ("vmcwrp[discard_raw]",   "turborvb.vmcwrp",              "vmc",              {"postprocess": "native", "discard_raw": True}, ("fort10", "pseudo")),
+         ("lrdmcwrp",              "turborvb.lrdmcwrp",            "lrdmc",            {"namelist_update": {"ngen": 1000}}, ("fort10", "pseudo")),
+         ("lrdmcwrp[native]",      "turborvb.lrdmcwrp",            "lrdmc",            {"postprocess": "native", "correcting_factors": 20}, ("fort10", "pseudo")),
+         ("vmclrdmcwrp",           "turborvb.vmclrdmcwrp",         "vmclrdmc",         {}, ("fort10", "pseudo")),
+         ("packedwrp[vmc]",        "turborvb.packedwrp",           "packed_vmc",       {"kind": "vmc"}, ("fort10_tasks", )),
+         ("packedwrp[prep]",       "turborvb.packedwrp",           "packed_prep",      {"kind": "prep"}, ("fort10_tasks", )),
+         ("makefort10sa",          "turborvb.makefort10sa",        "makefort10",       None, ()),
+         ("assemblingpseudosa",    "turborvb.assemblingpseudosa",  "assemblingpseudo", None, ()))
+
+def load_plugin(factory, entry_point):
+    """
+    Class of the plugin, the case is skipped if it cannot be loaded
+    """
+    try:
+        return factory(entry_point)
+    except (exceptions.EntryPointError, ImportError) as exc:
+        # e.g. the stand-alone CalcJobs without aiida-gaussian-datatypes
+        pytest.skip(f"{entry_point} cannot be loaded: {exc}")
+
+def case_inputs(case, nodes, size):
+    """
+    Inputs of a case and the resources of the calculation
+    """
+    name, entry_point, kind, parameters, ports = case
+    resources = { "num_machines" : 1, "num_mpiprocs_per_machine" : size["nprocs"] }
+    inputs = { "parameters" : Dict(dict=parameters or {}).store() }
+    for port in ports:
+        if port == "fort10_tasks":
+            inputs["fort10"] = nodes[port]
+            resources["num_mpiprocs_per_machine"] = size["tasks"]
+        else:
+            inputs[port] = nodes[port]
+    return inputs, resources
+
+def calcjob_node(entry_point, inputs, resources, code, retrieved_dir):
+    """
+    Stored CalcJobNode with the inputs and a retrieved folder
+    """
+    node = CalcJobNode(computer=code.computer, process_type=f"aiida.calculations:{entry_point}")
+    node.set_option("resources", resources)
+    node.set_option("input_filename", "execute.sh")
+    node.set_option("output_filename", "execute.out")
+    for port, value in inputs.items():
+        values = value.items() if isinstance(value, dict) else [(None, value)]
+        for key, item in values:
+            label = port if key is None else f"{port}__{key}"
+            node.add_incoming(item, link_type=LinkType.INPUT_CALC, link_label=label)
+    node.add_incoming(code, link_type=LinkType.INPUT_CALC, link_label="code")
+    node.store()
+    retrieved = FolderData()
+    retrieved.put_object_from_tree(str(retrieved_dir))
+    retrieved.add_incoming(node, link_type=LinkType.CREATE, link_label="retrieved")
+    retrieved.store()
+    return node
+
+def peak_memory(function):
+    """
+    Peak of the Python memory allocations of one call
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize("case", [ x for x in CASES if x[3] is not None ], ids=lambda x: x[0])
+def test_prepare(benchmark, case, input_nodes, turborvb_code, synthetic_size):
+    """
+    ``prepare_for_submission`` of the CalcJob
+    """
+    calculation = load_plugin(CalculationFactory, case[1])
+    inputs, resources = case_inputs(case, input_nodes, synthetic_size)
+    inputs = dict(inputs, code=turborvb_code, metadata={ "options" : { "resources" : resources } })
+    process = instantiate_process(get_manager().get_runner(), calculation, **inputs)
+
+    def prepare():
+        with SandboxFolder() as folder:
+            process.prepare_for_submission(folder)
+
+    benchmark.extra_info["peak_memory"] = peak_memory(prepare)
+    benchmark(prepare)
+
+@pytest.mark.parametrize("case", CASES, ids=lambda x: x[0])
+def test_parse(benchmark, case, input_nodes, turborvb_code, synthetic_size, tmp_path):
+    """
+    Parser on synthetic outputs of a finished run
+    """
+    name, entry_point, kind, parameters, ports = case
+    parser = load_plugin(ParserFactory, entry_point)
+    inputs, resources = case_inputs(case, input_nodes, synthetic_size)
+    retrieved_dir = tmp_path / "retrieved"
+    temporary_dir = tmp_path / "temporary"
+    retrieved_dir.mkdir()
+    temporary_dir.mkdir()
+    write_outputs(kind, str(retrieved_dir), synthetic_size, marker=FINISHED_MARKER)
+    if (parameters or {}).get("discard_raw", False):
+        for raw in RAW_FILES:
+            if (retrieved_dir / raw).exists():
+                shutil.move(str(retrieved_dir / raw), str(temporary_dir))
+    node = calcjob_node(entry_point, inputs, resources, turborvb_code, retrieved_dir)
+
+    def parse():
+        _, calcfunction = parser.parse_from_node(node,
+                                                 store_provenance=False,
+                                                 retrieved_temporary_folder=str(temporary_dir))
+        return calcfunction.exit_status
+
+    benchmark.extra_info["peak_memory"] = peak_memory(parse)
+    exit_status = benchmark(parse)
+    assert exit_status in (0, None), f"{name} parser exited with status {exit_status}"
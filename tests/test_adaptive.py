@@ -0,0 +1,53 @@
+"""
+Tests of the step estimate and of the budget of the adaptive QMC workchains
+"""
+import types
+import pytest
+
+from aiida_turborvb.workflows.adaptive_chain import samples_needed, budget_steps, AdaptiveLRDMC
+
+def test_samples_needed_quadruples_for_half_error():
+    # Halving the error needs four times the steps, three times more
+    assert samples_needed(1000, 0.02, 0.01, safety=1.0) == 3000
+
+def test_samples_needed_safety():
+    # Rounded up, up to the floating point error of the product
+    assert samples_needed(1000, 0.02, 0.01) in (3300, 3301)
+
+def test_samples_needed_rounds_up():
+    assert samples_needed(10, 0.011, 0.01, safety=1.0) == 3
+
+@pytest.mark.parametrize("error", [0.01, 0.005])
+def test_samples_needed_converged(error):
+    assert samples_needed(1000, error, 0.01) <= 0
+
+def test_budget_steps():
+    # 10 core hours for 1000 steps, 5 core hours left
+    assert budget_steps(10.0, 1000, 15.0) == 500
+    assert budget_steps(20.0, 1000, 15.0) < 0
+
+def test_budget_steps_unknown_cost():
+    # e.g. only an interrupted run without countable blocks so far
+    assert budget_steps(10.0, 0, 15.0) is None
+    assert budget_steps(0.0, 1000, 15.0) is None
+
+class Inputs(dict):
+    __getattr__ = dict.__getitem__
+
+def workchain(core_hours, nsteps, ngen=1000, budget=15.0):
+    ctx = types.SimpleNamespace(core_hours=core_hours, nsteps=nsteps, ngen=ngen,
+                                converged=False, budget_exhausted=False)
+    inputs = Inputs(max_core_hours=types.SimpleNamespace(value=budget))
+    return types.SimpleNamespace(ctx=ctx, inputs=inputs, report=lambda message: None)
+
+@pytest.mark.parametrize("core_hours, nsteps, ngen, exhausted, next_ngen", [
+    (10.0, 1000, 500, False, 500),    # the next run fits
+    (10.0, 1000, 1000, False, 500),   # shortened to the budget
+    (14.9, 1000, 1000, True, 1000),   # less than ngen // 10 left
+    (16.0, 0, 1000, True, 1000),      # interrupted runs spent the budget, no steps counted
+    (5.0, 0, 1000, False, 1000) ])    # cost per step unknown, the run is not shortened
+def test_check_budget(core_hours, nsteps, ngen, exhausted, next_ngen):
+    node = workchain(core_hours, nsteps, ngen)
+    AdaptiveLRDMC.check_budget(node)
+    assert node.ctx.budget_exhausted == exhausted
+    assert node.ctx.ngen == next_ngen
@@ -0,0 +1,71 @@
+"""
+Tests of the resource advisor fitted to previous runs
+"""
+import io
+import math
+import pytest
+
+from aiida_turborvb.calc.advisor import ceil, fit_log_model, similar, run_layout, advise
+
+class Fort10:
+    """
+    Unstored fort.10 node with the header of a system
+    """
+    is_stored = False
+
+    def __init__(self, nel, nshell_det, nshell_jas, uuid="new"):
+        self.uuid = uuid
+        self.text = f" # Nelup  #Nel  # Ion\n {nel // 2} {nel} 2\n # Shell Det.   # Shell Jas.\n {nshell_det} {nshell_jas}\n"
+
+    def open(self, mode="r"):
+        return io.BytesIO(self.text.encode())
+
+def record(nel, basis, cores=64, samples=1e6, wall_time=1000.0, energy_err=1e-3, uuid="old"):
+    return { "uuid" : uuid, "nel" : nel, "basis" : basis, "cores" : cores, "samples" : samples,
+             "wall_time" : wall_time, "energy_err" : energy_err }
+
+def test_fit_recovers_power_law():
+    records = [ record(nel, basis) for nel, basis in ((10, 20), (20, 30), (40, 90), (80, 100)) ]
+    values = [ 0.5 * x["nel"]**2 * x["basis"]**0.5 for x in records ]
+    assert fit_log_model(records, values, { "nel" : 30, "basis" : 60 }) == pytest.approx(0.5 * 30**2 * 60**0.5)
+
+def test_fit_single_system_is_constant():
+    records = [ record(10, 20), record(10, 20) ]
+    assert fit_log_model(records, [2.0, 8.0], { "nel" : 40, "basis" : 80 }) == pytest.approx(4.0)
+
+def test_similar():
+    records = [ record(10, 20), record(30, 40), record(100, 100) ]
+    assert [ x["nel"] for x in similar(records, { "nel" : 20 }) ] == [10, 30]
+    assert similar(records, { "nel" : 1000 }) == records
+
+def test_run_layout():
+    resources = { "num_machines" : 2, "num_mpiprocs_per_machine" : 8 }
+    assert run_layout({}, resources) == (16, 16)
+    assert run_layout({ "namelist_update" : { "nw" : 64 } }, dict(resources, num_cores_per_mpiproc=4)) == (64, 64)
+    assert run_layout({ "launcher" : { "threads" : 2 } }, resources) == (32, 16)
+
+def test_ceil_ignores_float_error():
+    assert ceil(1000.0 * (1 + 1e-15)) == 1000
+    assert ceil(1000.001) == 1001
+    assert ceil(0.3 / 0.1) == 3
+
+def test_advise_same_wavefunction():
+    # kappa = err**2 * samples = 1, cost = wall_time * cores / samples = 0.064 core seconds
+    records = [ record(20, 30, uuid="new") ]
+    advice = advise(Fort10(20, 20, 10), 1e-3, parameters={ "namelist_update" : { "nw" : 100 } },
+                    cores_per_machine=64, max_wallclock_seconds=1e5, safety=1.0, records=records)
+    assert advice["ngen"] == 10000
+    assert advice["num_machines"] == 1
+    assert advice["wall_time"] == pytest.approx(1000.0)
+    assert advice["max_wallclock_seconds"] == 1000
+    assert advice["runs"] == 1
+
+def test_advise_more_machines_for_short_walltime():
+    records = [ record(20, 30, uuid="new") ]
+    advice = advise(Fort10(20, 20, 10), 1e-3, cores_per_machine=64, max_wallclock_seconds=300.0,
+                    safety=1.0, records=records)
+    assert advice["num_machines"] == math.ceil(1000.0 / 300.0)
+    assert advice["max_wallclock_seconds"] <= 300
+
+def test_advise_without_history():
+    assert advise(Fort10(20, 20, 10), 1e-3, records=[]) is None
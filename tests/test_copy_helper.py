@@ -0,0 +1,76 @@
+"""
+Tests of copying repository trees
+"""
+import io
+import os
+from aiida.repository import FileType
+
+from aiida_turborvb.auxiliary import copy_helper
+from aiida_turborvb.auxiliary.copy_helper import copy_tree
+
+class Repository:
+    """
+    Repository of a node holding ``files``, a dictionary of paths and contents
+
+    Listings of directories are counted.
+    """
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+        self.listings = []
+
+    def is_dir(self, path):
+        return any([ x.startswith(path + "/") for x in self.files ])
+
+    def get_object(self, path):
+        path = os.path.normpath(path)
+        return Object(os.path.basename(path), FileType.DIRECTORY if self.is_dir(path) else FileType.FILE)
+
+    def list_objects(self, path):
+        path = os.path.normpath(path)
+        self.listings.append(path)
+        names = sorted(set([ x[len(path) + 1:].split("/")[0] for x in self.files if x.startswith(path + "/") ]))
+        return [ self.get_object(f"{path}/{name}") for name in names ]
+
+    def open(self, path, mode="rb"):
+        return io.BytesIO(self.files[os.path.normpath(path)])
+
+    def put_object_from_tree(self, path):
+        for root, _, names in os.walk(path):
+            for name in names:
+                with open(os.path.join(root, name), "rb") as fhandle:
+                    self.files[os.path.relpath(os.path.join(root, name), path)] = fhandle.read()
+
+class Object:
+    def __init__(self, name, file_type):
+        self.name = name
+        self.file_type = file_type
+
+FILES = { "turborvb.scratch/kelcont.bin" : b"a" * 100,
+          "turborvb.scratch/randseed.bin" : b"b" * 10,
+          "turborvb.scratch/sub/kelcont.bin" : b"c" * 1000 }
+
+def test_copy_to_directory(tmp_path):
+    node = Repository(FILES)
+    stats = copy_tree("turborvb.scratch", ".", node, tmp_path, max_workers=2)
+    assert stats["files"] == 3
+    assert stats["bytes"] == 1110
+    assert stats["seconds"] >= 0.0
+    for name, content in FILES.items():
+        assert (tmp_path / name).read_bytes() == content
+    # Every directory is listed once
+    assert sorted(node.listings) == ["turborvb.scratch", "turborvb.scratch/sub"]
+
+def test_exclude(tmp_path):
+    node = Repository(FILES)
+    stats = copy_tree("turborvb.scratch", ".", node, tmp_path, exclude=r"turborvb.scratch/sub")
+    assert stats["files"] == 2
+    assert not (tmp_path / "turborvb.scratch" / "sub").exists()
+    # Excluded directories are not listed
+    assert node.listings == ["turborvb.scratch"]
+
+def test_copy_to_node(monkeypatch):
+    monkeypatch.setattr(copy_helper, "Node", Repository)
+    dst = Repository()
+    stats = copy_tree("turborvb.scratch", ".", Repository(FILES), dst)
+    assert stats["bytes"] == 1110
+    assert dst.files == FILES
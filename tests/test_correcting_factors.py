@@ -0,0 +1,73 @@
+"""
+Tests of the correcting factor analysis of LRDMC runs
+"""
+import numpy as np
+import pytest
+
+from aiida_turborvb.auxiliary.correcting_factors import correcting_factor_analysis
+from aiida_turborvb.auxiliary.reblocking import analyse
+
+@pytest.fixture
+def generations():
+    rng = np.random.default_rng(0)
+    return -1.0 + 0.1 * rng.standard_normal(2000), rng.uniform(0.8, 1.2, 2000)
+
+def explicit_energy(energy, weights, p, skip):
+    """
+    Weighted energy with G_i = w_{i-1} * ... * w_{i-p}, generations before ``skip`` dropped
+    """
+    g = np.array([ weights[i] * np.prod(weights[i - p:i]) for i in range(skip, energy.shape[0]) ])
+    return np.sum(g * energy[skip:]) / np.sum(g)
+
+def test_factors_as_range(generations):
+    result = correcting_factor_analysis(*generations, 3, reb=10)
+    assert result["factors"].tolist() == [0, 1, 2, 3]
+    assert result["energy"].shape == (4, )
+    assert np.all(result["energy_err"] > 0.0)
+
+@pytest.mark.parametrize("p", [0, 1, 5])
+def test_energy_matches_explicit_products(generations, p):
+    energy, weights = generations
+    # reb dividing the number of used generations keeps all of them
+    result = correcting_factor_analysis(energy, weights, [p, 5], reb=5)
+    index = result["factors"].tolist().index(p)
+    assert result["energy"][index] == pytest.approx(explicit_energy(energy, weights, p, 5))
+
+def test_same_generations_as_reblocking(generations):
+    energy, weights = generations
+    col = 4
+    result = correcting_factor_analysis(energy, weights, [col], eq=100, reb=8)
+    reference = analyse(energy, weights=weights, eq=100 + col, reb=8)
+    # Without correcting factors the weights of both are the same
+    zero = correcting_factor_analysis(energy, weights, [0], eq=100 + col, reb=8)
+    assert zero["energy"][0] == pytest.approx(reference["energy"], rel=1e-4)
+    assert zero["energy_err"][0] == pytest.approx(reference["energy_err"], rel=1e-2)
+    assert result["reb"] == reference["reb"]
+
+def test_chunks_do_not_change_results(generations):
+    one = correcting_factor_analysis(*generations, 20, reb=10, chunk_size=1)
+    many = correcting_factor_analysis(*generations, 20, reb=10, chunk_size=8)
+    assert np.allclose(one["energy"], many["energy"])
+    assert np.allclose(one["energy_err"], many["energy_err"])
+
+def test_long_products_do_not_overflow(generations):
+    energy, weights = generations
+    result = correcting_factor_analysis(energy, weights * 1e3, [200], reb=10)
+    assert np.isfinite(result["energy"][0])
+    assert np.isfinite(result["energy_err"][0])
+
+def test_not_enough_bins(generations):
+    energy, weights = generations
+    with pytest.raises(ValueError):
+        correcting_factor_analysis(energy[:30], weights[:30], [10], reb=15)
+
+@pytest.mark.parametrize("weight", [0.0, -0.5])
+def test_non_positive_weights(generations, weight):
+    energy, weights = generations
+    weights = weights.copy()
+    weights[100] = weight
+    with pytest.raises(ValueError):
+        correcting_factor_analysis(energy, weights, 3, reb=10)
+    # Generations discarded by eq do not matter
+    result = correcting_factor_analysis(energy, weights, 3, eq=101, reb=10)
+    assert np.all(np.isfinite(result["energy"]))
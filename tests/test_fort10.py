@@ -0,0 +1,32 @@
+"""
+Tests of the fort.10 header
+"""
+import io
+import pytest
+
+from aiida_turborvb.auxiliary.fort10 import read_fort10_header
+
+FORT10 = """ # Nelup  #Nel  # Ion
+           1           2           2
+ # Shell Det.   # Shell Jas.
+           4           2
+ # Ion coordinates
+  1.00000000000000       1.00000000000000       0.000000000000000E+000
+  0.000000000000000E+000 -0.700000000000000
+  1.00000000000000       1.00000000000000       0.000000000000000E+000
+  0.000000000000000E+000  0.700000000000000
+ #  Constraints for forces: ion - coordinate
+           1           1           3
+"""
+
+def test_read_header():
+    header = read_fort10_header(io.StringIO(FORT10))
+    assert header == (1, 2, 2, 4, 2)
+    assert header.nion == 2
+
+def test_read_header_binary():
+    assert read_fort10_header(io.BytesIO(FORT10.encode())).nshell_jas == 2
+
+def test_read_header_incomplete():
+    with pytest.raises(ValueError):
+        read_fort10_header(io.StringIO("\n".join(FORT10.splitlines()[:3])))
@@ -0,0 +1,109 @@
+"""
+Tests of the memory-mapped fort.12 reader
+"""
+import io
+import numpy as np
+import pytest
+
+from aiida_turborvb.auxiliary.fort12 import ( Fort12Reader, read_fort12, get_columns, analyse_fort12 )
+
+def write_records(path, rows):
+    with open(path, "wb") as fhandle:
+        for row in rows:
+            row = np.asarray(row, dtype="<f8")
+            marker = np.int32(row.nbytes).tobytes()
+            fhandle.write(marker + row.tobytes() + marker)
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    return np.stack([rng.uniform(0.9, 1.1, 200), rng.standard_normal(200), rng.uniform(1.0, 2.0, 200)], axis=1)
+
+def test_uniform_records(tmp_path, data):
+    path = tmp_path / "fort.12"
+    write_records(path, data)
+    with Fort12Reader(str(path), kind="lrdmc") as reader:
+        assert reader.uniform
+        assert len(reader) == 200
+        assert reader.ncolumns == 3
+        assert np.array_equal(reader.data, data)
+        assert np.array_equal(reader.column("energy"), data[:, 1])
+        assert sorted(reader.get_columns()) == ["energy", "energy_square", "weight"]
+        chunks = list(reader.iter_chunks(64))
+        assert [ x.shape[0] for x in chunks ] == [64, 64, 64, 8]
+
+def test_truncated_last_record(tmp_path, data):
+    path = tmp_path / "fort.12"
+    write_records(path, data)
+    with open(path, "ab") as fhandle:
+        fhandle.write(np.int32(24).tobytes() + b"\0" * 10)
+    assert np.array_equal(read_fort12(str(path)), data)
+
+def test_non_uniform_records(tmp_path, data):
+    path = tmp_path / "fort.12"
+    rows = [ row for row in data[:10] ] + [ np.append(data[10], 5.0) ] + [ row for row in data[11:20] ]
+    write_records(path, rows)
+    with Fort12Reader(str(path)) as reader:
+        assert not reader.uniform
+        assert len(reader) == 20
+        assert np.array_equal(reader.column("energy"), data[:20, 1])
+        assert len(list(reader.iter_records())) == 20
+
+def test_non_uniform_records_of_uniform_size(tmp_path, data):
+    # A record of 2 and one of 4 columns take as much space as two of 3 columns
+    path = tmp_path / "fort.12"
+    rows = [ row for row in data[:10] ] + [ data[10, :2], np.append(data[11], 5.0) ] + [ row for row in data[12:20] ]
+    write_records(path, rows)
+    with Fort12Reader(str(path)) as reader:
+        assert not reader.uniform
+        assert len(reader) == 20
+        assert reader.complete
+
+def test_complete(tmp_path, data):
+    path = tmp_path / "fort.12"
+    write_records(path, data)
+    with Fort12Reader(str(path)) as reader:
+        assert reader.complete
+    with open(path, "ab") as fhandle:
+        fhandle.write(np.int32(24).tobytes() + b"\0" * 10)
+    with Fort12Reader(str(path)) as reader:
+        assert not reader.complete
+    rows = [ row for row in data[:10] ] + [ np.append(data[10], 5.0) ]
+    write_records(path, rows)
+    with Fort12Reader(str(path)) as reader:
+        assert not reader.uniform and reader.complete
+    # Trailing marker of the last record missing
+    path.write_bytes(path.read_bytes()[:-4])
+    with Fort12Reader(str(path)) as reader:
+        assert not reader.complete
+    path.write_bytes(b"")
+    with Fort12Reader(str(path)) as reader:
+        assert not reader.complete
+
+def test_handle_without_file_descriptor(tmp_path, data):
+    path = tmp_path / "fort.12"
+    write_records(path, data)
+    handle = io.BytesIO(path.read_bytes())
+    with Fort12Reader(handle) as reader:
+        assert np.array_equal(reader.column("weight"), data[:, 0])
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "fort.12"
+    path.write_bytes(b"")
+    with Fort12Reader(str(path)) as reader:
+        assert len(reader) == 0
+        assert reader.get_columns() == {}
+
+def test_get_columns(data):
+    columns = get_columns(data[:, :2], kind="vmc")
+    assert sorted(columns) == ["energy", "weight"]
+
+def test_analyse_fort12(tmp_path, data):
+    path = tmp_path / "fort.12"
+    write_records(path, data)
+    with open(path, "rb") as handle:
+        result = analyse_fort12(handle, kind="lrdmc", reb=10)
+    weights = data[:, 0]
+    assert result["energy"] == pytest.approx(np.sum(weights * data[:, 1]) / np.sum(weights), rel=1e-3)
+    assert result["nbins"] == 20
+    assert "variance" in result
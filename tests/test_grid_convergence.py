@@ -0,0 +1,74 @@
+"""
+Tests of the grid sweep and extrapolation of DFTPrecise
+"""
+import types
+import numpy as np
+import pytest
+
+from aiida_turborvb.workflows.dft_precise_chain import extrapolate_grid, DFTPrecise
+
+def test_exact_quadratic_in_h2():
+    densities = [0.1, 0.095, 0.09, 0.085]
+    energies = [ -10.0 + 3.0 * h**2 - 20.0 * h**4 for h in densities ]
+    e0, error = extrapolate_grid(densities, energies)
+    assert e0 == pytest.approx(-10.0)
+    assert error == pytest.approx(abs(energies[-1] + 10.0))
+
+def test_two_points_are_fitted_linearly():
+    densities = [0.1, 0.095]
+    energies = [ -5.0 + 2.0 * h**2 for h in densities ]
+    e0, error = extrapolate_grid(densities, energies)
+    assert e0 == pytest.approx(-5.0)
+    assert error == pytest.approx(2.0 * 0.095**2)
+
+def test_error_uses_finest_grid_in_any_order():
+    densities = [0.085, 0.1, 0.09]
+    energies = [ -1.0 + h**2 for h in densities ]
+    e0, error = extrapolate_grid(densities, energies, degree=1)
+    assert e0 == pytest.approx(-1.0)
+    assert error == pytest.approx(0.085**2)
+
+def test_converged_energies():
+    e0, error = extrapolate_grid([0.1, 0.09, 0.08], np.full(3, -2.5))
+    assert e0 == pytest.approx(-2.5)
+    assert error == pytest.approx(0.0, abs=1e-10)
+
+class Context(types.SimpleNamespace):
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+def workchain(parameters):
+    """
+    DFTPrecise with the state read by ``setup`` and ``prep``, submissions are recorded
+    """
+    node = types.SimpleNamespace(ctx=Context(),
+                                 inputs=types.SimpleNamespace(parameters=types.SimpleNamespace(get_dict=lambda: parameters)),
+                                 report=lambda message: None,
+                                 submitted=[])
+    node.submit_prep = lambda index, density: node.submitted.append(density)
+    return node
+
+def waves(parameters):
+    node = workchain(parameters)
+    DFTPrecise.setup(node)
+    ret = []
+    while DFTPrecise.is_finished(node):
+        start = len(node.submitted)
+        DFTPrecise.prep(node)
+        DFTPrecise.inspect_prep(node)
+        ret.append(node.submitted[start:])
+    return ret
+
+DENSITIES = [0.1, 0.095, 0.09, 0.085, 0.08]
+
+@pytest.mark.parametrize("parameters, sizes", [
+    ({}, [5]),                                              # all at once
+    ({ "max_concurrent" : 2 }, [2, 2, 1]),
+    ({ "max_concurrent" : 10 }, [5]),
+    ({ "warm_start" : True }, [1, 1, 1, 1, 1]),             # one after another
+    ({ "warm_start" : True, "max_concurrent" : 3 }, [3, 2]),
+])
+def test_waves(parameters, sizes):
+    result = waves(dict(parameters, densities=DENSITIES))
+    assert [ len(x) for x in result ] == sizes
+    assert sum(result, []) == DENSITIES
@@ -0,0 +1,112 @@
+"""
+Tests of the handling of interrupted and stopped QMC jobs
+"""
+import os
+import shutil
+import subprocess
+import numpy as np
+import pytest
+
+from aiida_turborvb.auxiliary.retrieval import ( checkpoint_commands, checkpoint_updated, job_finished, completed_iterations,
+                                                  CHECKPOINT_FILE, FINISHED_MARKER, STOP_FILE )
+
+class Retrieved:
+    """
+    Folder standing in for the ``retrieved`` FolderData
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def list_object_names(self):
+        return sorted(os.listdir(self.path))
+
+    def open(self, name, mode='r'):
+        return open(os.path.join(self.path, name), mode)
+
+needs_md5sum = pytest.mark.skipif(shutil.which("md5sum") is None, reason="md5sum is not available")
+
+def start_job(path):
+    subprocess.run(["bash", "-c", "\n".join(checkpoint_commands())], cwd=path, check=True)
+
+@needs_md5sum
+def test_unchanged_checkpoint(tmp_path):
+    (tmp_path / "fort.11").write_bytes(b"\1" * 100)
+    start_job(tmp_path)
+    assert not checkpoint_updated(Retrieved(tmp_path))
+
+@needs_md5sum
+def test_new_checkpoint(tmp_path):
+    (tmp_path / "fort.11").write_bytes(b"\1" * 100)
+    start_job(tmp_path)
+    (tmp_path / "fort.11").write_bytes(b"\2" * 100)
+    assert checkpoint_updated(Retrieved(tmp_path))
+
+@needs_md5sum
+def test_job_started_without_checkpoint(tmp_path):
+    start_job(tmp_path)
+    assert (tmp_path / CHECKPOINT_FILE).read_text() == ""
+    assert not checkpoint_updated(Retrieved(tmp_path))
+    (tmp_path / "fort.11").write_bytes(b"\1" * 100)
+    assert checkpoint_updated(Retrieved(tmp_path))
+
+def test_checksum_not_retrieved(tmp_path):
+    (tmp_path / "fort.11").write_bytes(b"\1" * 100)
+    assert not checkpoint_updated(Retrieved(tmp_path))
+
+def write_fort12(path, nrecords):
+    with open(path, "wb") as fhandle:
+        for ii in range(nrecords):
+            row = np.array([1.0, -1.0], dtype="<f8")
+            marker = np.int32(row.nbytes).tobytes()
+            fhandle.write(marker + row.tobytes() + marker)
+
+def test_job_finished(tmp_path):
+    (tmp_path / "execute.out").write_text(f"running\n{FINISHED_MARKER}\n")
+    assert job_finished(Retrieved(tmp_path), "execute.out")
+
+def test_job_interrupted(tmp_path):
+    (tmp_path / "execute.out").write_text("running\n")
+    assert not job_finished(Retrieved(tmp_path), "execute.out")
+    assert not job_finished(Retrieved(tmp_path), "missing.out")
+
+def test_stopped_job_is_finished(tmp_path):
+    # Killed after the stop, e.g. at the walltime limit during post-processing
+    (tmp_path / "execute.out").write_text("running\n")
+    (tmp_path / STOP_FILE).write_text("target: -1.0 +- 0.001 after 100 blocks\n")
+    write_fort12(tmp_path / "fort.11", 2)
+    write_fort12(tmp_path / "fort.12", 10)
+    assert job_finished(Retrieved(tmp_path), "execute.out")
+
+def test_stopped_job_with_truncated_files(tmp_path):
+    (tmp_path / "execute.out").write_text(f"running\n{FINISHED_MARKER}\n")
+    (tmp_path / STOP_FILE).write_text("target: -1.0 +- 0.001 after 100 blocks\n")
+    write_fort12(tmp_path / "fort.12", 10)
+    # fort.11 missing
+    assert not job_finished(Retrieved(tmp_path), "execute.out")
+    # fort.11 killed while writing
+    write_fort12(tmp_path / "fort.11", 2)
+    with open(tmp_path / "fort.11", "ab") as fhandle:
+        fhandle.write(np.int32(16).tobytes() + b"\0" * 8)
+    assert not job_finished(Retrieved(tmp_path), "execute.out")
+    # fort.12 in the temporary folder with discard_raw, last record truncated
+    write_fort12(tmp_path / "fort.11", 2)
+    temporary = tmp_path / "temporary"
+    temporary.mkdir()
+    (tmp_path / "fort.12").rename(temporary / "fort.12")
+    assert job_finished(Retrieved(tmp_path), "execute.out", str(temporary))
+    with open(temporary / "fort.12", "ab") as fhandle:
+        fhandle.write(np.int32(16).tobytes() + b"\0" * 20)
+    assert not job_finished(Retrieved(tmp_path), "execute.out", str(temporary))
+
+def test_completed_iterations_from_story(tmp_path):
+    (tmp_path / "story.d").write_text("# header\n" + "".join([ f"{ii} -1.0 0.001\n" for ii in range(7) ]) + "\n")
+    write_fort12(tmp_path / "fort.12", 3)
+    assert completed_iterations(Retrieved(tmp_path)) == 7
+
+def test_completed_iterations_from_fort12(tmp_path):
+    write_fort12(tmp_path / "fort.12", 5)
+    assert completed_iterations(Retrieved(tmp_path)) == 5
+    assert completed_iterations(Retrieved(tmp_path), fort12=False) is None
+
+def test_completed_iterations_unknown(tmp_path):
+    assert completed_iterations(Retrieved(tmp_path)) is None
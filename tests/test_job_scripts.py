@@ -0,0 +1,242 @@
+"""
+Tests of the job scripts written by ``prepare_for_submission`` of the wrapper CalcJobs
+"""
+import io
+import inspect
+import subprocess
+import types
+import numpy as np
+import pytest
+from aiida.common import exceptions
+
+from aiida_turborvb.vmcopt.wrapper.calculation import TurboRVBVmcoptCalculationWRP
+from aiida_turborvb.prep.wrapper.calculation import TurboRVBPrepCalculationWRP
+from aiida_turborvb.vmclrdmc.wrapper.calculation import TurboRVBVmcLrdmcCalculationWRP
+from aiida_turborvb.lrdmc.wrapper.calculation import TurboRVBLrdmcCalculationWRP
+from aiida_turborvb.vmc.wrapper.calculation import TurboRVBVmcCalculationWRP
+from aiida_turborvb.dft.wrapper.calculation import TurboRVBDFTCalculationWRP
+from aiida_turborvb.auxiliary.retrieval import SCRATCH_ARCHIVE
+from aiida_turborvb.auxiliary.submission import stage_inputs
+from aiida_turborvb.mock.synthetic import write_pip0
+
+class Holder(dict):
+    """
+    Inputs and options of a CalcJob, items are attributes too
+    """
+    __getattr__ = dict.__getitem__
+
+class File:
+    def __init__(self, name, text=""):
+        self.uuid = f"uuid-{name}"
+        self.filename = name
+        self.text = text
+
+    def open(self, mode="r"):
+        return io.StringIO(self.text)
+
+class Unreadable(File):
+    """
+    File that must be copied by the engine only
+    """
+    def open(self, mode="r"):
+        raise AssertionError(f"{self.filename} was read by prepare_for_submission")
+
+class Folder:
+    """
+    Sandbox folder of ``prepare_for_submission`` in a temporary directory
+    """
+    def __init__(self, path):
+        self.path = path
+        self.abspath = str(path)
+
+    def open(self, name, mode="r"):
+        return open(self.path / name, mode)
+
+def calc(parameters, **inputs):
+    code = Holder(uuid="uuid-code", get_extra=lambda key, default: default)
+    options = Holder(resources={ "num_machines" : 1, "num_mpiprocs_per_machine" : 4 },
+                     input_filename="execute.sh",
+                     output_filename="execute.out")
+    inputs = Holder(code=code,
+                    parameters=Holder(get_dict=lambda: dict(parameters)),
+                    metadata=Holder(options=options),
+                    **inputs)
+    return Holder(inputs=inputs, options=options)
+
+def prepare(calculation, tmp_path, parameters, **inputs):
+    fake = calc(parameters, **inputs)
+    # Class attributes and helper methods of the CalcJob
+    for key, value in vars(calculation).items():
+        if not key.startswith("__"):
+            fake[key] = types.MethodType(value, fake) if inspect.isfunction(value) else value
+    return calculation.prepare_for_submission(fake, Folder(tmp_path))
+
+def job_script(calculation, tmp_path, parameters, **inputs):
+    prepare(calculation, tmp_path, parameters, **inputs)
+    return (tmp_path / "execute.sh").read_text().splitlines()
+
+TEMPLATE = """&simulation
+    itestr4=-4
+    ngen=1000
+/
+"""
+
+def test_vmcopt_turbo_genius_options(tmp_path):
+    script = job_script(TurboRVBVmcoptCalculationWRP, tmp_path, { "opt" : "jas", "eq" : 10 },
+                        fort10=File("fort.10"))
+    # The values are formatted into the commands
+    assert "turbo-genius.sh -j vmcopt -g --opt jas" in script
+    assert "turbo-genius.sh -j vmcopt -post -am manual -eq 10" in script
+
+def test_vmcopt_template(tmp_path):
+    script = job_script(TurboRVBVmcoptCalculationWRP, tmp_path, { "namelist_update" : { "ngen" : 50 } },
+                        fort10=File("fort.10"), input_template=File("datasmin.input", TEMPLATE))
+    assert not any([ "turbo-genius.sh -j vmcopt -g" in line for line in script ])
+    assert "ngen=50" in (tmp_path / "vmcopt.input").read_text().splitlines()
+
+def test_vmcopt_template_rejects_options(tmp_path):
+    with pytest.raises(exceptions.InputValidationError):
+        job_script(TurboRVBVmcoptCalculationWRP, tmp_path, { "opt" : "jas" },
+                   fort10=File("fort.10"), input_template=File("datasmin.input", TEMPLATE))
+
+def test_vmcopt_rejects_optmethod(tmp_path):
+    with pytest.raises(exceptions.InputValidationError):
+        job_script(TurboRVBVmcoptCalculationWRP, tmp_path, { "optmethod" : "lin" }, fort10=File("fort.10"))
+
+def test_prep_template_rejects_grid(tmp_path):
+    with pytest.raises(exceptions.InputValidationError):
+        job_script(TurboRVBPrepCalculationWRP, tmp_path, { "grid" : 0.1 },
+                   fort10=File("fort.10"), input_template=File("prep.input", TEMPLATE))
+
+def test_prep_turbo_genius_options(tmp_path):
+    script = job_script(TurboRVBPrepCalculationWRP, tmp_path, { "grid" : 0.1, "box" : 10.0 }, fort10=File("fort.10"))
+    assert "turbo-genius.sh -j prep -g -grid 0.1 -box 10.0 10.0 10.0" in script
+
+def test_vmclrdmc_trial_energy(tmp_path):
+    script = job_script(TurboRVBVmcLrdmcCalculationWRP, tmp_path, {}, fort10=File("fort.10"))
+    etry = [ line for line in script if "ETRY" in line ]
+    assert len(etry) == 2
+    # The edit runs between the VMC post-processing and the LRDMC run
+    assert script.index("turbo-genius.sh -j vmc -post -am manual") < script.index(etry[0])
+    assert script.index("cp datasfn.input fn.input") < script.index(etry[0])
+    assert script.index(etry[1]) < min([ ii for ii, line in enumerate(script) if "< fn.input" in line ])
+    # and replaces the commented out or set etry of fn.input by the VMC energy
+    write_pip0(tmp_path / "pip0.d", energy=-17.25, energy_err=0.002)
+    (tmp_path / "fn.input").write_text("&simulation\n    ! etry=0.0\n    ngen=100\n/\n")
+    subprocess.run(["bash", "-c", "\n".join(etry)], cwd=tmp_path, check=True)
+    assert (tmp_path / "fn.input").read_text().splitlines() == ["&simulation", "    etry=-17.25", "    ngen=100", "/"]
+
+def test_vmclrdmc_explicit_trial_energy(tmp_path):
+    script = job_script(TurboRVBVmcLrdmcCalculationWRP, tmp_path, { "namelist_update" : { "etry" : -1.0 } },
+                        fort10=File("fort.10"))
+    assert not any([ "ETRY" in line for line in script ])
+
+def remote(path):
+    return Holder(computer=Holder(uuid="uuid-computer"), get_remote_path=lambda: path)
+
+@pytest.mark.parametrize("symlink", [False, True])
+def test_lrdmc_parent_folder(tmp_path, symlink):
+    calcinfo = prepare(TurboRVBLrdmcCalculationWRP, tmp_path, { "parent_folder_symlink" : symlink },
+                       fort10=File("fort.10"), parent_folder=remote("/scratch/vmc"))
+    entries = calcinfo.remote_symlink_list if symlink else calcinfo.remote_copy_list
+    assert entries == [("uuid-computer", "/scratch/vmc/fort.11", "fort.11"),
+                       ("uuid-computer", "/scratch/vmc/fort.12", "fort.12"),
+                       ("uuid-computer", "/scratch/vmc/turborvb.scratch", "turborvb.scratch")]
+    # Nothing of the parent is uploaded
+    assert calcinfo.local_copy_list == [("uuid-fort.10", "fort.10", "fort.10")]
+
+def test_lrdmc_parent_folder_without_fort12(tmp_path):
+    calcinfo = prepare(TurboRVBLrdmcCalculationWRP, tmp_path, { "parent_folder_fort12" : False },
+                       fort10=File("fort.10"), parent_folder=remote("/scratch/vmc"))
+    assert [ x[2] for x in calcinfo.remote_copy_list ] == ["fort.11", "turborvb.scratch"]
+
+@pytest.mark.parametrize("names", [(), ("fort11", ), ("fort11", "fort12")])
+def test_lrdmc_requires_restart_files(tmp_path, names):
+    # Without parent_folder fort11, fort12 and the scratch are needed
+    inputs = { name : File(name) for name in names }
+    with pytest.raises(exceptions.InputValidationError):
+        prepare(TurboRVBLrdmcCalculationWRP, tmp_path, {}, fort10=File("fort.10"), **inputs)
+
+def test_scratch_archive(tmp_path):
+    packing, unpacking = tmp_path / "vmc", tmp_path / "lrdmc"
+    packing.mkdir()
+    unpacking.mkdir()
+    calcinfo = prepare(TurboRVBVmcCalculationWRP, packing, { "archive_scratch" : True }, fort10=File("fort.10"))
+    # Only the archive is retrieved
+    assert SCRATCH_ARCHIVE in calcinfo.retrieve_list
+    assert "turborvb.scratch" not in calcinfo.retrieve_list
+    pack = [ line for line in (packing / "execute.sh").read_text().splitlines() if line.startswith("tar ") ]
+    assert len(pack) == 1
+
+    calcinfo = prepare(TurboRVBLrdmcCalculationWRP, unpacking, {}, fort10=File("fort.10"), fort11=File("fort.11"),
+                       fort12=File("fort.12"), scratch_archive=File(SCRATCH_ARCHIVE))
+    assert (f"uuid-{SCRATCH_ARCHIVE}", SCRATCH_ARCHIVE, SCRATCH_ARCHIVE) in calcinfo.local_copy_list
+    unpack = [ line for line in (unpacking / "execute.sh").read_text().splitlines() if line.startswith("tar ") ]
+    assert len(unpack) == 1
+
+    # The scratch packed after VMC is extracted before LRDMC
+    (packing / "turborvb.scratch").mkdir()
+    (packing / "turborvb.scratch" / "kelcont.bin").write_bytes(bytes(range(256)))
+    subprocess.run(["bash", "-c", pack[0]], cwd=packing, check=True)
+    (packing / SCRATCH_ARCHIVE).rename(unpacking / SCRATCH_ARCHIVE)
+    subprocess.run(["bash", "-c", unpack[0]], cwd=unpacking, check=True)
+    assert (unpacking / "turborvb.scratch" / "kelcont.bin").read_bytes() == bytes(range(256))
+    assert not (unpacking / SCRATCH_ARCHIVE).exists()
+
+def test_stage_inputs():
+    inputs = Holder(fort10=File("fort.10_new"), pseudo=File("pseudo.dat"))
+    assert stage_inputs(inputs) == [("uuid-fort.10_new", "fort.10_new", "fort.10"),
+                                    ("uuid-pseudo.dat", "pseudo.dat", "pseudo.dat")]
+    # Missing optional inputs are skipped
+    assert stage_inputs(Holder(fort10=File("fort.10"))) == [("uuid-fort.10", "fort.10", "fort.10")]
+    assert stage_inputs(inputs, files=(("pseudo", "pp.dat"), )) == [("uuid-pseudo.dat", "pseudo.dat", "pp.dat")]
+
+@pytest.mark.parametrize("calculation", [TurboRVBVmcCalculationWRP, TurboRVBVmcoptCalculationWRP])
+def test_wavefunction_staged(tmp_path, calculation):
+    calcinfo = prepare(calculation, tmp_path, {}, fort10=Unreadable("fort.10"), pseudo=Unreadable("pseudo.dat"))
+    assert calcinfo.local_copy_list == [("uuid-fort.10", "fort.10", "fort.10"),
+                                        ("uuid-pseudo.dat", "pseudo.dat", "pseudo.dat")]
+    # Nothing is written to the sandbox
+    assert sorted([ x.name for x in tmp_path.iterdir() ]) == ["execute.sh"]
+
+class Atoms:
+    """
+    ASE structure of a hydrogen molecule
+    """
+    def get_positions(self):
+        return np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.74]])
+
+    def write(self, fhandle):
+        fhandle.write("2\n\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n")
+
+def position(script, command):
+    return min([ ii for ii, line in enumerate(script) if command in line ])
+
+def test_dft_job_script(tmp_path):
+    parameters = { "basis" : "cc-pVDZ", "pseudo" : "ccECP", "grid" : 0.1 }
+    calcinfo = prepare(TurboRVBDFTCalculationWRP, tmp_path, parameters, structure=Holder(get_ase=Atoms))
+    script = (tmp_path / "execute.sh").read_text().splitlines()
+    makefort10 = script[position(script, "-j makefort10")].split()
+    assert ["-str", "structure.xyz"] == makefort10[makefort10.index("-str"):][:2]
+    assert ["-basis", "cc-pVDZ"] == makefort10[makefort10.index("-basis"):][:2]
+    assert ["-pp", "ccECP"] == makefort10[makefort10.index("-pp"):][:2]
+    assert (tmp_path / "structure.xyz").exists()
+    # All steps run one after another in the same directory
+    steps = [ position(script, x) for x in ("makefort10.x", "assembling_pseudo.x", "convertfort10mol.x", "prep-mpi.x") ]
+    assert steps == sorted(steps)
+    box = (np.array([0.0, 0.0, 0.74]) + 15) * 1.8897259886
+    assert f"turbo-genius.sh -j prep -g -grid 0.1 -box {box[0]} {box[1]} {box[2]}" in script
+    # Only the prep results and the assembled pseudo potential are retrieved
+    assert sorted(calcinfo.retrieve_list) == sorted(["fort.10_new", "occupationlevels.dat", "prep.output",
+                                                     "execute.out", "pseudo.dat"])
+    assert calcinfo.local_copy_list == []
+
+def test_dft_pseudo_input(tmp_path):
+    parameters = { "pseudo" : "ccECP", "box" : 20.0 }
+    calcinfo = prepare(TurboRVBDFTCalculationWRP, tmp_path, parameters, structure=Holder(get_ase=Atoms),
+                       pseudo=File("pseudo.dat"))
+    script = (tmp_path / "execute.sh").read_text().splitlines()
+    assert not any([ "assembling_pseudo.x" in line for line in script ])
+    assert "turbo-genius.sh -j prep -g -box 20.0 20.0 20.0" in script
+    assert calcinfo.local_copy_list == [("uuid-pseudo.dat", "pseudo.dat", "pseudo.dat")]
+    assert "pseudo.dat" not in calcinfo.retrieve_list
@@ -0,0 +1,72 @@
+"""
+Tests of the MPI launcher commands of the job scripts
+"""
+import pytest
+
+from aiida_turborvb.auxiliary.launcher import launcher_settings, concurrent_settings, environment_commands, launch_command
+
+class Holder:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def calc(parameters=None, extra=None, resources=None):
+    """
+    CalcJob with the inputs read by ``launcher_settings``
+    """
+    code = Holder(get_extra=lambda key, default: extra if extra is not None else default)
+    pars = Holder(get_dict=lambda: dict(parameters or {}))
+    metadata = { "options" : { "resources" : resources or { "num_machines" : 1, "num_mpiprocs_per_machine" : 4 } } }
+    return Holder(inputs=Holder(code=code, parameters=pars, metadata=metadata))
+
+def test_defaults():
+    settings = launcher_settings(calc())
+    assert settings["command"] == "mpirun"
+    assert settings["threads"] == 1
+    assert environment_commands(settings) == []
+    assert launch_command(settings, 4, "turborvb-mpi.x < vmc.input > vmc.output") == \
+        "mpirun -np 4 turborvb-mpi.x < vmc.input > vmc.output"
+
+def test_hybrid_mpirun():
+    settings = launcher_settings(calc(resources={ "num_machines" : 1, "num_mpiprocs_per_machine" : 4,
+                                                  "num_cores_per_mpiproc" : 8 }))
+    assert settings["threads"] == 8
+    assert environment_commands(settings) == ["export OMP_NUM_THREADS=8",
+                                              "export OMP_PLACES=cores",
+                                              "export OMP_PROC_BIND=close"]
+    assert launch_command(settings, 4, "prep-mpi.x") == "mpirun -np 4 --map-by slot:PE=8 prep-mpi.x"
+
+def test_srun_from_code_extra():
+    extra = { "command" : "srun", "bind" : "cores" }
+    settings = launcher_settings(calc(parameters={ "launcher" : { "threads" : 2, "flags" : "--exact" } }, extra=extra))
+    assert launch_command(settings, 16, "turborvb-mpi.x") == \
+        "srun -n 16 --cpus-per-task=2 --cpu-bind=cores --exact turborvb-mpi.x"
+
+def test_parameters_override_code_extra():
+    settings = launcher_settings(calc(parameters={ "launcher" : { "command" : "mpiexec" } },
+                                      extra={ "command" : "srun" }))
+    # Unknown launchers take the flags of mpirun
+    assert launch_command(settings, 2, "a.x") == "mpiexec -np 2 a.x"
+
+def test_environment_overrides():
+    settings = launcher_settings(calc(parameters={ "launcher" : { "threads" : 2,
+                                                                  "environment" : { "OMP_PLACES" : "threads",
+                                                                                    "I_MPI_PIN" : 1 } } }))
+    commands = environment_commands(settings)
+    assert "export OMP_PLACES=threads" in commands
+    assert "export I_MPI_PIN=1" in commands
+    assert "export OMP_PLACES=cores" not in commands
+
+@pytest.mark.parametrize("command,flag", [("mpirun", "--hostfile $HOSTFILE"),
+                                          ("srun", "--nodelist=$(sort -u $HOSTFILE | paste -sd, -)")])
+def test_hostfile(command, flag):
+    settings = launcher_settings(calc(parameters={ "launcher" : { "command" : command } }))
+    assert flag in launch_command(settings, 2, "a.x", hostfile="$HOSTFILE")
+
+@pytest.mark.parametrize("launcher,expected", [({ "command" : "mpirun" }, "mpirun -np 2 --bind-to none a.x"),
+                                               ({ "command" : "mpirun", "bind" : "cores" }, "mpirun -np 2 --bind-to cores a.x"),
+                                               ({ "command" : "srun" }, "srun -n 2 --exact a.x"),
+                                               ({ "command" : "srun", "flags" : "--mem=0" }, "srun -n 2 --exact --mem=0 a.x"),
+                                               ({ "command" : "srun", "flags" : "--exclusive" }, "srun -n 2 --exclusive a.x")])
+def test_concurrent(launcher, expected):
+    settings = concurrent_settings(launcher_settings(calc(parameters={ "launcher" : launcher })))
+    assert launch_command(settings, 2, "a.x") == expected
@@ -0,0 +1,157 @@
+"""
+Tests of the target_error monitor and of stopping the job script
+"""
+import os
+import shutil
+import subprocess
+import time
+import numpy as np
+import pytest
+
+from aiida_turborvb.auxiliary.retrieval import stoppable_command, STOP_FILE
+from aiida_turborvb.calc import monitors
+from aiida_turborvb.calc.monitors import target_error, stop_reason, check_target_error, fetch_fort12
+
+class Node:
+    process_type = "aiida.calculations:turborvb.vmcwrp"
+
+    def __init__(self, path):
+        self.path = path
+        self.uuid = os.path.basename(str(path))
+
+    def get_remote_workdir(self):
+        return str(self.path)
+
+class Transport:
+    """
+    Local file system standing in for the transport of the computer
+    """
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def __init__(self):
+        self.copied = 0
+
+    def get_attribute(self, path):
+        return os.stat(path)
+
+    def exec_command_wait(self, command):
+        process = subprocess.run(["bash", "-c", command], capture_output=True, text=True)
+        return process.returncode, process.stdout, process.stderr
+
+    def getfile(self, remote, local):
+        self.copied += os.path.getsize(remote)
+        shutil.copy(remote, local)
+
+    def putfile(self, local, remote):
+        shutil.copy(local, remote)
+
+    def remove(self, path):
+        os.remove(path)
+
+def write_fort12(path, energy):
+    with open(path, "wb") as fhandle:
+        for value in energy:
+            row = np.array([1.0, value], dtype="<f8")
+            marker = np.int32(row.nbytes).tobytes()
+            fhandle.write(marker + row.tobytes() + marker)
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setattr(monitors, "CACHE_DIR", str(path))
+    return path
+
+@pytest.fixture
+def energy():
+    return -1.0 + 0.01 * np.random.default_rng(0).standard_normal(400)
+
+def test_continue_above_target(tmp_path, energy):
+    write_fort12(tmp_path / "fort.12", energy)
+    assert target_error(Node(tmp_path), Transport(), target_error=1e-5, reb=10) is None
+    assert not (tmp_path / STOP_FILE).exists()
+
+def test_stop_on_target(tmp_path, energy):
+    write_fort12(tmp_path / "fort.12", energy)
+    assert target_error(Node(tmp_path), Transport(), target_error=1e-2, reb=10) is None
+    assert (tmp_path / STOP_FILE).read_text().startswith("target")
+
+def test_stop_on_drift(tmp_path, energy):
+    energy[200:] += 0.1
+    write_fort12(tmp_path / "fort.12", energy)
+    reason = stop_reason(Node(tmp_path), Transport(), target_error=1e-5, reb=10, max_drift=5.0)
+    assert reason.startswith("drift")
+
+def test_not_enough_blocks(tmp_path, energy):
+    write_fort12(tmp_path / "fort.12", energy[:10])
+    assert stop_reason(Node(tmp_path), Transport(), target_error=1.0) is None
+
+def test_no_fort12(tmp_path):
+    assert stop_reason(Node(tmp_path), Transport(), target_error=1.0) is None
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash is not available")
+def test_stoppable_command(tmp_path):
+    script = stoppable_command("sleep 30", interval=0.1) + "\necho finished > done"
+    process = subprocess.Popen(["bash", "-c", script], cwd=tmp_path)
+    time.sleep(0.5)
+    assert process.poll() is None
+    (tmp_path / STOP_FILE).write_text("target\n")
+    assert process.wait(timeout=10) == 0
+    assert (tmp_path / "done").read_text() == "finished\n"
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash is not available")
+def test_stoppable_command_stops_after_block(tmp_path):
+    (tmp_path / "fort.12").write_bytes(b"\0" * 8)
+    script = stoppable_command("sleep 30", interval=0.1) + "\necho finished > done"
+    process = subprocess.Popen(["bash", "-c", script], cwd=tmp_path)
+    (tmp_path / STOP_FILE).write_text("target\n")
+    time.sleep(1.0)
+    # Waits for the next block
+    assert process.poll() is None
+    with open(tmp_path / "fort.12", "ab") as fhandle:
+        fhandle.write(b"\0" * 8)
+    assert process.wait(timeout=10) == 0
+    assert (tmp_path / "done").read_text() == "finished\n"
+
+needs_tail = pytest.mark.skipif(shutil.which("tail") is None or shutil.which("bash") is None,
+                                reason="tail is not available")
+
+@needs_tail
+def test_fetch_only_new_blocks(tmp_path, energy):
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    node, transport = Node(workdir), Transport()
+    assert fetch_fort12(node, transport) is None
+    write_fort12(workdir / "fort.12", energy[:100])
+    size = (workdir / "fort.12").stat().st_size
+    local = fetch_fort12(node, transport)
+    assert transport.copied == size
+    write_fort12(workdir / "fort.12", energy[:150])
+    assert fetch_fort12(node, transport) == local
+    assert transport.copied == (workdir / "fort.12").stat().st_size
+    with open(local, "rb") as handle:
+        assert handle.read() == (workdir / "fort.12").read_bytes()
+    assert not (workdir / monitors.PART_FILE).exists()
+    # Unchanged file, nothing is copied
+    fetch_fort12(node, transport)
+    assert transport.copied == (workdir / "fort.12").stat().st_size
+    # Written again from the start
+    write_fort12(workdir / "fort.12", energy[:10])
+    with open(fetch_fort12(node, transport), "rb") as handle:
+        assert handle.read() == (workdir / "fort.12").read_bytes()
+
+@needs_tail
+def test_already_stopping(tmp_path, energy, cache_dir):
+    write_fort12(tmp_path / "fort.12", energy)
+    (tmp_path / STOP_FILE).write_text("by hand\n")
+    assert check_target_error(Node(tmp_path), Transport(), target_error=1e-2, reb=10) is None
+    assert (tmp_path / STOP_FILE).read_text() == "by hand\n"
+
+@needs_tail
+def test_check_target_error(tmp_path, energy, cache_dir):
+    write_fort12(tmp_path / "fort.12", energy)
+    reason = check_target_error(Node(tmp_path), Transport(), target_error=1e-2, reb=10)
+    assert reason.startswith("target")
+    assert (tmp_path / STOP_FILE).read_text() == reason + "\n"
+    # The local copy is removed once the run is stopping
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,61 @@
+"""
+Tests of the namelist holder used by the stand-alone makefort10
+"""
+import io
+import pytest
+
+from aiida_turborvb.auxiliary.namelist_holder import ( NamelistHolder, fortran_value )
+
+@pytest.fixture
+def template():
+    namelist = NamelistHolder("system")
+    namelist.add_value("posunits", str, "bohr")
+    namelist.add_value("natoms", int, 1)
+    namelist.add_value("complexfort10", bool, False, hidden=True)
+    return namelist.freeze()
+
+def test_fortran_value():
+    assert fortran_value(True) == ".TRUE."
+    assert fortran_value(False) == ".FALSE."
+    assert fortran_value(1.5) == "1.5"
+
+def test_frozen_template(template):
+    with pytest.raises(TypeError):
+        template.update("natoms", 2)
+    with pytest.raises(TypeError):
+        template.add_value("nel", int, 2)
+
+def test_clone_is_independent(template):
+    first = template.clone()
+    second = template.clone()
+    first.update("natoms", 4)
+    assert second.values["natoms"]["value"] == 1
+    assert template.values["natoms"]["value"] == 1
+
+def test_update_checks_key_and_type(template):
+    namelist = template.clone()
+    with pytest.raises(KeyError):
+        namelist.update("missing", 1)
+    with pytest.raises(TypeError):
+        namelist.update("natoms", "2")
+
+def test_update_many(template):
+    namelist = template.clone()
+    namelist.update_many({"natoms": 3, "missing": 1}, ignore_missing=True)
+    assert namelist.values["natoms"]["value"] == 3
+    with pytest.raises(KeyError):
+        namelist.update_many({"missing": 1})
+
+def test_dump(template):
+    namelist = template.clone()
+    handle = io.StringIO()
+    namelist.dump(handle)
+    assert handle.getvalue().splitlines() == ["&system",
+                                              "  posunits = 'bohr'",
+                                              "  natoms = 1",
+                                              " !complexfort10 = .FALSE.",
+                                              "/"]
+    namelist.update("complexfort10", True)
+    handle = io.StringIO()
+    namelist.dump(handle)
+    assert "  complexfort10 = .TRUE." in handle.getvalue().splitlines()
@@ -0,0 +1,62 @@
+"""
+Tests of the in-process rendering of namelist inputs
+"""
+import shutil
+import subprocess
+import pytest
+
+from aiida_turborvb.auxiliary.namelist_template import ( NamelistTemplate, sed_command )
+
+TEMPLATE = """&simulation
+    itestr4=-4
+    ngen=1000
+    !nw=1
+/
+&pseudo
+/
+&readio
+    iread=0
+/
+"""
+
+PREP_TEMPLATE = """&dft
+    maxit=50
+/
+2 2 2 0 0
+"""
+
+def test_get_keys():
+    assert NamelistTemplate(TEMPLATE).get_keys() == ["itestr4", "ngen", "nw", "iread"]
+
+def test_render_updates_and_uncomments():
+    text = NamelistTemplate(TEMPLATE).render({"ngen": 5000, "nw": 64, "missing": 1})
+    lines = text.splitlines()
+    assert "ngen=5000" in lines
+    assert "nw=64" in lines
+    assert "missing" not in text
+    assert "    itestr4=-4" in lines
+
+def test_render_fortran_logicals():
+    text = NamelistTemplate(TEMPLATE).render({"iread": True})
+    assert "iread=.TRUE." in text.splitlines()
+
+def test_render_occupations():
+    text = NamelistTemplate(PREP_TEMPLATE).render(occupations=[2, 2, 0])
+    assert "2 2 0" in text.splitlines()
+
+def test_template_is_not_modified():
+    template = NamelistTemplate(TEMPLATE)
+    template.render({"ngen": 1})
+    assert template.render() == TEMPLATE
+
+def test_sed_command_without_updates():
+    assert sed_command("vmc.input") is None
+
+@pytest.mark.skipif(shutil.which("sed") is None, reason="sed is not available")
+def test_sed_command_matches_render(tmp_path):
+    updates = {"ngen": 5000, "nw": 64, "iread": False}
+    path = tmp_path / "vmc.input"
+    path.write_text(TEMPLATE)
+    subprocess.run(sed_command(path.name, updates), shell=True, cwd=tmp_path, check=True)
+    rendered = NamelistTemplate(TEMPLATE).render(updates)
+    assert [ x.strip() for x in path.read_text().splitlines() ] == [ x.strip() for x in rendered.splitlines() ]
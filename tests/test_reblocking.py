@@ -0,0 +1,101 @@
+"""
+Tests of the native reblocking of fort.12
+"""
+import numpy as np
+import pytest
+
+from aiida_turborvb.auxiliary.reblocking import ( block_sizes_for, bin_data, reblock, find_plateau,
+                                                  jackknife, jackknife_error, analyse )
+
+def correlated_series(nblocks, correlation=0.9, seed=0):
+    """
+    AR(1) series with unit variance of the increments
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal(nblocks)
+    ret = np.zeros(nblocks)
+    for ii in range(1, nblocks):
+        ret[ii] = correlation * ret[ii - 1] + noise[ii]
+    return ret
+
+def test_block_sizes_for():
+    assert block_sizes_for(16).tolist() == [1, 2, 4, 8]
+    assert block_sizes_for(17).tolist() == [1, 2, 4, 8]
+    assert block_sizes_for(1).tolist() == []
+
+def test_bin_data_discards_beginning():
+    data = np.arange(10.0)
+    bins, weights = bin_data(data, 3)
+    assert bins.tolist() == [2.0, 5.0, 8.0]
+    assert weights.tolist() == [3.0, 3.0, 3.0]
+
+def test_bin_data_weighted_columns():
+    data = np.array([[1.0, 10.0], [3.0, 30.0], [5.0, 50.0], [7.0, 70.0]])
+    weights = np.array([1.0, 3.0, 1.0, 1.0])
+    bins, bin_weights = bin_data(data, 2, weights)
+    assert np.allclose(bins, [[2.5, 25.0], [6.0, 60.0]])
+    assert bin_weights.tolist() == [4.0, 2.0]
+
+def test_reblock_matches_explicit_binning():
+    rng = np.random.default_rng(1)
+    data = rng.standard_normal(1000)
+    weights = rng.uniform(0.5, 1.5, 1000)
+    stats = reblock(data, weights)
+    mean = np.sum(data * weights) / np.sum(weights)
+    assert np.allclose(stats["mean"], mean)
+    for size, nbins, error in zip(stats["block_size"], stats["nbins"], stats["error"]):
+        bins, bin_weights = bin_data(data, size, weights)
+        assert bins.shape[0] == nbins
+        expected = np.sqrt(np.sum(bin_weights * (bins - mean)**2) / np.sum(bin_weights) / (nbins - 1))
+        assert error == pytest.approx(expected)
+
+def test_find_plateau():
+    # Without correlation the criterion reduces to B**3 > 2 * N
+    data = np.random.default_rng(2).standard_normal(2**14)
+    stats = reblock(data)
+    uncorrelated = stats["block_size"][find_plateau(stats, data.shape[0])]
+    assert uncorrelated in (32, 64)
+    data = correlated_series(2**14)
+    stats = reblock(data)
+    assert stats["block_size"][find_plateau(stats, data.shape[0])] > uncorrelated
+
+def test_find_plateau_zero_error():
+    assert find_plateau(reblock(np.ones(64))) == 0
+
+def test_jackknife():
+    values = np.array([1.0, 2.0, 3.0, 6.0])
+    weights = np.ones(4)
+    jk = jackknife(values, weights)
+    assert jk.tolist() == [11.0 / 3.0, 10.0 / 3.0, 3.0, 2.0]
+    mean, error = jackknife_error(jk)
+    assert mean == pytest.approx(3.0)
+    # For the mean, the jackknife error is the standard error of the mean
+    assert error == pytest.approx(np.std(values, ddof=1) / 2.0)
+
+def test_analyse_uncorrelated():
+    rng = np.random.default_rng(3)
+    energy = -1.0 + 0.1 * rng.standard_normal(10000)
+    result = analyse(energy, energy_square=energy**2 + 0.25)
+    assert result["energy"] == pytest.approx(-1.0, abs=5 * 0.1 / 100.0)
+    assert result["energy_err"] == pytest.approx(0.1 / 100.0, rel=0.2)
+    assert result["variance"] == pytest.approx(0.25 + 0.01, rel=0.05)
+    assert result["nbins"] * result["reb"] <= energy.shape[0]
+
+def test_analyse_correlated_error_is_larger():
+    energy = correlated_series(2**14)
+    naive = np.std(energy) / np.sqrt(energy.shape[0])
+    result = analyse(energy)
+    assert result["energy_err"] > 3 * naive
+
+def test_analyse_eq_and_reb():
+    energy = np.concatenate((np.full(100, 10.0), np.random.default_rng(4).standard_normal(1000)))
+    result = analyse(energy, eq=100, reb=10)
+    assert result["eq"] == 100
+    assert result["reb"] == 10
+    assert result["nbins"] == 100
+    assert abs(result["energy"]) < 0.2
+
+@pytest.mark.parametrize("nblocks,eq,reb", [(10, 9, None), (10, 0, 6), (100, 60, 30)])
+def test_analyse_not_enough_blocks(nblocks, eq, reb):
+    with pytest.raises(ValueError):
+        analyse(np.zeros(nblocks), eq=eq, reb=reb)
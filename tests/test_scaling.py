@@ -0,0 +1,47 @@
+"""
+Tests of the scaling table and of the timing of the QMC runs
+"""
+import os
+import shutil
+import subprocess
+import pytest
+
+from aiida_turborvb.auxiliary.retrieval import timed_commands, read_walltime, WALLTIME_FILE
+from aiida_turborvb.workflows.scaling_chain import scaling_table, COLUMNS
+
+class Retrieved:
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, name, mode='r'):
+        return open(os.path.join(self.path, name), mode)
+
+def row(cores, wall_time, energy_err, walkers=32, ngen=1000):
+    return { "pk" : 1, "num_machines" : 1, "num_mpiprocs_per_machine" : cores, "threads" : 1,
+             "cores" : cores, "walkers" : walkers, "ngen" : ngen,
+             "wall_time" : wall_time, "energy_err" : energy_err }
+
+def test_scaling_table():
+    table = scaling_table([row(8, 100.0, 0.002), row(16, 60.0, 0.002)])
+    assert sorted(table) == sorted(COLUMNS)
+    assert table["samples_per_second"] == pytest.approx([320.0, 1000 * 32 / 60.0])
+    assert table["efficiency"] == pytest.approx([1.0, (32000 / 60.0 / 16) / 40.0])
+    assert table["core_hours_variance"][0] == pytest.approx(8 * 100.0 / 3600.0 * 0.002**2)
+
+def test_failed_runs():
+    table = scaling_table([row(8, None, None), row(16, 50.0, 0.001), row(32, 30.0, None)])
+    assert table["efficiency"][0] is None
+    # The first successful run is the reference
+    assert table["efficiency"][1] == pytest.approx(1.0)
+    assert table["samples_per_second"][2] is None
+    assert table["cores"] == [8, 16, 32]
+
+@pytest.mark.skipif(shutil.which("bash") is None or shutil.which("awk") is None, reason="bash or awk is not available")
+def test_timed_commands(tmp_path):
+    script = timed_commands("sleep 0.2") + timed_commands("sleep 0.1")
+    subprocess.run(["bash", "-c", "\n".join(script)], cwd=tmp_path, check=True)
+    assert len((tmp_path / WALLTIME_FILE).read_text().split()) == 2
+    assert 0.3 <= read_walltime(Retrieved(tmp_path)) < 5.0
+
+def test_walltime_not_retrieved(tmp_path):
+    assert read_walltime(Retrieved(tmp_path)) is None
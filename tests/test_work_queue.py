@@ -0,0 +1,43 @@
+"""
+Tests of the work queue of packed calculations
+"""
+import shutil
+import subprocess
+import pytest
+
+from aiida_turborvb.auxiliary.launcher import hosts_commands, work_queue_commands
+
+pytestmark = pytest.mark.skipif(shutil.which("bash") is None, reason="bash is not available")
+
+def run_queue(path, ntasks, slots, procs_per_task, nodes):
+    hosts = path / "nodefile"
+    hosts.write_text("".join([ f"node{ii // 4}\n" for ii in range(4 * nodes) ]))
+    for ii in range(ntasks):
+        task = path / f"task_{ii}"
+        task.mkdir()
+        # Every task records its hosts and keeps its slot busy for a moment
+        (task / "run.sh").write_text("cp $HOSTFILE hosts.used\nsleep 0.05\n")
+    script = hosts_commands(nodes, 4) + work_queue_commands("run.sh", slots, procs_per_task)
+    (path / "execute.sh").write_text("\n".join(script) + "\n")
+    env = { "PATH" : "/usr/bin:/bin", "PBS_NODEFILE" : str(hosts) }
+    subprocess.run(["bash", "execute.sh"], cwd=path, env=env, check=True)
+
+def test_slots_have_own_hosts(tmp_path):
+    run_queue(tmp_path, 2, 2, 4, 2)
+    assert (tmp_path / "hostfile_0").read_text() == "node0\n" * 4
+    assert (tmp_path / "hostfile_1").read_text() == "node1\n" * 4
+
+def test_every_task_runs_once(tmp_path):
+    run_queue(tmp_path, 7, 4, 2, 2)
+    used = [ (tmp_path / f"task_{ii}" / "hosts.used").read_text() for ii in range(7) ]
+    slots = [ (tmp_path / f"hostfile_{ii}").read_text() for ii in range(4) ]
+    # Slots do not share hosts
+    assert [ x.count("\n") for x in slots ] == [2, 2, 2, 2]
+    assert slots == ["node0\n" * 2, "node0\n" * 2, "node1\n" * 2, "node1\n" * 2]
+    assert all([ x in slots for x in used ])
+    assert all([ (tmp_path / f"task_{ii}" / ".claimed").is_dir() for ii in range(7) ])
+
+def test_local_hosts_without_scheduler(tmp_path):
+    script = hosts_commands(1, 3)
+    subprocess.run(["bash", "-c", "\n".join(script)], cwd=tmp_path, env={ "PATH" : "/usr/bin:/bin" }, check=True)
+    assert len((tmp_path / "hosts").read_text().split()) == 3